@@ -0,0 +1,373 @@
+import asyncio
+import logging
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+
+from config import LLM_MAX_WORKERS, ROUTE_CONCURRENCY_LIMITS
+from agents import get_agent, run_agent_task, build_task_messages
+from llm_providers import astream_chat
+from response_cache import ResponseKey, response_cache
+from context_builder import count_tokens
+from tracing import AgentTrace
+from structured_output import generate_structured, schema_instructions, validate_output
+from cancellation import (
+    CancelToken, DeadlineExceeded, RequestCancelled, activate, await_within, check_deadline, request_deadline
+)
+
+logger = logging.getLogger(__name__)
+
+# Agent tasks block on the LLM, so they run here instead of on the event loop
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="agent")
+
+_route_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+class _Flight:
+    """An agent task in progress, shared by every request that asks for it"""
+    def __init__(self, task: asyncio.Task, token: CancelToken):
+        self.task = task
+        self.token = token
+        self.waiters = 0
+
+# Identical agent tasks currently running
+_in_flight: Dict[Tuple, _Flight] = {}
+
+def get_route_semaphore(route: Optional[str]) -> asyncio.Semaphore:
+    """Get the semaphore limiting concurrent agent calls for a route"""
+    route = route or "default"
+    semaphore = _route_semaphores.get(route)
+    if semaphore is None:
+        limit = ROUTE_CONCURRENCY_LIMITS.get(route, ROUTE_CONCURRENCY_LIMITS["default"])
+        semaphore = _route_semaphores[route] = asyncio.Semaphore(limit)
+    return semaphore
+
+def _token_usage(agent) -> Tuple[int, int]:
+    """Prompt and completion tokens the agent has used so far, as reported by the provider"""
+    token_process = getattr(agent, "_token_process", None)
+    if token_process is None:
+        return 0, 0
+    summary = token_process.get_summary()
+    return summary.prompt_tokens, summary.completion_tokens
+
+def _trace_status(error: BaseException) -> str:
+    if isinstance(error, DeadlineExceeded):
+        return "deadline"
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit, RequestCancelled)):
+        return "cancelled"
+    return "error"
+
+def _execute(role: str, task_factory: Callable, args: tuple, kwargs: dict, trace: AgentTrace, token: CancelToken) -> str:
+    # The task may have been abandoned while it waited for a worker
+    token.check()
+
+    # Agents come from the registry of the worker thread that runs the task
+    agent = get_agent(role)
+    task = task_factory(agent, *args, **kwargs)
+    trace.preview("prompt_preview", task.description)
+
+    prompt_before, completion_before = _token_usage(agent)
+    with activate(token):
+        result = run_agent_task(agent, task)
+    prompt_after, completion_after = _token_usage(agent)
+
+    if prompt_after > prompt_before:
+        trace.set(prompt_tokens=prompt_after - prompt_before, completion_tokens=completion_after - completion_before)
+    else:
+        # The provider reported no usage, estimate from the task and its output
+        trace.set(prompt_tokens=count_tokens(task.description), completion_tokens=count_tokens(result),
+                  tokens_estimated=True)
+    trace.preview("output_preview", result)
+    return result
+
+def _execute_structured(
+    role: str, task_factory: Callable, args: tuple, kwargs: dict, trace: AgentTrace, token: CancelToken, artifact: str
+) -> str:
+    token.check()
+
+    # The task only supplies the prompt: a single JSON answer needs no agent loop
+    agent = get_agent(role)
+    messages = build_task_messages(agent, task_factory(agent, *args, **kwargs))
+    messages[-1]["content"] += "\n\n" + schema_instructions(artifact)
+    trace.preview("prompt_preview", messages[-1]["content"])
+
+    with activate(token):
+        result = generate_structured(messages, artifact)
+    output = result.output.model_dump_json()
+
+    trace.set(structured=artifact, repairs=result.repairs)
+    if result.prompt_tokens:
+        trace.set(prompt_tokens=result.prompt_tokens, completion_tokens=result.completion_tokens)
+    else:
+        trace.set(prompt_tokens=sum(count_tokens(message["content"]) for message in messages),
+                  completion_tokens=count_tokens(output), tokens_estimated=True)
+    trace.preview("output_preview", output)
+    return output
+
+def _structured_key(cache_key: Optional[ResponseKey], artifact: Optional[str]) -> Optional[ResponseKey]:
+    # JSON and free-text answers to the same task are cached apart
+    if cache_key is None or artifact is None:
+        return cache_key
+    return dataclasses.replace(cache_key, options={**cache_key.options, "output": "json"})
+
+def _flight_key(role: str, task_factory: Callable, args: tuple, kwargs: dict, artifact: Optional[str]) -> Tuple:
+    # Task inputs are plain strings and numbers, so their repr identifies the prompt
+    return (role, task_factory.__module__, task_factory.__qualname__, repr(args), repr(sorted(kwargs.items())),
+            artifact)
+
+async def _run_task(
+    role, task_factory, args, kwargs, route, cache_key, trace: AgentTrace, token: CancelToken, artifact: Optional[str]
+) -> str:
+    semaphore = get_route_semaphore(route)
+    if semaphore.locked():
+        logger.info(f"Concurrency limit reached for route {route or 'default'}, waiting for a slot")
+
+    try:
+        async with semaphore:
+            trace.mark("queue_ms")
+            loop = asyncio.get_running_loop()
+            if artifact is None:
+                result = await loop.run_in_executor(_executor, _execute, role, task_factory, args, kwargs, trace, token)
+            else:
+                result = await loop.run_in_executor(
+                    _executor, _execute_structured, role, task_factory, args, kwargs, trace, token, artifact
+                )
+    except BaseException as e:
+        trace.finish(_trace_status(token.reason or e), token.reason or e)
+        raise
+
+    if cache_key is not None:
+        await response_cache.set(cache_key, result)
+    trace.finish()
+    return result
+
+def _finish_flight(key: Tuple, flight: _Flight):
+    if _in_flight.get(key) is flight:
+        del _in_flight[key]
+    # Retrieve the exception so it isn't reported as unhandled when every waiter has gone
+    if not flight.task.cancelled():
+        flight.task.exception()
+
+def _leave_flight(flight: _Flight, error: Optional[BaseException]):
+    flight.waiters -= 1
+    if flight.waiters == 0 and not flight.task.done():
+        # Nobody wants the result any more: stop the agent before it spends more LLM calls
+        reason = error if isinstance(error, (DeadlineExceeded, RequestCancelled)) else RequestCancelled()
+        logger.info(f"Cancelling agent task, no request is waiting for it ({type(reason).__name__})")
+        flight.token.cancel(reason)
+        flight.task.cancel()
+
+async def run_agent_task_async(
+    role: str,
+    task_factory: Callable,
+    *args,
+    route: Optional[str] = None,
+    cache_key: Optional[ResponseKey] = None,
+    deadline: Optional[float] = None,
+    request: Optional[Request] = None,
+    structured_output: Optional[str] = None,
+    **kwargs
+) -> str:
+    """
+    Run an agent task without blocking the event loop.
+
+    The task is built and executed on the agent thread pool. At most the
+    route's configured number of calls run at once; further requests wait
+    for a free slot. Concurrent calls for an identical task share a single
+    execution, and all of them receive its result.
+
+    A request stops waiting when its deadline passes or its client
+    disconnects. Once no request is waiting for the task any more, it is
+    cancelled: a task still queued never runs, and a running agent is
+    stopped before its next LLM call.
+
+    With structured_output set, the task's prompt is sent straight to the
+    LLM asking for that artifact as JSON (see structured_output), and the
+    validated JSON is returned instead of the agent's free-text answer.
+
+    Args:
+        role: Registry role of the agent, e.g. "note_taker"
+        task_factory: Task constructor taking the agent as its first argument
+        *args: Positional arguments for the task factory
+        route: Route name used to look up the concurrency limit and default deadline
+        cache_key: Response cache key; a cached response is returned without calling the LLM
+        deadline: time.monotonic() value to give up at, defaults to the route's deadline
+        request: The HTTP request, watched for a client disconnect
+        structured_output: Artifact name, e.g. "flashcards", to generate as validated JSON
+        **kwargs: Keyword arguments for the task factory
+
+    Returns:
+        str: The task output
+
+    Raises:
+        DeadlineExceeded: The deadline passed before the task finished
+        RequestCancelled: The client disconnected before the task finished
+        StructuredOutputError: The structured output was still invalid after repair
+    """
+    trace = AgentTrace(role, task_factory.__name__, route)
+
+    cache_key = _structured_key(cache_key, structured_output)
+    if cache_key is not None:
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            trace.finish("cache_hit")
+            return cached
+
+    if deadline is None:
+        deadline = request_deadline(route)
+    check_deadline(deadline)
+
+    key = _flight_key(role, task_factory, args, kwargs, structured_output)
+    flight = _in_flight.get(key)
+    coalesced = flight is not None
+    if coalesced:
+        # The shared run may only be cut short once every waiter's deadline has passed
+        flight.token.extend(deadline)
+    else:
+        token = CancelToken(deadline)
+        flight = _Flight(asyncio.ensure_future(
+            _run_task(role, task_factory, args, kwargs, route, cache_key, trace, token, structured_output)
+        ), token)
+        _in_flight[key] = flight
+        flight.task.add_done_callback(lambda done: _finish_flight(key, flight))
+
+    flight.waiters += 1
+    error = None
+    try:
+        # Shielded, so a waiter that gives up doesn't cancel the call for the others
+        result = await await_within(asyncio.shield(flight.task), deadline, request)
+    except BaseException as e:
+        error = e
+        # The call that started the execution traces it; waiters only record their wait
+        if coalesced:
+            trace.finish(f"coalesced_{_trace_status(e)}", e)
+        raise
+    finally:
+        _leave_flight(flight, error)
+
+    if coalesced:
+        trace.finish("coalesced")
+    return result
+
+async def stream_agent_task(
+    role: str,
+    task_factory: Callable,
+    *args,
+    route: Optional[str] = None,
+    cache_key: Optional[ResponseKey] = None,
+    deadline: Optional[float] = None,
+    request: Optional[Request] = None,
+    structured_output: Optional[str] = None,
+    **kwargs
+) -> AsyncIterator[str]:
+    """
+    Stream the output of a single-agent task token by token.
+
+    The agent's role and the task are turned into chat messages and sent
+    straight to the LLM provider; a one-agent, one-task Crew adds nothing but
+    latency here. The route's concurrency limit applies as for
+    run_agent_task_async.
+
+    The stream is aborted, and the connection to the provider closed, when
+    the deadline passes or the client disconnects. Chunks already yielded
+    stay with the consumer, which can use them as a partial result.
+
+    With structured_output set, the prompt asks for that artifact as JSON
+    (see structured_output.JSONArrayStream to read it as it arrives). The
+    schema is only given in the prompt, since not every provider supports
+    JSON mode for streamed completions, and there is no repair call: the
+    answer is cached only if it passes validation.
+
+    Args:
+        role: Registry role of the agent, e.g. "study_tutor"
+        task_factory: Task constructor taking the agent as its first argument
+        *args: Positional arguments for the task factory
+        route: Route name used to look up the concurrency limit and default deadline
+        cache_key: Response cache key; a cached response is sent as a single chunk
+        deadline: time.monotonic() value to give up at, defaults to the route's deadline
+        request: The HTTP request, watched for a client disconnect
+        structured_output: Artifact name, e.g. "flashcards", to generate as JSON
+        **kwargs: Keyword arguments for the task factory
+
+    Yields:
+        str: Chunks of generated text as they arrive
+
+    Raises:
+        DeadlineExceeded: The deadline passed before the stream finished
+        RequestCancelled: The client disconnected before the stream finished
+    """
+    trace = AgentTrace(role, task_factory.__name__, route)
+    trace.set(stream=True)
+
+    cache_key = _structured_key(cache_key, structured_output)
+    if cache_key is not None:
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            trace.finish("cache_hit")
+            yield cached
+            return
+
+    if deadline is None:
+        deadline = request_deadline(route)
+
+    agent = get_agent(role)
+    messages = build_task_messages(agent, task_factory(agent, *args, **kwargs))
+    if structured_output is not None:
+        messages[-1]["content"] += "\n\n" + schema_instructions(structured_output)
+        trace.set(structured=structured_output)
+    trace.preview("prompt_preview", messages[-1]["content"])
+
+    semaphore = get_route_semaphore(route)
+    parts = []
+    try:
+        await await_within(semaphore.acquire(), deadline, request)
+        stream = astream_chat(messages)
+        try:
+            trace.mark("queue_ms")
+            while True:
+                try:
+                    chunk = await await_within(stream.__anext__(), deadline, request)
+                except StopAsyncIteration:
+                    break
+                if not parts:
+                    trace.mark("first_token_ms")
+                parts.append(chunk)
+                yield chunk
+        finally:
+            semaphore.release()
+            # A chunk still being read when the wait was cancelled closes the stream itself
+            if not stream.ag_running:
+                await stream.aclose()
+    except BaseException as e:
+        # GeneratorExit means the consumer stopped reading before the stream finished
+        trace.set(chunks=len(parts))
+        trace.finish(_trace_status(e), e)
+        raise
+
+    output = "".join(parts)
+    trace.set(
+        chunks=len(parts),
+        prompt_tokens=sum(count_tokens(message["content"]) for message in messages),
+        completion_tokens=count_tokens(output),
+        tokens_estimated=True
+    )
+    trace.preview("output_preview", output)
+    trace.finish()
+
+    if cache_key is not None and structured_output is not None:
+        try:
+            validate_output(structured_output, output)
+        except ValueError as e:
+            logger.warning(f"Not caching invalid streamed {structured_output}: {str(e)[:300]}")
+            return
+    if cache_key is not None:
+        await response_cache.set(cache_key, output)
+
+async def run_blocking(func: Callable, *args):
+    """Run other blocking work, e.g. an embedding model call, on the agent thread pool"""
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+def shutdown_executor():
+    """Stop accepting agent work and wait for running tasks to finish"""
+    _executor.shutdown(wait=True)
@@ -1,97 +1,59 @@
 import os
-from langchain_groq import ChatGroq
-from langchain_community.chat_models import ChatOpenAI
+import threading
 from functools import lru_cache
 from crewai import Agent, Task, Crew, Process
+from crewai.utilities.events.event_listener import event_listener
 import re
 from dotenv import load_dotenv
 
+from config import AGENT_VERBOSE
+from llm_providers import create_llm
+from prompts import render_prompt, get_template, get_backstory, get_explanation_note, format_topic_contexts
+
 load_dotenv()
 
+# CrewAI's console listener prints a panel for every task unless a Crew turns it down,
+# and tasks run here without a Crew, so it follows AGENT_VERBOSE directly
+event_listener.verbose = AGENT_VERBOSE
+event_listener.formatter.verbose = AGENT_VERBOSE
+
 # Replace Streamlit caching with Python's lru_cache
 @lru_cache(maxsize=1)
 def get_llm():
-    # Initialize Groq client
-    groq_api_key = os.environ.get("GROQ_API_KEY", "")
-    
-    # Configure the Groq LLM
-    llm = ChatGroq(
-        groq_api_key=groq_api_key,
-        model_name="groq/qwen-qwq-32b",
-    )
-    return llm 
-    # llm = ChatOpenAI(
-    #     model_name="gpt-4o-mini",
-    #     temperature=0.5,
-    #     timeout=10,
-    # )
-    # return llm
+    """Get the LLM for the configured provider (groq, openai or the local stub)"""
+    return create_llm()
+
+def build_task_messages(agent, task):
+    """Build chat messages equivalent to what an agent sends to the LLM for a task"""
+    system_prompt = f"You are {agent.role}. {agent.backstory}\nYour personal goal is: {agent.goal}"
+    user_prompt = f"{task.description}\n\nThis is the expected criteria for your final answer: {task.expected_output}"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
 
 # Create a function for explanation tasks
 def create_explanation_task(agent, question, context):
     """Create a task for explaining concepts using clear, concise language"""
-    # Detect if this is a chapter-specific question
-    chapter_match = re.search(r"chapter\s+(\d+)", question.lower())
-    
-    # Base task description
-    task_description = f"""Explain the following concept using clear, concise language. 
-    Break down complex ideas into manageable parts. Use analogies where helpful.
-    
-    Question: {question}
-    
-    Context information:
-    {context}
-    
-    Guidelines:
-    1. Start with a direct, clear answer to the question - get straight to the point
-    2. Provide relevant examples from the context
-    3. Break down complex concepts into simpler parts
-    4. Use analogies or comparisons when helpful
-    5. Reference specific information from the document when relevant
-    6. If the question is unclear or lacks context, ask for clarification
-    7. If the context appears to be an index, table of contents, or references section rather than actual content, 
-       explain that you need more specific questions about concepts, not just terms from the index
-    8. Always provide substantive educational value in your answers, not just listings or metadata
-    9. Never respond with raw index entries, reference lists, or page numbers
-    10. Focus on explaining the concept rather than reporting document metadata
-    """
+    notes = []
     
     # Add chapter-specific instructions if applicable
+    chapter_match = re.search(r"chapter\s+(\d+)", question.lower())
     if chapter_match:
-        chapter_num = chapter_match.group(1)
-        task_description += f"""
-        11. This question is about Chapter {chapter_num}. Focus your answer specifically on the content 
-            and concepts from this chapter.
-        12. If you can't find sufficient information about Chapter {chapter_num} in the context,
-            explain what specific content would help you provide a better answer.
-        13. Structure your answer to reflect the organization of Chapter {chapter_num} if possible.
-        """
+        notes.append(get_explanation_note("chapter", chapter=chapter_match.group(1)))
     
     # Additional instructions for when context is thin
     if not context or len(context) < 200:
-        task_description += """
-        Important: The context information is limited or missing. Please:
-        1. Acknowledge the limited information available
-        2. Provide general information about the topic based on your knowledge
-        3. Explain what specific details from the document would help you give a more complete answer
-        4. Suggest alternative questions that might yield better results
-        """
+        notes.append(get_explanation_note("thin_context"))
     
     # Check if context appears to be primarily index entries
     if context and ("index entries" in context.lower() or 
                   re.search(r"(\w+,\s+\d+[\s,]*)+", context) and len(context) < 500):
-        task_description += """
-        Important: The context appears to be primarily from an index or reference section rather than
-        substantive content. Please:
-        1. Explain that you can see references to the topic but not the actual content
-        2. Suggest more specific questions about concepts rather than just asking about a chapter or topic name
-        3. Provide general information about the topic based on your knowledge
-        4. Don't list the index entries or page numbers as they aren't helpful
-        """
+        notes.append(get_explanation_note("index_context"))
     
     return Task(
-        description=task_description,
-        expected_output="A clear, well-structured explanation that directly addresses the question while incorporating relevant context",
+        description=render_prompt("explanation", context=context, notes=notes, question=question),
+        expected_output=get_template("explanation").expected_output,
         agent=agent
     )
 
@@ -100,24 +62,9 @@ def create_study_tutor_agent():
     return Agent(
         role="Study Tutor",
         goal="Explain complex concepts clearly and help students understand course material",
-        backstory="""You are an expert educator with years of experience breaking down difficult concepts 
-        into understandable explanations. You excel at adapting your teaching style to match different 
-        learning preferences and maintaining engaging conversations.
-        
-        Your key strengths include:
-        1. Breaking down complex topics into digestible pieces
-        2. Providing clear, concrete examples
-        3. Using analogies to connect new concepts with familiar ones
-        4. Maintaining context across a conversation
-        5. Identifying and addressing gaps in understanding
-        6. Encouraging critical thinking and deeper exploration
-        7. Adapting explanations based on the student's responses
-        8. Referencing source material effectively
-        
-        You aim to not just answer questions, but to ensure deep understanding and 
-        help students build connections between different concepts.""",
+        backstory=get_backstory("study_tutor"),
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_note_taker_agent():
@@ -126,7 +73,7 @@ def create_note_taker_agent():
         goal="Create organized, comprehensive study notes",
         backstory="You specialize in creating concise yet comprehensive notes that highlight key concepts, definitions, examples, and connections between ideas. Your notes are well-structured with clear headings and logical flow.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_assessment_expert_agent():
@@ -135,7 +82,7 @@ def create_assessment_expert_agent():
         goal="Design tests to evaluate understanding at different complexity levels",
         backstory="You are skilled at creating varied assessment questions that test different levels of knowledge, from basic recall to complex application. You can generate quizzes ranging from simple to advanced difficulty.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_flashcard_specialist_agent():
@@ -144,7 +91,7 @@ def create_flashcard_specialist_agent():
         goal="Create effective memory aids through well-crafted flashcards",
         backstory="You excel at distilling complex information into concise flashcards that facilitate memorization and recall. You know how to balance brevity with clarity to create effective study tools.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_visual_learning_expert_agent():
@@ -153,7 +100,7 @@ def create_visual_learning_expert_agent():
         goal="Transform topics into visual mind maps that show relationships between concepts",
         backstory="You have expertise in visual learning techniques and can organize information into clear, meaningful visual representations. You excel at identifying key relationships between concepts and presenting them graphically.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_learning_coach_agent():
@@ -162,7 +109,7 @@ def create_learning_coach_agent():
         goal="Analyze performance and suggest learning improvements",
         backstory="You specialize in analyzing learning patterns and progress to provide targeted feedback and improvement strategies. Your coaching helps students identify and overcome knowledge gaps.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_roadmap_planner_agent():
@@ -171,7 +118,7 @@ def create_roadmap_planner_agent():
         goal="Create structured study plans with clear timelines and milestones",
         backstory="You are an expert in educational planning with years of experience creating effective study roadmaps. You excel at breaking down complex materials into manageable learning paths with realistic timeframes.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 # DSA Interview Preparation Agents
@@ -181,7 +128,7 @@ def create_question_fetching_agent():
         goal="Retrieve relevant DSA questions from databases and APIs based on specified criteria",
         backstory="You are an expert at navigating various question repositories and finding the most appropriate practice problems. You understand different DSA topics deeply and can categorize questions accurately.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_filtering_agent():
@@ -190,7 +137,7 @@ def create_filtering_agent():
         goal="Filter and organize DSA questions based on user preferences and requirements",
         backstory="You specialize in understanding user needs and organizing questions for optimal learning. You can analyze question difficulty, topics, and relevance to specific companies or roles.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_progress_tracking_agent():
@@ -199,7 +146,7 @@ def create_progress_tracking_agent():
         goal="Track and analyze user progress on DSA practice",
         backstory="You excel at monitoring learning patterns and identifying strengths and improvement areas. You understand how to measure progress across different question types and difficulty levels.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_personalization_agent():
@@ -208,7 +155,7 @@ def create_personalization_agent():
         goal="Customize question sets based on user career goals",
         backstory="You have detailed knowledge of what different companies and roles require. You can create targeted practice plans that align with specific career objectives and salary expectations.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_debugging_agent():
@@ -217,7 +164,7 @@ def create_debugging_agent():
         goal="Analyze code solutions and provide debugging assistance",
         backstory="You are an expert programmer with deep knowledge of multiple programming languages and common DSA implementation pitfalls. You can quickly identify bugs and suggest optimizations.",
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 # DSA Interview Preparation Specialized Agents
@@ -226,12 +173,9 @@ def create_dsa_recommendation_agent():
     return Agent(
         role="DSA Problem Recommender",
         goal="Recommend optimal DSA problems tailored to the user's skill level and interview targets",
-        backstory="You are a seasoned technical interview coach with deep knowledge of data structures and algorithms. "
-                "You've helped hundreds of candidates prepare for top tech companies and understand the patterns "
-                "each company tends to focus on. You excel at creating personalized study plans based on a "
-                "candidate's background, target companies, and available preparation time.",
+        backstory=get_backstory("dsa_recommender"),
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_dsa_expert_agent():
@@ -239,12 +183,9 @@ def create_dsa_expert_agent():
     return Agent(
         role="DSA Expert",
         goal="Provide comprehensive assistance with data structures and algorithms for interview preparation",
-        backstory="You are an expert in data structures and algorithms with extensive experience in technical interviews. "
-                "You have a deep understanding of problem-solving techniques, algorithm design, and implementation. "
-                "You can generate practice questions, create study plans, and analyze code solutions to help candidates "
-                "prepare effectively for technical interviews.",
+        backstory=get_backstory("dsa_expert"),
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_coding_pattern_agent():
@@ -252,12 +193,9 @@ def create_coding_pattern_agent():
     return Agent(
         role="Coding Pattern Expert",
         goal="Identify common DSA patterns and teach reusable problem-solving strategies",
-        backstory="You are an algorithm design expert who specializes in recognizing common patterns across seemingly "
-                "different problems. You help students develop a pattern-based approach to DSA problems rather than "
-                "memorizing individual solutions. You can break down complex problems into familiar patterns and "
-                "explain the underlying principles that connect different questions.",
+        backstory=get_backstory("coding_pattern_expert"),
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_interview_strategy_agent():
@@ -265,13 +203,9 @@ def create_interview_strategy_agent():
     return Agent(
         role="Technical Interview Strategist",
         goal="Provide strategies for excelling in technical interviews beyond just solving the problems",
-        backstory="You are an expert in technical interview preparation with experience as both a candidate and "
-                "an interviewer at major tech companies. You understand that success in technical interviews "
-                "requires more than just solving problems - it requires clear communication, asking clarifying "
-                "questions, discussing trade-offs, and demonstrating problem-solving thought processes. You "
-                "help candidates develop these meta-skills alongside their technical knowledge.",
+        backstory=get_backstory("interview_strategist"),
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_company_specific_agent():
@@ -279,126 +213,55 @@ def create_company_specific_agent():
     return Agent(
         role="Company Interview Expert",
         goal="Provide tailored advice for specific company interview processes",
-        backstory="You have extensive knowledge about the unique interview processes and preferences of major "
-                "tech companies. You understand how Amazon's leadership principles influence their questions, "
-                "how Google emphasizes algorithm efficiency, how Facebook focuses on scale, and how Microsoft "
-                "looks for well-rounded problem solvers. You help candidates customize their preparation for "
-                "specific target companies.",
+        backstory=get_backstory("company_expert"),
         llm=get_llm(),
-        verbose=True
+        verbose=AGENT_VERBOSE
     )
 
 def create_notes_generation_task(agent, topic, context):
     return Task(
-        description=f"""Create comprehensive, well-structured study notes on the following topic. 
-        Include key concepts, definitions, examples, and relationships between ideas. 
-        Organize with clear headings and subheadings.
-        
-        Topic: {topic}
-        
-        Context information:
-        {context}
-        """,
-        expected_output="Well-structured study notes in markdown format with headings, bullet points, and emphasis on key concepts.",
+        description=render_prompt("notes", context=context, topic=topic),
+        expected_output=get_template("notes").expected_output,
         agent=agent
     )
 
 def create_test_generation_task(agent, topic, difficulty, context):
     return Task(
-        description=f"""Create a practice test on the following topic with {difficulty} difficulty level.
-        Include a mix of question types (multiple choice, short answer, essay questions).
-        Provide an answer key with explanations.
-        
-        Topic: {topic}
-        Difficulty: {difficulty}
-        
-        Context information:
-        {context}
-        """,
-        expected_output="A practice test with varied question types and a comprehensive answer key.",
+        description=render_prompt("tests", context=context, topic=topic, difficulty=difficulty),
+        expected_output=get_template("tests").expected_output,
         agent=agent
     )
 
 def create_flashcard_generation_task(agent, topic, context, num_cards=10):
     return Task(
-        description=f"""Create a set of {num_cards} flashcards for the following topic.
-        Each flashcard should have a clear question/term on the front side and a concise answer/definition on the back side.
-        Focus on key concepts, definitions, formulas, and important facts.
-        
-        Topic: {topic}
-        Number of cards to generate: {num_cards}
-        
-        Context information:
-        {context}
-        
-        IMPORTANT FORMATTING INSTRUCTIONS:
-        1. Output the flashcards in JSON format as an array of objects
-        2. Each flashcard object MUST have exactly two fields: "front" and "back"
-        3. The "front" should contain a clear, concise question or term (typically 1-2 sentences)
-        4. The "back" should contain a comprehensive yet concise answer or explanation (typically 1-3 sentences)
-        5. Ensure the front and back are related and form a logical pair
-        6. Do NOT include any markdown formatting, just plain text
-        7. Do NOT include card numbers or labels like "Card 1:" in the content
-        8. Make sure content is appropriate for flashcard display (not too long)
-        9. IMPORTANT: Avoid using percentage signs (%) in your content as they can cause formatting issues
-        10. Always use complete sentences and proper grammar
-        
-        EXAMPLE FORMAT (but create your own content):
-        [
-          {{
-            "front": "What is a binary search tree?",
-            "back": "A binary tree data structure where each node has at most two children, with all left descendants less than the node and all right descendants greater than the node."
-          }},
-          {{
-            "front": "What is time complexity?",
-            "back": "A measure of the amount of time an algorithm takes to run as a function of the length of the input."
-          }}
-        ]
-        
-        Remember to extract the most important concepts from the context that are related to the topic and create high-quality, educational flashcards.
-        """,
-        expected_output="A JSON array of flashcard objects, each with 'front' and 'back' fields in proper format for display.",
+        description=render_prompt("flashcards", context=context, topic=topic, num_cards=num_cards),
+        expected_output=get_template("flashcards").expected_output,
+        agent=agent
+    )
+
+def create_batch_notes_generation_task(agent, topics, contexts):
+    return Task(
+        description=render_prompt(
+            "notes_batch", context=format_topic_contexts(topics, contexts), topics=", ".join(topics)
+        ),
+        expected_output=get_template("notes_batch").expected_output,
+        agent=agent
+    )
+
+def create_batch_flashcard_generation_task(agent, topics, contexts, num_cards=10):
+    return Task(
+        description=render_prompt(
+            "flashcards_batch", context=format_topic_contexts(topics, contexts),
+            topics=", ".join(topics), num_cards=num_cards
+        ),
+        expected_output=get_template("flashcards_batch").expected_output,
         agent=agent
     )
 
 def create_mind_map_task(agent, topic, context):
     return Task(
-        description=f"""Create a detailed mind map for the following topic. Follow the specific formatting instructions below.
-        
-        Topic: {topic}
-        
-        Context information:
-        {context}
-        
-        FORMATTING INSTRUCTIONS:
-        
-        1. Begin with identifying the central concept that best represents the topic
-        
-        2. Identify 4-8 main branches (key concepts/categories) that connect directly to the central concept
-        
-        3. For each main branch, identify 2-5 sub-branches (related concepts, details, or examples)
-        
-        4. Structure your response in a hierarchical format showing:
-          - Central concept (the topic)
-          - Main branches (key concepts)
-          - Sub-branches for each main branch
-        
-        5. IMPORTANT: Use a clear hierarchical format with the following levels:
-          - Central Concept/Topic: The main subject
-          - Branch 1: First key concept
-              - Sub-branch 1.1: Detail or example for Branch 1
-              - Sub-branch 1.2: Another detail or example for Branch 1
-          - Branch 2: Second key concept
-              - Sub-branch 2.1: Detail or example for Branch 2
-          - ...and so on
-        
-        6. Ensure concepts and relationships are clearly labeled and accurate based on the context information.
-        
-        7. Keep branch and sub-branch descriptions concise (preferably under 60 characters) to fit well in the visualization.
-        
-        Remember that this mind map will be visualized as an interactive diagram with nodes and connections, so focus on creating a clear hierarchical structure that shows the relationships between concepts.
-        """,
-        expected_output="A detailed mind map with central concept, branches, and sub-branches in a clear hierarchical format.",
+        description=render_prompt("mindmaps", context=context, topic=topic),
+        expected_output=get_template("mindmaps").expected_output,
         agent=agent
     )
 
@@ -689,19 +552,62 @@ def create_mock_interview_task(agent, problem, difficulty, company_context=None)
         agent=agent
     )
 
+# Agent registry: each role agent is constructed once and reused across requests
+AGENT_FACTORIES = {
+    "study_tutor": create_study_tutor_agent,
+    "note_taker": create_note_taker_agent,
+    "assessment_expert": create_assessment_expert_agent,
+    "flashcard_specialist": create_flashcard_specialist_agent,
+    "visual_learning_expert": create_visual_learning_expert_agent,
+    "learning_coach": create_learning_coach_agent,
+    "roadmap_planner": create_roadmap_planner_agent,
+    "question_fetcher": create_question_fetching_agent,
+    "question_filter": create_filtering_agent,
+    "progress_tracker": create_progress_tracking_agent,
+    "personalizer": create_personalization_agent,
+    "debugger": create_debugging_agent,
+    "dsa_recommender": create_dsa_recommendation_agent,
+    "dsa_expert": create_dsa_expert_agent,
+    "coding_pattern_expert": create_coding_pattern_agent,
+    "interview_strategist": create_interview_strategy_agent,
+    "company_expert": create_company_specific_agent,
+}
+
+# Agents keep per-execution state (their executor), so each thread gets its own
+# instances; requests served by the same thread share them.
+_agent_registry = threading.local()
+
+def get_agent(role):
+    """Get the shared agent for a role, constructing it on first use"""
+    agents = getattr(_agent_registry, "agents", None)
+    if agents is None:
+        agents = _agent_registry.agents = {}
+    
+    agent = agents.get(role)
+    if agent is None:
+        if role not in AGENT_FACTORIES:
+            raise ValueError(f"Unknown agent role: {role}")
+        agent = agents[role] = AGENT_FACTORIES[role]()
+    return agent
+
+def _task_output_text(result):
+    """Extract the text from a task or crew result"""
+    if hasattr(result, 'raw_output'):
+        return result.raw_output
+    if hasattr(result, 'raw'):
+        return result.raw
+    return str(result)
+
 def run_agent_task(agent, task):
     """Execute a single agent task and return the result"""
+    # A single-agent, single-task run doesn't need a Crew: execute the task directly
+    if hasattr(task, 'execute_sync'):
+        return _task_output_text(task.execute_sync(agent=agent))
+    
     crew = Crew(
         agents=[agent],
         tasks=[task],
-        verbose=True,
+        verbose=AGENT_VERBOSE,
         process=Process.sequential
     )
-    
-    result = crew.kickoff()
-    
-    # Handle different result types
-    if hasattr(result, 'raw_output'):
-        return result.raw_output
-    else:
-        return str(result)
+    return _task_output_text(crew.kickoff())
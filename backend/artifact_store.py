@@ -0,0 +1,361 @@
+import re
+import json
+import asyncio
+import base64
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, Query
+from fastapi.responses import JSONResponse
+
+from config import ARTIFACT_DB_PATH, LEGACY_ARTIFACT_DIR, ARTIFACT_PAGE_SIZE, ARTIFACT_MAX_PAGE_SIZE
+from retrieval_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Where each kind of artifact was saved as one JSON file per artifact, below LEGACY_ARTIFACT_DIR
+LEGACY_LAYOUT = {
+    "notes": ("notes", "*.json"),
+    "flashcards": ("flashcards", "*.json"),
+    "mindmaps": ("mindmaps", "*.json"),
+    "tests": ("tests", "*.json"),
+    "roadmaps": ("roadmaps", "*.json"),
+    "dsa_plans": ("dsa", "plan_*.json"),
+    "code_analyses": ("dsa/code_analysis", "analysis_*.json"),
+}
+
+# Field names accepted by the list endpoints' fields parameter
+_FIELD_NAME = re.compile(r"^\w+$")
+
+_TABLES = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    document_id TEXT,
+    topic TEXT,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    topic_norm TEXT,
+    PRIMARY KEY (kind, id)
+);
+CREATE TABLE IF NOT EXISTS legacy_imports (
+    kind TEXT PRIMARY KEY,
+    artifacts INTEGER NOT NULL
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS artifacts_by_created ON artifacts (kind, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS artifacts_by_document ON artifacts (kind, document_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS artifacts_by_topic ON artifacts (kind, topic_norm);
+"""
+
+_INSERT = "INSERT {} INTO artifacts (kind, id, document_id, topic, topic_norm, created_at, data) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+def normalize_topic(topic: Optional[str]) -> Optional[str]:
+    """Case- and whitespace-insensitive form of a topic, as stored in topic_norm and matched by the topic filter"""
+    return normalize_query(topic).casefold() if topic is not None else None
+
+class ArtifactStore:
+    """
+    SQLite store for generated artifacts, replacing one JSON file per artifact.
+
+    Each artifact is kept as its JSON document, next to the columns lists
+    are filtered and ordered by (kind, document_id, topic, created_at), so
+    listing a page reads only the rows on it. The first time the store is
+    opened, artifacts saved as files by earlier versions are imported; the
+    files are left in place.
+
+    The methods block on SQLite; async handlers use the *_async variants,
+    which run them on a worker thread.
+    """
+
+    def __init__(self, db_path: Path = ARTIFACT_DB_PATH, legacy_dir: Optional[Path] = LEGACY_ARTIFACT_DIR):
+        self.db_path = Path(db_path)
+        self.legacy_dir = Path(legacy_dir) if legacy_dir else None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Open the database and import legacy artifacts now instead of on first use, e.g. at startup"""
+        with self._lock:
+            self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            # WAL lets reads proceed during a write; NORMAL sync is durable across app crashes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_TABLES)
+            self._add_topic_norm(conn)
+            conn.executescript(_INDEXES)
+            if self.legacy_dir is not None:
+                self._import_legacy(conn)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _add_topic_norm(conn: sqlite3.Connection):
+        """Add and fill the topic_norm column in databases created before it existed"""
+        columns = {name for (_, name, *_) in conn.execute("PRAGMA table_info(artifacts)")}
+        if "topic_norm" in columns:
+            return
+        rows = [(normalize_topic(topic), kind, artifact_id)
+                for kind, artifact_id, topic in conn.execute("SELECT kind, id, topic FROM artifacts")]
+        with conn:
+            conn.execute("ALTER TABLE artifacts ADD COLUMN topic_norm TEXT")
+            conn.executemany("UPDATE artifacts SET topic_norm = ? WHERE kind = ? AND id = ?", rows)
+        logger.info(f"Added normalized topics to {len(rows)} artifacts")
+
+    def _import_legacy(self, conn: sqlite3.Connection):
+        """Import the per-file artifacts of every kind not imported yet"""
+        imported = {kind for (kind,) in conn.execute("SELECT kind FROM legacy_imports")}
+        for kind, (subdir, pattern) in LEGACY_LAYOUT.items():
+            if kind in imported:
+                continue
+            rows = []
+            directory = self.legacy_dir / subdir
+            for path in sorted(directory.glob(pattern)) if directory.is_dir() else []:
+                try:
+                    with open(path, "r") as f:
+                        artifact = json.load(f)
+                    rows.append(self._row(kind, artifact))
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping unreadable {kind} file {path}: {e}")
+            with conn:
+                conn.executemany(_INSERT.format("OR IGNORE"), rows)
+                conn.execute("INSERT INTO legacy_imports VALUES (?, ?)", (kind, len(rows)))
+            if rows:
+                logger.info(f"Imported {len(rows)} {kind} from {directory}")
+
+    @staticmethod
+    def _row(kind: str, artifact: Dict[str, Any]) -> tuple:
+        return (
+            kind,
+            str(artifact["id"]),
+            artifact.get("document_id") or None,
+            artifact.get("topic"),
+            normalize_topic(artifact.get("topic")),
+            str(artifact["created_at"]),
+            json.dumps(artifact),
+        )
+
+    def put(self, kind: str, artifact: Dict[str, Any]):
+        """
+        Save an artifact, replacing any with the same id.
+
+        Args:
+            kind: Artifact kind, e.g. "notes"
+            artifact: The artifact as JSON-serializable data, with "id" and "created_at"
+        """
+        row = self._row(kind, artifact)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(_INSERT.format("OR REPLACE"), row)
+
+    def put_many(self, kind: str, artifacts: List[Dict[str, Any]]):
+        """
+        Save several artifacts in one transaction: either all of them are saved or none is.
+
+        Args:
+            kind: Artifact kind, e.g. "notes"
+            artifacts: The artifacts, each with "id" and "created_at"
+        """
+        rows = [self._row(kind, artifact) for artifact in artifacts]
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(_INSERT.format("OR REPLACE"), rows)
+
+    def get(self, kind: str, artifact_id: str) -> Optional[Dict[str, Any]]:
+        """The artifact with this id, or None if there is none"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT data FROM artifacts WHERE kind = ? AND id = ?", (kind, artifact_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, kind: str, artifact_id: str) -> bool:
+        """Delete an artifact; returns whether it existed"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                cursor = conn.execute("DELETE FROM artifacts WHERE kind = ? AND id = ?", (kind, artifact_id))
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _filters(kind: str, document_id: Optional[str], topic: Optional[str]) -> Tuple[str, List[Any]]:
+        where, params = "kind = ?", [kind]
+        if document_id is not None:
+            where += " AND document_id = ?"
+            params.append(document_id)
+        if topic:
+            # Prefix match as a range, so it seeks the artifacts_by_topic index
+            prefix = normalize_topic(topic)
+            where += " AND topic_norm >= ? AND topic_norm < ?"
+            params += [prefix, prefix + "\U0010ffff"]
+        return where, params
+
+    def list(
+        self,
+        kind: str,
+        document_id: Optional[str] = None,
+        topic: Optional[str] = None,
+        after: Optional[Tuple[str, str]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        List artifacts, newest first.
+
+        Args:
+            kind: Artifact kind, e.g. "notes"
+            document_id: Only artifacts generated from this document
+            topic: Only artifacts whose topic starts with this text, ignoring case and extra whitespace
+            after: (created_at, id) of the last artifact of the previous page; the list continues after it
+            limit: Maximum number of artifacts, None for all
+            offset: Number of artifacts to skip
+
+        Returns:
+            List[Dict[str, Any]]: The artifacts on the page
+        """
+        where, params = self._filters(kind, document_id, topic)
+        if after is not None:
+            # Keyset pagination: seeks to the position in the index instead of counting rows up to it
+            where += " AND (created_at, id) < (?, ?)"
+            params += list(after)
+        query = f"SELECT data FROM artifacts WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+
+        with self._lock:
+            rows = self._connect().execute(query, params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def count(self, kind: str, document_id: Optional[str] = None, topic: Optional[str] = None) -> int:
+        """Number of artifacts of a kind, with the same filters as list"""
+        where, params = self._filters(kind, document_id, topic)
+        with self._lock:
+            return self._connect().execute(f"SELECT COUNT(*) FROM artifacts WHERE {where}", params).fetchone()[0]
+
+    async def put_async(self, kind: str, artifact: Dict[str, Any]):
+        """Async version of put, run on a worker thread"""
+        await asyncio.to_thread(self.put, kind, artifact)
+
+    async def put_many_async(self, kind: str, artifacts: List[Dict[str, Any]]):
+        """Async version of put_many, run on a worker thread"""
+        await asyncio.to_thread(self.put_many, kind, artifacts)
+
+    async def delete_async(self, kind: str, artifact_id: str) -> bool:
+        """Async version of delete, run on a worker thread"""
+        return await asyncio.to_thread(self.delete, kind, artifact_id)
+
+    async def get_async(self, kind: str, artifact_id: str) -> Optional[Dict[str, Any]]:
+        """Async version of get, run on a worker thread"""
+        return await asyncio.to_thread(self.get, kind, artifact_id)
+
+    async def list_async(self, kind: str, **filters) -> List[Dict[str, Any]]:
+        """Async version of list, run on a worker thread"""
+        return await asyncio.to_thread(self.list, kind, **filters)
+
+    async def count_async(self, kind: str, document_id: Optional[str] = None, topic: Optional[str] = None) -> int:
+        """Async version of count, run on a worker thread"""
+        return await asyncio.to_thread(self.count, kind, document_id, topic)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+artifact_store = ArtifactStore()
+
+def encode_cursor(artifact: Dict[str, Any]) -> str:
+    """Opaque list cursor pointing just after this artifact"""
+    position = json.dumps([str(artifact["created_at"]), str(artifact["id"])])
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """(created_at, id) a cursor points after; raises ValueError for a malformed cursor"""
+    try:
+        created_at, artifact_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return str(created_at), str(artifact_id)
+
+class ArtifactQuery:
+    """Query parameters of the artifact list endpoints, used with Depends()"""
+    def __init__(
+        self,
+        document_id: Optional[str] = None,
+        topic: Optional[str] = Query(
+            None,
+            description="Only artifacts whose topic starts with this text, ignoring case and extra whitespace; "
+                        "a prefix, not a substring: 'trees' does not match 'Binary trees'"
+        ),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+        limit: int = Query(ARTIFACT_PAGE_SIZE, ge=1, le=ARTIFACT_MAX_PAGE_SIZE),
+        offset: int = Query(0, ge=0),
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,topic,created_at"),
+        total: bool = Query(False, description="Also count the matches on pages after the first")
+    ):
+        self.document_id = document_id
+        self.topic = topic
+        self.limit = limit
+        self.offset = offset
+        self.total = total
+        try:
+            self.after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        self.fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+        if self.fields is not None and not all(_FIELD_NAME.match(field) for field in self.fields):
+            raise HTTPException(status_code=400, detail=f"Invalid fields: {fields}")
+
+async def list_artifacts(
+    kind: str,
+    query: ArtifactQuery,
+    prepare: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    prepared_fields: Optional[Set[str]] = None
+) -> JSONResponse:
+    """
+    One page of a list endpoint, newest first.
+
+    The stored artifacts were validated when they were saved, so they are
+    returned as they are instead of through the route's response model. If
+    there are more, the cursor of the next page goes in X-Next-Cursor. The
+    number of matching artifacts goes in X-Total-Count on the first page, or
+    on any page when the client asks for it; cursor pages skip the count.
+
+    Args:
+        kind: Artifact kind, e.g. "notes"
+        query: The request's list parameters
+        prepare: Applied to each artifact before the fields are selected, on a worker thread
+        prepared_fields: The fields prepare changes; it is skipped when fields selects none of them
+
+    Returns:
+        JSONResponse: The artifacts on the page
+    """
+    # One extra row tells whether there is a next page
+    artifacts = await artifact_store.list_async(
+        kind, document_id=query.document_id, topic=query.topic, after=query.after,
+        limit=query.limit + 1, offset=query.offset
+    )
+    headers = {}
+    if query.after is None or query.total:
+        headers["X-Total-Count"] = str(await artifact_store.count_async(kind, query.document_id, query.topic))
+    if len(artifacts) > query.limit:
+        artifacts = artifacts[:query.limit]
+        headers["X-Next-Cursor"] = encode_cursor(artifacts[-1])
+
+    if prepare is not None and (query.fields is None or prepared_fields is None
+                                or prepared_fields.intersection(query.fields)):
+        artifacts = await asyncio.to_thread(lambda: [prepare(artifact) for artifact in artifacts])
+    if query.fields is not None:
+        artifacts = [{field: artifact[field] for field in query.fields if field in artifact} for artifact in artifacts]
+    return JSONResponse(content=artifacts, headers=headers)
@@ -0,0 +1,184 @@
+import re
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+from fastapi import Request
+
+from config import BATCH_CONTEXT_BUDGET, BATCH_TOPICS_PER_CALL
+from context_builder import count_tokens
+from agent_runtime import run_agent_task_async
+from cancellation import DeadlineExceeded, RequestCancelled
+from response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Section header written before each topic's answer in a multi-topic response (see prompts.TOPIC_MARKER)
+_TOPIC_HEADER = re.compile(r"^[ \t]*#{1,6}[ \t]*\**[ \t]*Topic[ \t]*:[ \t]*(.+?)[ \t]*$", re.MULTILINE | re.IGNORECASE)
+
+def _normalize_topic(topic: str) -> str:
+    return re.sub(r"\s+", " ", topic.strip(" \t*\"'`")).lower()
+
+def unique_topics(topics: List[str]) -> List[str]:
+    """Strip the topics and drop empty and repeated ones, keeping the first occurrence's order"""
+    seen = set()
+    result = []
+    for topic in topics:
+        topic = topic.strip()
+        if topic and _normalize_topic(topic) not in seen:
+            seen.add(_normalize_topic(topic))
+            result.append(topic)
+    return result
+
+def pack_topics(
+    contexts: List[str],
+    budget: int = BATCH_CONTEXT_BUDGET,
+    max_per_call: int = BATCH_TOPICS_PER_CALL
+) -> List[List[int]]:
+    """
+    Group topics so that each group's contexts fit one prompt.
+
+    Topics are taken in order and added to the current group while the
+    group's combined context stays within the budget; a topic whose context
+    alone exceeds the budget gets a group of its own.
+
+    Args:
+        contexts: Context of each topic
+        budget: Maximum combined context tokens per group
+        max_per_call: Maximum number of topics per group
+
+    Returns:
+        List[List[int]]: Groups of topic indices
+    """
+    groups = []
+    current, used = [], 0
+    for index, context in enumerate(contexts):
+        tokens = count_tokens(context)
+        if current and (used + tokens > budget or len(current) >= max_per_call):
+            groups.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def split_topic_sections(text: str, topics: List[str]) -> Dict[str, str]:
+    """
+    Split a multi-topic response into the answer for each topic.
+
+    Args:
+        text: The response, with a "### Topic: <name>" line before each topic's answer
+        topics: The topics that were asked for
+
+    Returns:
+        Dict[str, str]: Answer per topic; topics missing from the response are left out
+    """
+    by_name = {_normalize_topic(topic): topic for topic in topics}
+    headers = list(_TOPIC_HEADER.finditer(text))
+
+    sections = {}
+    for i, header in enumerate(headers):
+        topic = by_name.get(_normalize_topic(header.group(1)))
+        if topic is None or topic in sections:
+            continue
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        section = text[header.end():end].strip()
+        if section:
+            sections[topic] = section
+    return sections
+
+async def run_batch_tasks(
+    role: str,
+    task_factory: Callable,
+    batch_task_factory: Callable,
+    task_type: str,
+    topics: List[str],
+    contexts: List[str],
+    document_id: str,
+    route: Optional[str] = None,
+    deadline: Optional[float] = None,
+    request: Optional[Request] = None,
+    **options
+) -> List[Optional[str]]:
+    """
+    Generate a response for each topic, packing several topics into each LLM call.
+
+    Topics with a cached response are served from the response cache. The
+    rest are packed into groups (see pack_topics); groups run concurrently
+    within the route's concurrency limit. A packed response is split per
+    topic and each part is cached under the same key a single-topic request
+    would use. Topics missing from a packed response, and groups of one, run
+    as single-topic tasks. Topics not finished by the deadline are given
+    up on, so the topics that did finish can still be returned.
+
+    Args:
+        role: Registry role of the agent, e.g. "note_taker"
+        task_factory: Single-topic task constructor (agent, topic, context, **options)
+        batch_task_factory: Multi-topic task constructor (agent, topics, contexts, **options)
+        task_type: Response cache task type, e.g. "notes"
+        topics: Topics to generate for
+        contexts: Context of each topic
+        document_id: Document the contexts come from
+        route: Route name used to look up the concurrency limit
+        deadline: time.monotonic() value shared by all of the batch's calls
+        request: The HTTP request, watched for a client disconnect
+        **options: Extra task options, e.g. num_cards
+
+    Returns:
+        List[Optional[str]]: The response for each topic, or None where generation failed
+    """
+    keys = [
+        response_cache.make_key(task_type, topic, context, document_id, **options)
+        for topic, context in zip(topics, contexts)
+    ]
+    results = [await response_cache.get(key) for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    async def run_single(index: int):
+        try:
+            results[index] = await run_agent_task_async(
+                role, task_factory, topics[index], contexts[index],
+                route=route, cache_key=keys[index], deadline=deadline, request=request, **options
+            )
+        except Exception as e:
+            logger.error(f"Error generating {task_type} for topic '{topics[index]}': {str(e)}")
+
+    async def run_group(group: List[int]):
+        if len(group) == 1:
+            await run_single(group[0])
+            return
+
+        group_topics = [topics[i] for i in group]
+        try:
+            response = await run_agent_task_async(
+                role, batch_task_factory, group_topics, [contexts[i] for i in group],
+                route=route, deadline=deadline, request=request, **options
+            )
+            sections = split_topic_sections(response, group_topics)
+        except (DeadlineExceeded, RequestCancelled) as e:
+            # No time left to retry the group's topics one by one
+            logger.warning(f"Gave up on {task_type} for topics {group_topics}: {e.detail}")
+            return
+        except Exception as e:
+            logger.error(f"Error generating {task_type} for topics {group_topics}: {str(e)}")
+            sections = {}
+
+        missing = []
+        for i in group:
+            if topics[i] in sections:
+                results[i] = sections[topics[i]]
+                await response_cache.set(keys[i], results[i])
+            else:
+                missing.append(i)
+
+        if missing:
+            logger.warning(f"{len(missing)} of {len(group)} topics missing from the batched {task_type} response, "
+                           f"generating them one by one")
+            await asyncio.gather(*(run_single(i) for i in missing))
+
+    groups = [[pending[i] for i in group] for group in pack_topics([contexts[i] for i in pending])]
+    logger.info(f"Batch {task_type}: {len(topics) - len(pending)} cached, "
+                f"{len(pending)} topics in {len(groups)} LLM calls")
+    await asyncio.gather(*(run_group(group) for group in groups))
+    return results
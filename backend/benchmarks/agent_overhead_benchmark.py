@@ -0,0 +1,83 @@
+"""
+Agent request overhead micro-benchmark.
+
+Compares the per-request cost of the old path (build the agent with its
+create_*_agent factory, wrap it in a new Crew and kick it off) with the
+registry path (reuse the shared agent and execute the task directly).
+
+The LLM is replaced by a crewai LLM with a canned mock response, so the
+numbers only cover our own agent, task and crew orchestration overhead; no
+API key or network access is needed.
+
+Usage (from the backend directory):
+    python -m benchmarks.agent_overhead_benchmark [--requests 50] [--role note_taker]
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+
+from crewai import Crew, LLM, Process
+
+import agents
+from benchmarks.retrieval_benchmark import percentile
+
+STUB_RESPONSE = "Thought: I now know the final answer\nFinal Answer: Stub output for the benchmark."
+
+def stub_llm():
+    """Stand-in for get_llm that answers instantly without a network call"""
+    return LLM(model="openai/stub-model", api_key="benchmark", mock_response=STUB_RESPONSE)
+
+def create_task(agent):
+    return agents.create_notes_generation_task(agent, "binary search trees", "Sample context for the benchmark.")
+
+def run_legacy(role):
+    """Old request path: construct the agent and a Crew for every request"""
+    agent = agents.AGENT_FACTORIES[role]()
+    crew = Crew(agents=[agent], tasks=[create_task(agent)], verbose=False, process=Process.sequential)
+    return str(crew.kickoff())
+
+def run_registry(role):
+    """New request path: shared agent, task executed without a Crew"""
+    agent = agents.get_agent(role)
+    return agents.run_agent_task(agent, create_task(agent))
+
+def measure(name, func, role, requests):
+    func(role)  # warm-up, also populates the registry
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        func(role)
+        samples.append(time.perf_counter() - start)
+    print(f"{name:<10}{percentile(samples, 50) * 1000:>10.2f}{percentile(samples, 95) * 1000:>10.2f}"
+          f"{sum(samples) / len(samples) * 1000:>10.2f}")
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-request agent overhead")
+    parser.add_argument("--requests", type=int, default=50, help="Timed requests per path")
+    parser.add_argument("--role", default="note_taker", choices=sorted(agents.AGENT_FACTORIES))
+    args = parser.parse_args()
+
+    agents.get_llm = stub_llm
+
+    start = time.perf_counter()
+    agents.AGENT_FACTORIES[args.role]()
+    print(f"Agent construction: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    print(f"\nPer-request overhead ({args.requests} requests, role {args.role})")
+    print(f"{'path':<10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    legacy = measure("legacy", run_legacy, args.role, args.requests)
+    registry = measure("registry", run_registry, args.role, args.requests)
+    print(f"\nSpeed-up (mean): {sum(legacy) / sum(registry):.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Code analysis parser benchmark.
+
+Parses a corpus of recorded code analysis agent outputs with
+utils.parse_code_analysis and with the multi-regex parser it replaced,
+and reports the throughput of both. Every output must parse to exactly the
+same result as with the old parser; the benchmark exits with status 1 if
+any differs.
+
+No LLM is called, the corpus is read from code_analysis_outputs.json.
+
+Usage (from the backend directory):
+    python -m benchmarks.code_analysis_benchmark [--repeat 200] [--scale 1] [--output results.json]
+"""
+import re
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Callable, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from utils import parse_code_analysis
+
+CORPUS_FILE = Path(__file__).resolve().parent / "code_analysis_outputs.json"
+
+def legacy_parse_code_analysis(text):
+    """
+    The regex parser parse_code_analysis replaced, kept as the parity reference
+    
+    Args:
+        text: Raw text output from the debugging agent
+        
+    Returns:
+        dict: Structured analysis with bugs, optimizations, improved code, etc.
+    """
+    try:
+        # Initialize the structure for code analysis
+        analysis = {
+            "bugs": [],
+            "optimizations": [],
+            "improved_code": "",
+            "time_complexity": "",
+            "space_complexity": "",
+            "explanation": ""
+        }
+        
+        # Extract bugs section
+        bugs_pattern = re.compile(r"BUGS:?\s*(.*?)(?=OPTIMIZATIONS:|TIME_COMPLEXITY:|IMPROVED_CODE:|SPACE_COMPLEXITY:|EXPLANATION:|$)", re.DOTALL | re.IGNORECASE)
+        bugs_match = bugs_pattern.search(text)
+        if bugs_match:
+            bugs_text = bugs_match.group(1).strip()
+            # Extract individual bugs (bullet points or numbered)
+            bug_items = re.findall(r"(?:^|\n)(?:\d+\.|\*|-)\s*(.*?)(?=(?:\n(?:\d+\.|\*|-)|$))", bugs_text, re.DOTALL)
+            if bug_items:
+                analysis["bugs"] = [bug.strip() for bug in bug_items if bug.strip()]
+            else:
+                # If no bullet points found, split by newlines
+                analysis["bugs"] = [line.strip() for line in bugs_text.split("\n") if line.strip()]
+        
+        # Extract optimizations section
+        opt_pattern = re.compile(r"OPTIMIZATIONS:?\s*(.*?)(?=BUGS:|TIME_COMPLEXITY:|IMPROVED_CODE:|SPACE_COMPLEXITY:|EXPLANATION:|$)", re.DOTALL | re.IGNORECASE)
+        opt_match = opt_pattern.search(text)
+        if opt_match:
+            opt_text = opt_match.group(1).strip()
+            # Extract individual optimizations
+            opt_items = re.findall(r"(?:^|\n)(?:\d+\.|\*|-)\s*(.*?)(?=(?:\n(?:\d+\.|\*|-)|$))", opt_text, re.DOTALL)
+            if opt_items:
+                analysis["optimizations"] = [opt.strip() for opt in opt_items if opt.strip()]
+            else:
+                # If no bullet points found, split by newlines
+                analysis["optimizations"] = [line.strip() for line in opt_text.split("\n") if line.strip()]
+        
+        # Extract time complexity
+        time_pattern = re.compile(r"TIME_COMPLEXITY:?\s*(.*?)(?=BUGS:|OPTIMIZATIONS:|IMPROVED_CODE:|SPACE_COMPLEXITY:|EXPLANATION:|$)", re.DOTALL | re.IGNORECASE)
+        time_match = time_pattern.search(text)
+        if time_match:
+            analysis["time_complexity"] = time_match.group(1).strip()
+        
+        # Extract space complexity
+        space_pattern = re.compile(r"SPACE_COMPLEXITY:?\s*(.*?)(?=BUGS:|OPTIMIZATIONS:|TIME_COMPLEXITY:|IMPROVED_CODE:|EXPLANATION:|$)", re.DOTALL | re.IGNORECASE)
+        space_match = space_pattern.search(text)
+        if space_match:
+            analysis["space_complexity"] = space_match.group(1).strip()
+        
+        # Extract improved code section
+        code_pattern = re.compile(r"IMPROVED_CODE:?\s*(.*?)(?=BUGS:|OPTIMIZATIONS:|TIME_COMPLEXITY:|SPACE_COMPLEXITY:|EXPLANATION:|$)", re.DOTALL | re.IGNORECASE)
+        code_match = code_pattern.search(text)
+        if code_match:
+            code_text = code_match.group(1).strip()
+            # Remove code block markers if present
+            code_text = re.sub(r"^```\w*\n", "", code_text)
+            code_text = re.sub(r"\n```$", "", code_text)
+            analysis["improved_code"] = code_text.strip()
+        
+        # Extract explanation
+        explanation_pattern = re.compile(r"EXPLANATION:?\s*(.*?)(?=BUGS:|OPTIMIZATIONS:|TIME_COMPLEXITY:|SPACE_COMPLEXITY:|IMPROVED_CODE:|$)", re.DOTALL | re.IGNORECASE)
+        explanation_match = explanation_pattern.search(text)
+        if explanation_match:
+            analysis["explanation"] = explanation_match.group(1).strip()
+        
+        # If we couldn't extract any bugs but the analysis mentions issues, try to extract them from the explanation
+        if not analysis["bugs"] and analysis["explanation"]:
+            # Look for mention of issues in the explanation
+            if re.search(r'issue|bug|problem|incorrect|wrong|error|fail', analysis["explanation"], re.IGNORECASE):
+                # Split explanation into sentences
+                sentences = re.split(r'(?<=[.!?])\s+', analysis["explanation"])
+                # Filter sentences that seem to describe issues
+                for sentence in sentences:
+                    if re.search(r'issue|bug|problem|incorrect|wrong|error|fail', sentence, re.IGNORECASE):
+                        analysis["bugs"].append(sentence.strip())
+        
+        # If we couldn't find any improved code using structured parsing, try a more general approach
+        if not analysis["improved_code"]:
+            # Look for code blocks
+            code_blocks = re.findall(r"```(?:\w*\n)?(.*?)```", text, re.DOTALL)
+            if code_blocks:
+                # Use the largest code block found
+                analysis["improved_code"] = max(code_blocks, key=len).strip()
+        
+        return analysis
+        
+    except Exception as e:
+                return {
+            "bugs": ["Error occurred while parsing the analysis"],
+            "optimizations": [],
+            "improved_code": "",
+            "time_complexity": "",
+            "space_complexity": "",
+            "explanation": f"A parsing error occurred: {str(e)}"
+        }
+
+def measure(parse: Callable, outputs: List[str], repeat: int) -> float:
+    """Seconds per pass over the corpus, best of the repeats"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in outputs:
+            parse(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the code analysis parser against the legacy parser")
+    parser.add_argument("--corpus", type=Path, default=CORPUS_FILE, help="Recorded agent outputs")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed passes over the corpus")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="Repeat each output's explanation this many times, to test longer answers")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        outputs = json.load(f)["outputs"]
+    if args.scale > 1:
+        outputs = [text + ("\n" + text.rsplit("\n", 1)[-1]) * (args.scale - 1) for text in outputs]
+
+    mismatches = [
+        i for i, text in enumerate(outputs)
+        if parse_code_analysis(text) != legacy_parse_code_analysis(text)
+    ]
+
+    total_chars = sum(len(text) for text in outputs)
+    results = {}
+    for name, parse in (("legacy", legacy_parse_code_analysis), ("current", parse_code_analysis)):
+        seconds = measure(parse, outputs, args.repeat)
+        results[name] = {
+            "us_per_output": seconds / len(outputs) * 1e6,
+            "outputs_per_second": len(outputs) / seconds,
+            "mb_per_second": total_chars / seconds / 1e6
+        }
+
+    print(f"{len(outputs)} outputs, {total_chars} characters, best of {args.repeat} passes")
+    print(f"{'parser':<10}{'us/output':>12}{'outputs/s':>12}{'MB/s':>8}")
+    for name, stats in results.items():
+        print(f"{name:<10}{stats['us_per_output']:>12.1f}{stats['outputs_per_second']:>12.0f}"
+              f"{stats['mb_per_second']:>8.2f}")
+    speedup = results["legacy"]["us_per_output"] / results["current"]["us_per_output"]
+    print(f"Speedup: {speedup:.2f}x")
+    print(f"Parity: {len(outputs) - len(mismatches)}/{len(outputs)} outputs parse identically")
+    for i in mismatches:
+        print(f"  differs: output {i}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "outputs": len(outputs),
+                "characters": total_chars,
+                "repeat": args.repeat,
+                "scale": args.scale,
+                "parsers": results,
+                "speedup": speedup,
+                "mismatches": mismatches
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
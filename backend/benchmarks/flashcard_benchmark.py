@@ -0,0 +1,137 @@
+"""
+Flashcard normalization benchmark.
+
+Builds percentage-heavy flashcard decks in the formats models answer with
+(a JSON array, a {"cards": [...]} object, Q/A text and Card/Front/Back
+text), runs them through parse_flashcards_from_text and
+normalize_flashcards, and checks that every card comes back exactly as
+written, "%" signs included. The benchmark exits with status 1 if any card
+differs.
+
+It also times the pipeline against the one it replaced, which escaped "%"
+as "%%" four times between the raw answer and the saved deck.
+
+No LLM is called.
+
+Usage (from the backend directory):
+    python -m benchmarks.flashcard_benchmark [--decks 50] [--cards 40] [--repeat 20] [--output results.json]
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from utils import parse_flashcards_from_text, normalize_flashcards
+
+# Card text with percentages, printf-style specifiers and already doubled signs
+PERCENT_PHRASES = [
+    "50%", "99.9% uptime", "a 5% fee on 20% of orders is 1%", "100%% sure", "%s", "%d items",
+    "%(name)s", "%%", "%", "cpu at 100%", "between 10% and 15%", "p99 latency (99th percentile, %ile)",
+]
+WORDS = ["cache", "index", "query", "replica", "shard", "latency", "throughput", "heap", "tree", "hash"]
+
+def random_text(rng: random.Random, sentence_end: str) -> str:
+    # Lowercase, as the text patterns take any capital Q or A for a label
+    parts = [rng.choice(WORDS) for _ in range(rng.randint(3, 8))]
+    for _ in range(rng.randint(1, 3)):
+        parts.insert(rng.randrange(len(parts) + 1), rng.choice(PERCENT_PHRASES))
+    return " ".join(parts) + sentence_end
+
+def random_deck(rng: random.Random, cards: int) -> List[Dict[str, str]]:
+    return [{"front": random_text(rng, "?"), "back": random_text(rng, ".")} for _ in range(cards)]
+
+FORMATS: Dict[str, Callable[[List[Dict[str, str]]], str]] = {
+    "json_array": lambda deck: json.dumps(deck, indent=2),
+    "json_cards": lambda deck: json.dumps({"cards": deck}),
+    "qa_text": lambda deck: "\n\n".join(f"Q: {card['front']}\nA: {card['back']}" for card in deck),
+    "card_text": lambda deck: "\n\n".join(
+        f"Card {i}:\nFront: {card['front']}\nBack: {card['back']}" for i, card in enumerate(deck, 1)
+    ),
+}
+
+def current_pipeline(text: str) -> List[Dict[str, str]]:
+    return normalize_flashcards(parse_flashcards_from_text(text))
+
+def legacy_pipeline(text: str) -> List[Dict[str, str]]:
+    """
+    The escaping the old pipeline did around the same parser, kept as the timing reference:
+    the router and the parser each escaped the raw answer, then the parser and the router
+    each escaped every card again before the label cleanup
+    """
+    text = text.replace("%", "%%").replace("%", "%%")
+    cards = []
+    for card in parse_flashcards_from_text(text):
+        valid_card = {
+            "front": str(card.get("front", "")).replace("%", "%%").replace("%", "%%").strip(),
+            "back": str(card.get("back", "")).replace("%", "%%").replace("%", "%%").strip()
+        }
+        for side in ["front", "back"]:
+            content = valid_card[side]
+            content = re.sub(r'^Card\s*\d+:?\s*', '', content)
+            content = re.sub(r'^(Front|Back):\s*', '', content)
+            content = re.sub(r'^(Question|Answer):\s*', '', content)
+            valid_card[side] = content.strip()
+        if valid_card["front"] and valid_card["back"]:
+            cards.append(valid_card)
+    return cards
+
+def measure(pipeline: Callable[[str], List[Dict[str, str]]], outputs: List[str], repeat: int) -> float:
+    """Best time in seconds of one pass over the outputs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in outputs:
+            pipeline(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark flashcard parsing on percentage-heavy decks")
+    parser.add_argument("--decks", type=int, default=50, help="Decks per format")
+    parser.add_argument("--cards", type=int, default=40, help="Cards per deck")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed passes over the decks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {}
+    failed = False
+    print(f"{args.decks} decks of {args.cards} cards per format, best of {args.repeat} passes")
+    print(f"{'format':<12}{'exact':>10}{'legacy ms':>12}{'current ms':>12}{'speedup':>9}")
+    for name, render in FORMATS.items():
+        decks = [random_deck(rng, args.cards) for _ in range(args.decks)]
+        outputs = [render(deck) for deck in decks]
+
+        mismatches = [i for i, (deck, text) in enumerate(zip(decks, outputs)) if current_pipeline(text) != deck]
+        failed = failed or bool(mismatches)
+        legacy = measure(legacy_pipeline, outputs, args.repeat)
+        current = measure(current_pipeline, outputs, args.repeat)
+        results[name] = {
+            "exact": len(decks) - len(mismatches),
+            "mismatches": mismatches,
+            "legacy_ms": legacy * 1e3,
+            "current_ms": current * 1e3,
+            "speedup": legacy / current
+        }
+        print(f"{name:<12}{len(decks) - len(mismatches):>6}/{len(decks):<3}{legacy * 1e3:>12.2f}"
+              f"{current * 1e3:>12.2f}{legacy / current:>8.2f}x")
+        for i in mismatches[:5]:
+            print(f"  differs: deck {i}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"decks": args.decks, "cards": args.cards, "repeat": args.repeat, "formats": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Concurrent request load test for the agent-backed endpoints.
+
+Sends batches of concurrent /api/chat/chat requests and reports throughput,
+latency percentiles and the worst event loop stall seen while they ran.
+
+By default the app runs in-process with the LLM replaced by a crewai mock
+that answers after --llm-delay seconds, so the numbers show how well slow
+LLM calls overlap. With --no-mock the in-process app uses the configured
+provider, e.g. the local stub server, which also exercises the HTTP path to
+the model. Pass --url to load test a running server instead.
+
+Usage (from the backend directory):
+    python -m benchmarks.load_test [--concurrency 1 4 8 16] [--requests 32] [--llm-delay 0.5]
+    LLM_PROVIDER=stub python -m benchmarks.load_test --no-mock
+    python -m benchmarks.load_test --url http://localhost:8000
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+
+import httpx
+
+from benchmarks.retrieval_benchmark import percentile
+
+STUB_RESPONSE = "Thought: I now know the final answer\nFinal Answer: Stub answer for the load test."
+
+def create_app(llm_delay: float, mock: bool = True):
+    """Import the app, with the LLM replaced by a delayed mock unless mock is False"""
+    if mock:
+        from crewai import LLM
+        import agents
+
+        agents.get_llm = lambda: LLM(
+            model="openai/stub-model", api_key="benchmark",
+            mock_response=STUB_RESPONSE, mock_delay=llm_delay
+        )
+
+    from main import app
+    return app
+
+async def monitor_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Track the largest delay between scheduled and actual wake-ups of the event loop"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+async def send_request(client: httpx.AsyncClient, index: int) -> float:
+    payload = {"messages": [{"role": "user", "content": f"Explain binary search ({index})"}]}
+    start = time.perf_counter()
+    response = await client.post("/api/chat/chat", json=payload)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, requests: int) -> dict:
+    """Run the requests with at most `concurrency` of them in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(index):
+        async with semaphore:
+            return await send_request(client, index)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(stop))
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(limited(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    max_lag = await lag_task
+
+    return {
+        "concurrency": concurrency,
+        "throughput": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "max_loop_lag_ms": max_lag * 1000
+    }
+
+async def main_async(args):
+    if args.url:
+        transport = None
+        base_url = args.url
+    else:
+        transport = httpx.ASGITransport(app=create_app(args.llm_delay, mock=not args.no_mock))
+        base_url = "http://loadtest"
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout) as client:
+        await send_request(client, -1)  # warm-up
+
+        print(f"{'concurrency':>12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'loop lag ms':>13}")
+        for concurrency in args.concurrency:
+            result = await run_level(client, concurrency, args.requests)
+            print(f"{result['concurrency']:>12}{result['throughput']:>10.2f}{result['p50_ms']:>10.1f}"
+                  f"{result['p95_ms']:>10.1f}{result['max_loop_lag_ms']:>13.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test concurrent agent requests")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16], help="Requests in flight")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--llm-delay", type=float, default=0.5, help="Simulated LLM latency in seconds")
+    parser.add_argument("--no-mock", action="store_true", help="Use the configured LLM provider in-process")
+    parser.add_argument("--url", help="Base URL of a running server (skips the in-process mock)")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
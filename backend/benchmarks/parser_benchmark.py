@@ -0,0 +1,302 @@
+"""
+LLM output parser benchmark and fuzz suite.
+
+Runs every free-text parser in utils (tests, flashcards, roadmaps, DSA
+questions and code analyses) on three kinds of input:
+
+- recorded: the agent outputs in parser_outputs.json and
+  code_analysis_outputs.json, to measure throughput on realistic answers
+- fuzz: seeded random mutations of the recorded outputs (truncation,
+  repeated and shuffled lines, stray headers and markers, lost newlines)
+- pathological: synthetic inputs up to 100 KB, such as long runs of
+  newlines, markdown hashes or unanswered "Q" markers, built at each of
+  --sizes to expose regexes whose running time grows faster than the input
+
+Each parse runs in a child process and is killed once it exceeds the time
+limit. A case is flagged when it times out, when a parser raises, or when
+a pathological input's parse time grows faster than size^--max-exponent
+between the two largest sizes (an exponent of 1 is linear, 2 quadratic).
+The benchmark exits with status 1 if any case is flagged.
+
+Usage (from the backend directory):
+    python -m benchmarks.parser_benchmark [--time-limit 5] [--sizes 10000,100000] [--fuzz-cases 200]
+        [--parsers tests,flashcards] [--output results.json]
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import multiprocessing
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from utils import (
+    parse_test_from_text, parse_flashcards_from_text, parse_roadmap_from_text,
+    parse_dsa_questions_from_text, parse_code_analysis
+)
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+CORPUS_FILES = [BENCHMARK_DIR / "parser_outputs.json", BENCHMARK_DIR / "code_analysis_outputs.json"]
+
+PARSERS: Dict[str, Callable] = {
+    "tests": parse_test_from_text,
+    "flashcards": parse_flashcards_from_text,
+    "roadmap": parse_roadmap_from_text,
+    "dsa_questions": parse_dsa_questions_from_text,
+    "code_analysis": parse_code_analysis,
+}
+
+# Markers the parsers look for, inserted at random by the fuzzer
+MARKERS = [
+    "Q:", "A:", "Question 1:", "Answer 2)", "Card 3:", "Front:", "Back:", "Day 4:", "Topics:", "3 hours",
+    "## Questions", "## Answer Key", "# Overview", "# Milestones", "# Sections", "Difficulty:", "Description:",
+    "BUGS:", "EXPLANATION:", "IMPROVED_CODE:", "```", "- ", "* ", "1. ", "a) ", "{", "[", "\"front\":", "->", "#",
+]
+
+def _repeat_to(unit: str, size: int) -> str:
+    return (unit * (size // len(unit) + 1))[:size]
+
+# Synthetic inputs of a given size, each aimed at patterns that scan ahead for a marker that never comes
+PATHOLOGICAL: Dict[str, Callable[[int], str]] = {
+    "newlines": lambda size: "\n" * size,
+    "spaces": lambda size: " " * size,
+    "hashes": lambda size: "#" * size,
+    "unanswered_q": lambda size: _repeat_to("Q", size),
+    "numbered_lines": lambda size: _repeat_to("1. x\n", size),
+    "question_headers": lambda size: _repeat_to("Question 1: t\n", size),
+    "day_markers": lambda size: _repeat_to("Day 1 ", size),
+    "bullets": lambda size: _repeat_to("- ", size),
+    "option_lines": lambda size: _repeat_to("\nA. x", size),
+    "colon_lines": lambda size: _repeat_to("ab: c\n", size),
+    "prose": lambda size: _repeat_to("The algorithm visits every node once and stores its parent. ", size),
+    "unclosed_json": lambda size: "[" + _repeat_to('{"front": "x", "back": "y"}, ', size - 1),
+}
+
+def load_corpus(files: List[Path]) -> Dict[str, List[str]]:
+    """Recorded outputs per parser"""
+    corpus = {name: [] for name in PARSERS}
+    for path in files:
+        with open(path) as f:
+            data = json.load(f)
+        if "outputs" in data:
+            corpus["code_analysis"].extend(data["outputs"])
+        for name, outputs in data.items():
+            if name in corpus:
+                corpus[name].extend(outputs)
+    return corpus
+
+def mutate(text: str, rng: random.Random, max_size: int) -> str:
+    """A random malformed variant of a recorded output"""
+    lines = text.split("\n")
+    kind = rng.choice(["truncate", "repeat", "shuffle", "markers", "join", "drop", "stack"])
+    if kind == "truncate":
+        return text[:rng.randint(0, len(text))]
+    if kind == "repeat":
+        start = rng.randrange(len(lines))
+        block = lines[start:start + rng.randint(1, 5)]
+        lines[start:start] = block * rng.randint(2, max(2, max_size // max(len("\n".join(block)), 1) // 4))
+    elif kind == "shuffle":
+        rng.shuffle(lines)
+    elif kind == "markers":
+        for _ in range(rng.randint(1, 20)):
+            lines.insert(rng.randint(0, len(lines)), rng.choice(MARKERS) + rng.choice(["", " ", "\n", " x"]))
+    elif kind == "join":
+        return text.replace("\n", rng.choice(["", " "]))
+    elif kind == "drop":
+        lines = [line for line in lines if rng.random() > 0.3]
+    else:
+        # Several answers run together, as when a model repeats itself
+        return (text + "\n") * rng.randint(2, max(2, max_size // max(len(text), 1)))
+    return "\n".join(lines)[:max_size]
+
+def _serve(conn):
+    # The flashcard parser prints its progress
+    sys.stdout = open(os.devnull, "w")
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        name, text = message
+        start = time.perf_counter()
+        try:
+            PARSERS[name](text)
+            conn.send((time.perf_counter() - start, None))
+        except Exception as e:
+            conn.send((time.perf_counter() - start, f"{type(e).__name__}: {e}"))
+
+class ParserWorker:
+    """Runs parses in a child process, which is killed and replaced when a parse exceeds the time limit"""
+
+    def __init__(self):
+        # Forked children inherit the imported parsers and start instantly; elsewhere they are spawned
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        self._start()
+
+    def _start(self):
+        self._conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(target=_serve, args=(child_conn,), daemon=True)
+        self._process.start()
+
+    def run(self, name: str, text: str, time_limit: float) -> Dict[str, Optional[float]]:
+        """Parse text; "seconds" is None if the parse hit the time limit, "error" is set if the parser raised"""
+        self._conn.send((name, text))
+        if not self._conn.poll(time_limit):
+            self._process.kill()
+            self._process.join()
+            self._start()
+            return {"seconds": None, "error": None}
+        seconds, error = self._conn.recv()
+        return {"seconds": seconds, "error": error}
+
+    def close(self):
+        self._conn.send(None)
+        self._process.join(timeout=5)
+
+def growth_exponent(sizes: List[int], seconds: List[float]) -> Optional[float]:
+    """How parse time scales between the two largest sizes: 1 is linear, 2 quadratic"""
+    (small, large), (t_small, t_large) = sizes[-2:], seconds[-2:]
+    # Timings under 10 ms are too noisy to extrapolate from
+    if t_large < 0.01 or t_small <= 0:
+        return None
+    return math.log(t_large / t_small) / math.log(large / small)
+
+def bench_recorded(worker: ParserWorker, name: str, outputs: List[str], args) -> Dict:
+    seconds, flagged = [], []
+    for index, text in enumerate(outputs):
+        best = None
+        for _ in range(args.repeat):
+            result = worker.run(name, text, args.time_limit)
+            if result["seconds"] is None:
+                flagged.append({"case": f"recorded[{index}]", "size": len(text), "reason": "timeout"})
+                break
+            best = result["seconds"] if best is None else min(best, result["seconds"])
+        if best is not None:
+            seconds.append(best)
+    total = sum(seconds)
+    characters = sum(len(text) for text in outputs)
+    return {
+        "outputs": len(outputs),
+        "us_per_output": total / len(seconds) * 1e6 if seconds else None,
+        "mb_per_second": characters / total / 1e6 if total else None,
+        "flagged": flagged,
+    }
+
+def bench_fuzz(worker: ParserWorker, name: str, outputs: List[str], args) -> Dict:
+    rng = random.Random(f"{args.seed}-{name}")
+    slowest, flagged = {"seconds": 0.0, "size": 0}, []
+    for index in range(args.fuzz_cases):
+        text = mutate(rng.choice(outputs), rng, max(args.sizes))
+        result = worker.run(name, text, args.time_limit)
+        if result["seconds"] is None:
+            flagged.append({"case": f"fuzz[{index}]", "size": len(text), "reason": "timeout", "sample": text[:200]})
+        elif result["seconds"] > slowest["seconds"]:
+            slowest = {"seconds": result["seconds"], "size": len(text)}
+        if result["error"]:
+            # Parsers are expected to catch their own errors
+            flagged.append({"case": f"fuzz[{index}]", "size": len(text), "reason": result["error"],
+                            "sample": text[:200]})
+    return {"cases": args.fuzz_cases, "slowest": slowest, "flagged": flagged}
+
+def bench_pathological(worker: ParserWorker, name: str, args) -> Dict:
+    results, flagged = {}, []
+    for generator, build in PATHOLOGICAL.items():
+        timings = []
+        for size in args.sizes:
+            # Larger inputs can't finish if a smaller one already ran out of time
+            result = worker.run(name, build(size), args.time_limit) if None not in timings else {"seconds": None}
+            timings.append(result["seconds"])
+
+        exponent = growth_exponent(args.sizes, timings) if None not in timings else None
+        results[generator] = {"seconds": timings, "exponent": exponent}
+        if None in timings:
+            size = args.sizes[timings.index(None)]
+            flagged.append({"case": generator, "size": size, "reason": "timeout"})
+        elif exponent is not None and exponent > args.max_exponent:
+            flagged.append({"case": generator, "size": args.sizes[-1],
+                            "reason": f"parse time grows as size^{exponent:.1f}"})
+    return {"inputs": results, "flagged": flagged}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and fuzz the LLM output parsers")
+    parser.add_argument("--parsers", default=",".join(PARSERS), help="Comma-separated parsers to run")
+    parser.add_argument("--time-limit", type=float, default=5.0, help="Seconds a single parse may take")
+    parser.add_argument("--sizes", default="10000,100000", help="Pathological input sizes in characters")
+    parser.add_argument("--max-exponent", type=float, default=1.5,
+                        help="Flag pathological inputs whose parse time grows faster than size^N")
+    parser.add_argument("--fuzz-cases", type=int, default=200, help="Mutated outputs per parser")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed parses per recorded output")
+    parser.add_argument("--seed", type=int, default=0, help="Fuzzer seed")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    args = parser.parse_args()
+    args.sizes = sorted(int(size) for size in args.sizes.split(","))
+    if len(args.sizes) < 2:
+        parser.error("--sizes needs at least two sizes")
+    names = [name.strip() for name in args.parsers.split(",")]
+    unknown = set(names) - set(PARSERS)
+    if unknown:
+        parser.error(f"Unknown parsers: {', '.join(sorted(unknown))} (expected {', '.join(PARSERS)})")
+
+    corpus = load_corpus(CORPUS_FILES)
+    worker = ParserWorker()
+    results = {}
+    try:
+        for name in names:
+            start = time.perf_counter()
+            results[name] = {
+                "recorded": bench_recorded(worker, name, corpus[name], args),
+                "fuzz": bench_fuzz(worker, name, corpus[name], args),
+                "pathological": bench_pathological(worker, name, args),
+            }
+            print(f"{name}: done in {time.perf_counter() - start:.1f}s", flush=True)
+    finally:
+        worker.close()
+
+    print(f"\nRecorded outputs (best of {args.repeat}) and fuzzing ({args.fuzz_cases} cases, seed {args.seed})")
+    print(f"{'parser':<15}{'outputs':>8}{'us/output':>12}{'MB/s':>8}{'slowest fuzz ms':>17}{'flagged':>9}")
+    for name, result in results.items():
+        recorded, fuzz = result["recorded"], result["fuzz"]
+        flagged = sum(len(result[kind]["flagged"]) for kind in result)
+        us = f"{recorded['us_per_output']:.1f}" if recorded["us_per_output"] is not None else "-"
+        mbps = f"{recorded['mb_per_second']:.2f}" if recorded["mb_per_second"] is not None else "-"
+        print(f"{name:<15}{recorded['outputs']:>8}{us:>12}{mbps:>8}"
+              f"{fuzz['slowest']['seconds'] * 1000:>17.1f}{flagged:>9}")
+
+    sizes = " / ".join(f"{size // 1000}K" for size in args.sizes)
+    print(f"\nPathological inputs: seconds at {sizes}, growth exponent (limit {args.time_limit:g}s per parse)")
+    for name, result in results.items():
+        for generator, timing in result["pathological"]["inputs"].items():
+            seconds = " / ".join("timeout" if s is None else f"{s:.3f}" for s in timing["seconds"])
+            exponent = f"{timing['exponent']:.1f}" if timing["exponent"] is not None else "-"
+            print(f"  {name:<15}{generator:<18}{seconds:<28}{exponent:>5}")
+
+    flagged = [
+        {"parser": name, "kind": kind, **case}
+        for name, result in results.items() for kind in result for case in result[kind]["flagged"]
+    ]
+    print(f"\n{len(flagged)} flagged cases")
+    for case in flagged:
+        print(f"  {case['parser']:<15}{case['kind']:<14}{case['case']:<18}{case['size']:>8}  {case['reason']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "time_limit": args.time_limit,
+                "sizes": args.sizes,
+                "fuzz_cases": args.fuzz_cases,
+                "seed": args.seed,
+                "parsers": results,
+                "flagged": flagged
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    sys.exit(1 if flagged else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Prompt size report for the task templates and agent backstories.
+
+Prints the token count of every template's static part and of a rendered
+task with sample inputs, for the full and compact variants, followed by
+the system prompt size of the agents with compact backstories.
+
+Usage (from the backend directory):
+    python -m benchmarks.prompt_tokens
+"""
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from context_builder import count_tokens
+from prompts import BACKSTORIES, PROMPT_VARIANTS, TEMPLATES, measure_templates, render_prompt
+
+SAMPLE_CONTEXT = (
+    "A binary search tree is a rooted binary tree in which every node's key is greater than "
+    "all keys in its left subtree and less than all keys in its right subtree. Searching, "
+    "insertion and deletion take time proportional to the height of the tree. "
+) * 8
+
+SAMPLE_INPUTS = {
+    "explanation": {"question": "How does deletion work in a binary search tree?"},
+    "notes": {"topic": "Binary search trees"},
+    "tests": {"topic": "Binary search trees", "difficulty": "Medium"},
+    "flashcards": {"topic": "Binary search trees", "num_cards": 10},
+    "mindmaps": {"topic": "Binary search trees"},
+    "notes_batch": {"topics": "Binary search trees, Heaps"},
+    "flashcards_batch": {"topics": "Binary search trees, Heaps", "num_cards": 10},
+}
+
+def savings(full: int, compact: int) -> str:
+    return f"{(1 - compact / full) * 100:.0f}%" if full else "-"
+
+def main():
+    static = measure_templates()
+    context_tokens = count_tokens(SAMPLE_CONTEXT)
+
+    print(f"Task templates (sample context: {context_tokens} tokens)")
+    print(f"{'template':<18}{'static full':>12}{'compact':>9}{'saved':>7}{'rendered full':>15}{'compact':>9}{'saved':>7}")
+    for name in TEMPLATES:
+        rendered = {
+            variant: count_tokens(render_prompt(name, context=SAMPLE_CONTEXT, variant=variant, **SAMPLE_INPUTS[name]))
+            for variant in PROMPT_VARIANTS
+        }
+        print(f"{name:<18}{static[name]['full']:>12}{static[name]['compact']:>9}"
+              f"{savings(static[name]['full'], static[name]['compact']):>7}"
+              f"{rendered['full']:>15}{rendered['compact']:>9}{savings(rendered['full'], rendered['compact']):>7}")
+
+    print("\nAgent backstories")
+    print(f"{'agent':<24}{'full':>8}{'compact':>9}{'saved':>7}")
+    for role, variants in BACKSTORIES.items():
+        full, compact = count_tokens(variants["full"]), count_tokens(variants["compact"])
+        print(f"{role:<24}{full:>8}{compact:>9}{savings(full, compact):>7}")
+
+if __name__ == "__main__":
+    main()
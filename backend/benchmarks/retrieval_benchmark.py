@@ -0,0 +1,219 @@
+"""
+Retrieval quality and latency benchmark.
+
+Ingests the bundled sample documents, runs the labelled query set in
+retrieval_queries.json and reports p50/p95 latency per retrieval stage
+together with recall@k against the labelled pages.
+
+No LLM is called: the answer stage uses a stub that returns immediately, so
+the numbers only cover our own retrieval and prompt assembly overhead. With
+the embedding model already in the HuggingFace cache the benchmark runs
+fully offline.
+
+Usage (from the backend directory):
+    python -m benchmarks.retrieval_benchmark [--k 5] [--repeat 3] [--output results.json]
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+from pathlib import Path
+from typing import Dict, List, Set
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Use the locally cached embedding model, never the network
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import utils
+from context_builder import build_context
+from retrieval_cache import retrieval_cache
+
+QUERIES_FILE = Path(__file__).resolve().parent / "retrieval_queries.json"
+STAGES = ["load", "embed", "search", "preprocess", "pack", "answer", "chapter"]
+
+_WHITESPACE = re.compile(r"\s+")
+_CHAPTER_QUERY = re.compile(r"chapter\s+(\d+)", re.IGNORECASE)
+
+def stub_llm(prompt: str) -> str:
+    """Stand-in for the LLM so the benchmark needs no API key or network"""
+    return "Stub answer based on %d characters of prompt." % len(prompt)
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentile with linear interpolation between closest ranks"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+class PageLocator:
+    """Map retrieved chunk text back to the 1-based pages it came from"""
+
+    def __init__(self, text_by_page: List[str]):
+        self.pages = [_normalize(page) for page in text_by_page]
+
+    def locate(self, chunk: str) -> Set[int]:
+        found = set()
+        for segment in chunk.split("---PAGE BREAK---"):
+            segment = _normalize(segment)
+            if len(segment) < 20:
+                continue
+            # Probe along the whole segment, long contexts such as chapters span many pages
+            probes = {segment[i:i + 60] for i in range(0, max(len(segment) - 60, 1), 400)}
+            probes.add(segment[-60:])
+            for probe in probes:
+                for number, page in enumerate(self.pages, 1):
+                    if probe in page:
+                        found.add(number)
+        return found
+
+def ingest(documents: Dict[str, str], storage_dir: Path) -> Dict[str, dict]:
+    """Process and index the benchmark documents into an isolated storage directory"""
+    utils.CACHE_DIR = storage_dir / "cache"
+    utils.VECTORSTORE_DIR = storage_dir / "vectorstores"
+    utils.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    utils.VECTORSTORE_DIR.mkdir(parents=True, exist_ok=True)
+
+    ingested = {}
+    for name, relative_path in documents.items():
+        path = BACKEND_DIR / relative_path
+        start = time.perf_counter()
+        doc_info = utils.process_document(str(path))
+        processed = time.perf_counter()
+        if not (utils.VECTORSTORE_DIR / doc_info["id"]).exists():
+            utils.create_vector_store(doc_info)
+        indexed = time.perf_counter()
+        print(f"Ingested {name}: {doc_info['pages']} pages "
+              f"(extract {processed - start:.2f}s, index {indexed - processed:.2f}s)")
+        ingested[name] = doc_info
+    return ingested
+
+def run_query(query: dict, doc_info: dict, locator: PageLocator, k: int, timings: Dict[str, List[float]]) -> Set[int]:
+    """Run one query through the retrieval stages and return the pages it retrieved"""
+    doc_id = doc_info["id"]
+
+    # Cold load: drop the in-process store cache so the pickle and index load are measured
+    retrieval_cache.clear()
+    start = time.perf_counter()
+    vector_store = utils.load_vector_store(doc_id)
+    timings["load"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    embedding = utils.get_embeddings().embed_query(query["query"])
+    timings["embed"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    docs = vector_store.similarity_search_by_vector(embedding, k=k)
+    timings["search"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    utils.preprocess_document_context("\n".join(doc.page_content for doc in docs))
+    timings["preprocess"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    context = build_context([doc.page_content for doc in docs], task="chat")
+    timings["pack"].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    stub_llm(f"Question: {query['query']}\n\nContext information:\n{context}")
+    timings["answer"].append(time.perf_counter() - start)
+
+    pages = set()
+    for doc in docs:
+        pages |= locator.locate(doc.page_content)
+
+    if _CHAPTER_QUERY.search(query["query"]):
+        retrieval_cache.clear()
+        start = time.perf_counter()
+        chapter_context = utils.get_chapter_specific_context(query["query"], doc_id, top_k=k)
+        timings["chapter"].append(time.perf_counter() - start)
+        pages |= locator.locate(chapter_context)
+
+    return pages
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document retrieval quality and latency")
+    parser.add_argument("--queries", type=Path, default=QUERIES_FILE, help="Labelled query set")
+    parser.add_argument("--k", type=int, default=5, help="Chunks retrieved per query")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions per query")
+    parser.add_argument("--storage-dir", type=Path, default=BACKEND_DIR / "storage" / "benchmark",
+                        help="Isolated storage for the benchmark's caches and indexes")
+    parser.add_argument("--clean", action="store_true", help="Re-ingest documents from scratch")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    with open(args.queries) as f:
+        spec = json.load(f)
+
+    if args.clean and args.storage_dir.exists():
+        shutil.rmtree(args.storage_dir)
+
+    start = time.perf_counter()
+    utils.get_embeddings()
+    print(f"Embedding model loaded in {time.perf_counter() - start:.2f}s")
+
+    documents = ingest(spec["documents"], args.storage_dir)
+    locators = {name: PageLocator(doc["text_by_page"]) for name, doc in documents.items()}
+
+    timings = {stage: [] for stage in STAGES}
+    per_query = []
+    for query in spec["queries"]:
+        relevant = set(query["relevant_pages"])
+        retrieved = set()
+        for _ in range(args.repeat):
+            retrieved = run_query(query, documents[query["document"]], locators[query["document"]], args.k, timings)
+        found = retrieved & relevant
+        per_query.append({
+            "document": query["document"],
+            "query": query["query"],
+            "recall": len(found) / len(relevant),
+            "hit": bool(found),
+            "retrieved_pages": sorted(retrieved)
+        })
+
+    latency = {
+        stage: {
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "samples": len(values)
+        }
+        for stage, values in timings.items() if values
+    }
+    mean_recall = sum(q["recall"] for q in per_query) / len(per_query)
+    hit_rate = sum(q["hit"] for q in per_query) / len(per_query)
+
+    print(f"\nLatency per stage (k={args.k}, {args.repeat} runs per query)")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'n':>6}")
+    for stage, stats in latency.items():
+        print(f"{stage:<12}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['samples']:>6}")
+
+    print(f"\nRecall@{args.k} against labelled pages")
+    for result in per_query:
+        print(f"  {result['recall']:.2f}  [{result['document']}] {result['query']}")
+    print(f"Mean recall@{args.k}: {mean_recall:.3f}   hit rate: {hit_rate:.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "k": args.k,
+                "repeat": args.repeat,
+                "latency": latency,
+                "mean_recall": mean_recall,
+                "hit_rate": hit_rate,
+                "queries": per_query
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
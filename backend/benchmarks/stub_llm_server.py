@@ -0,0 +1,169 @@
+"""
+Local OpenAI-compatible stub LLM server.
+
+Serves /v1/chat/completions (streaming and non-streaming) and /v1/models
+with canned answers after a configurable latency, so the whole backend
+can run and be load tested offline. Point the backend at it with:
+
+    LLM_PROVIDER=stub STUB_LLM_URL=http://127.0.0.1:8001/v1 python main.py
+
+Requests to CrewAI agents get their answer in the ReAct format the agent
+executor parses ("Thought: ... Final Answer: ..."); plain chat requests,
+such as the streaming endpoints, get the answer text alone. Requests with a
+JSON response_format, or a JSON schema in the prompt, get a JSON object
+built from that schema.
+
+Usage (from the backend directory):
+    python -m benchmarks.stub_llm_server [--port 8001] [--latency 0.5] [--tokens-per-second 200]
+"""
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="Stub LLM")
+
+settings = {"latency": 0.5, "tokens_per_second": 200.0, "words": 120}
+
+ANSWER_WORDS = (
+    "## Overview\n\nThis is a stub response from the local test server. "
+    "It stands in for a real model so that request handling, retrieval and parsing "
+    "can be measured without network access or model latency.\n\n"
+    "- **Key point**: The content is fixed and deterministic.\n"
+    "- **Example**: Binary search halves the search interval at each step.\n"
+).split(" ")
+
+def build_answer(messages: List[Dict[str, Any]]) -> str:
+    words = (ANSWER_WORDS * (settings["words"] // len(ANSWER_WORDS) + 1))[:settings["words"]]
+    answer = " ".join(words)
+
+    # CrewAI agents only accept answers in their ReAct format
+    prompt = " ".join(str(message.get("content", "")) for message in messages)
+    if "Final Answer:" in prompt:
+        return f"Thought: I now know the final answer\nFinal Answer: {answer}"
+    return answer
+
+# Prompt text introducing the schema in JSON mode (see structured_output.schema_instructions)
+SCHEMA_MARKER = "matching this JSON schema:\n"
+
+def example_value(schema: Dict[str, Any], defs: Dict[str, Any]) -> Any:
+    """A small value matching a JSON schema"""
+    if "$ref" in schema:
+        return example_value(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+    if "anyOf" in schema:
+        return example_value(schema["anyOf"][0], defs)
+    kind = schema.get("type")
+    if kind == "object":
+        if "properties" in schema:
+            return {name: example_value(prop, defs) for name, prop in schema["properties"].items()}
+        return {"1": example_value(schema.get("additionalProperties") or {"type": "string"}, defs)}
+    if kind == "array":
+        return [example_value(schema.get("items", {"type": "string"}), defs) for _ in range(2)]
+    if kind in ("integer", "number"):
+        return 1
+    if kind == "boolean":
+        return True
+    return "Stub answer"
+
+def build_json_answer(body: Dict[str, Any]) -> str:
+    response_format = body.get("response_format") or {}
+    schema = response_format.get("json_schema", {}).get("schema")
+    if schema is None:
+        for message in body.get("messages", []):
+            content = str(message.get("content", ""))
+            if SCHEMA_MARKER in content:
+                schema = json.loads(content.split(SCHEMA_MARKER, 1)[1].split("\n", 1)[0])
+                break
+    if schema is None:
+        return json.dumps({"answer": "Stub answer"})
+    return json.dumps(example_value(schema, schema.get("$defs", {})))
+
+def count_words(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(str(message.get("content", "")).split()) for message in messages)
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "stub-model", "object": "model", "owned_by": "stub"}]}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "stub-model")
+    prompt = str(messages[-1].get("content", "")) if messages else ""
+    if (body.get("response_format") or {}).get("type") in ("json_object", "json_schema") or SCHEMA_MARKER in prompt:
+        answer = build_json_answer(body)
+    else:
+        answer = build_answer(messages)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+
+    await asyncio.sleep(settings["latency"])
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": count_words(messages),
+                "completion_tokens": len(answer.split()),
+                "total_tokens": count_words(messages) + len(answer.split())
+            }
+        }
+
+    async def events():
+        delay = 1 / settings["tokens_per_second"] if settings["tokens_per_second"] > 0 else 0
+        for index, word in enumerate(answer.split(" ")):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": word if index == 0 else " " + word},
+                    "finish_reason": None
+                }]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if delay:
+                await asyncio.sleep(delay)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Streaming speed, 0 for no delay")
+    parser.add_argument("--words", type=int, default=120, help="Length of the canned answer in words")
+    args = parser.parse_args()
+
+    settings.update(latency=args.latency, tokens_per_second=args.tokens_per_second, words=args.words)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Awaitable, Optional
+
+from fastapi import HTTPException, Request
+
+from config import REQUEST_DEADLINES, DISCONNECT_POLL_INTERVAL
+
+class DeadlineExceeded(HTTPException):
+    """The request's time budget ran out before the agent finished"""
+    def __init__(self, detail: str = "The request took too long and was cancelled. Please try again."):
+        super().__init__(status_code=504, detail=detail)
+
+class RequestCancelled(HTTPException):
+    """The client disconnected before the agent finished"""
+    def __init__(self, detail: str = "Client closed the request"):
+        # 499 is the de facto status for requests closed by the client
+        super().__init__(status_code=499, detail=detail)
+
+class CancelToken:
+    """
+    Cancellation state of an agent run, shared with the worker thread executing it.
+
+    The event loop cancels the token when no request is waiting for the run
+    any more; the worker checks it before every LLM call and caps each call's
+    timeout to the time left before the deadline.
+    """
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline  # time.monotonic() value, None for no deadline
+        self.reason: Optional[Exception] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: Optional[Exception] = None):
+        if self.reason is None:
+            self.reason = reason or RequestCancelled()
+
+    def extend(self, deadline: Optional[float]):
+        """Move the deadline to whichever of the two is later (None means none)"""
+        if self.deadline is not None:
+            self.deadline = None if deadline is None else max(self.deadline, deadline)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None if there is none"""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def check(self):
+        """Raise if the run was cancelled or its deadline has passed"""
+        if self.reason is not None:
+            raise self.reason
+        check_deadline(self.deadline)
+
+_local = threading.local()
+
+def current_token() -> Optional[CancelToken]:
+    """The cancel token of the agent run on this thread, if any"""
+    return getattr(_local, "token", None)
+
+@contextmanager
+def activate(token: CancelToken):
+    """Make token the current thread's cancel token for the duration of an agent run"""
+    previous = current_token()
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+def request_deadline(route: Optional[str] = None, timeout: Optional[float] = None) -> Optional[float]:
+    """
+    Deadline for a request starting now.
+
+    Args:
+        route: Route name used to look up the configured deadline
+        timeout: Explicit time budget in seconds, overrides the route's
+
+    Returns:
+        Optional[float]: A time.monotonic() value, or None if the route has no deadline
+    """
+    if timeout is None:
+        timeout = REQUEST_DEADLINES.get(route or "default", REQUEST_DEADLINES["default"])
+    return time.monotonic() + timeout if timeout and timeout > 0 else None
+
+def check_deadline(deadline: Optional[float]):
+    """Raise DeadlineExceeded if the deadline has passed"""
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded()
+
+async def await_within(
+    awaitable: Awaitable,
+    deadline: Optional[float] = None,
+    request: Optional[Request] = None
+) -> Any:
+    """
+    Await a result, giving up when the deadline passes or the client disconnects.
+
+    The awaitable is cancelled when it is given up on. The client connection
+    is polled every DISCONNECT_POLL_INTERVAL seconds while waiting.
+
+    Args:
+        awaitable: The coroutine or future to wait for
+        deadline: time.monotonic() value to give up at, None for no deadline
+        request: The HTTP request whose client is watched for a disconnect
+
+    Returns:
+        The awaitable's result
+
+    Raises:
+        DeadlineExceeded: The deadline passed first
+        RequestCancelled: The client disconnected first
+    """
+    if deadline is None and request is None:
+        return await awaitable
+
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if request is not None:
+                timeout = DISCONNECT_POLL_INTERVAL if timeout is None else min(timeout, DISCONNECT_POLL_INTERVAL)
+
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if done:
+                return task.result()
+
+            if request is not None and await request.is_disconnected():
+                error = RequestCancelled()
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                error = DeadlineExceeded()
+                break
+    except BaseException:
+        task.cancel()
+        # Retrieve a late exception so it isn't reported as never retrieved
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        raise
+
+    # Let the abandoned awaitable unwind, so e.g. a stream can be closed right after
+    task.cancel()
+    await asyncio.wait({task})
+    # Prefer a result that arrived just before the cancellation took effect
+    if not task.cancelled() and task.exception() is None:
+        return task.result()
+    raise error
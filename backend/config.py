@@ -1,5 +1,8 @@
 import os
 from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
 
 # Base directories
 BASE_DIR = Path(__file__).parent
@@ -18,6 +21,18 @@ API_PORT = int(os.getenv("API_PORT", "8000"))
 
 # Model Configuration
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-3.5-turbo")
+LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "groq/qwen-qwq-32b")
+
+# LLM provider: "groq", "openai" (or any OpenAI-compatible API via LLM_BASE_URL) or "stub"
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").lower()
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "")
+LLM_API_KEY = os.getenv("LLM_API_KEY", "")
+STUB_LLM_URL = os.getenv("STUB_LLM_URL", "http://127.0.0.1:8001/v1")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "1.0"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "2000"))
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))
 
@@ -26,5 +41,100 @@ MAX_CHUNK_SIZE = 1000
 OVERLAP_SIZE = 200
 BATCH_SIZE = 10
 
+# Prompt templates: "compact" trims boilerplate from task instructions and backstories, "full" keeps the original wording
+PROMPT_VARIANT = os.getenv("PROMPT_VARIANT", "compact").lower()
+
+# Context Assembly: token budgets for retrieved context, per task type
+CONTEXT_TOKEN_BUDGETS = {
+    "chat": int(os.getenv("CONTEXT_BUDGET_CHAT", "1500")),
+    "notes": int(os.getenv("CONTEXT_BUDGET_NOTES", "3000")),
+    "flashcards": int(os.getenv("CONTEXT_BUDGET_FLASHCARDS", "2000")),
+    "tests": int(os.getenv("CONTEXT_BUDGET_TESTS", "2500")),
+    "mindmaps": int(os.getenv("CONTEXT_BUDGET_MINDMAPS", "2000")),
+    "roadmaps": int(os.getenv("CONTEXT_BUDGET_ROADMAPS", "3000")),
+    "default": int(os.getenv("CONTEXT_BUDGET_DEFAULT", "2000")),
+}
+
+# Retrieval caching
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+VECTOR_STORE_CACHE_SIZE = int(os.getenv("VECTOR_STORE_CACHE_SIZE", "8"))
+
+# Reranking: optional cross-encoder pass over the top ANN hits
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MAX_PENDING = int(os.getenv("RERANK_MAX_PENDING", "4"))
+# Seconds a rerank call may wait for the cross-encoder before it gives up and keeps the ANN order
+RERANK_MAX_WAIT = float(os.getenv("RERANK_MAX_WAIT", "2.0"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+
+# Response caching: generated notes, flashcards, mind maps and tests
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_DIR = BASE_DIR / "storage" / "cache" / "responses"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "500"))
+# Optional fallback that reuses a response generated for a near-duplicate topic of the same document
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92"))
+
+# Logging and agent tracing
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# CrewAI's verbose mode prints every prompt and reasoning step to stdout; for local debugging only
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE", "false").lower() == "true"
+# "off", "info" (timings and token counts) or "debug" (also short prompt and output previews)
+AGENT_TRACE_LEVEL = os.getenv("AGENT_TRACE_LEVEL", "info").lower()
+
+# Agent execution: LLM calls run on a bounded thread pool, with per-route concurrency limits
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "8"))
+ROUTE_CONCURRENCY_LIMITS = {
+    "chat": int(os.getenv("CONCURRENCY_CHAT", "8")),
+    "notes": int(os.getenv("CONCURRENCY_NOTES", "4")),
+    "flashcards": int(os.getenv("CONCURRENCY_FLASHCARDS", "4")),
+    "tests": int(os.getenv("CONCURRENCY_TESTS", "4")),
+    "mindmaps": int(os.getenv("CONCURRENCY_MINDMAPS", "4")),
+    "roadmaps": int(os.getenv("CONCURRENCY_ROADMAPS", "2")),
+    "dsa": int(os.getenv("CONCURRENCY_DSA", "4")),
+    "default": int(os.getenv("CONCURRENCY_DEFAULT", "4")),
+}
+
+# Request deadlines in seconds (0 disables); agent runs still going when one passes are aborted
+REQUEST_DEADLINES = {
+    "chat": float(os.getenv("DEADLINE_CHAT", "90")),
+    "notes": float(os.getenv("DEADLINE_NOTES", "180")),
+    "flashcards": float(os.getenv("DEADLINE_FLASHCARDS", "180")),
+    "tests": float(os.getenv("DEADLINE_TESTS", "180")),
+    "mindmaps": float(os.getenv("DEADLINE_MINDMAPS", "180")),
+    "roadmaps": float(os.getenv("DEADLINE_ROADMAPS", "300")),
+    "dsa": float(os.getenv("DEADLINE_DSA", "180")),
+    "batch": float(os.getenv("DEADLINE_BATCH", "600")),
+    "default": float(os.getenv("DEADLINE_DEFAULT", "180")),
+}
+# How often a waiting request checks whether its client has disconnected
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+# Batch generation: topics whose contexts fit the batch budget together share one LLM call
+BATCH_MAX_TOPICS = int(os.getenv("BATCH_MAX_TOPICS", "25"))
+BATCH_TOPICS_PER_CALL = int(os.getenv("BATCH_TOPICS_PER_CALL", "4"))
+BATCH_CONTEXT_BUDGET = int(os.getenv("BATCH_CONTEXT_BUDGET", "6000"))
+
+# Structured output for flashcards, tests and code analysis: "json_object" (JSON mode, schema given in the prompt),
+# "json_schema" (schema enforced by the provider) or "off" (free text read by the legacy regex parsers)
+STRUCTURED_OUTPUT_MODE = os.getenv("STRUCTURED_OUTPUT_MODE", "json_object").lower()
+# Follow-up calls asking the model to fix output that failed validation
+STRUCTURED_OUTPUT_REPAIRS = int(os.getenv("STRUCTURED_OUTPUT_REPAIRS", "1"))
+
+# Mind maps: outline entries nested deeper than this below the central concept, or beyond this many nodes, are dropped
+MINDMAP_MAX_DEPTH = int(os.getenv("MINDMAP_MAX_DEPTH", "4"))
+MINDMAP_MAX_NODES = int(os.getenv("MINDMAP_MAX_NODES", "150"))
+# Node coordinates computed on the server, so the frontend can skip its force simulation: "radial", "tree" or "off"
+MINDMAP_LAYOUT = os.getenv("MINDMAP_LAYOUT", "radial").lower()
+
+# Generated artifacts (notes, flashcards, mind maps, tests, roadmaps, DSA plans and code analyses)
+ARTIFACT_DB_PATH = BASE_DIR / "storage" / "artifacts.db"
+# Where artifacts were saved as one JSON file each before; imported into the database once
+LEGACY_ARTIFACT_DIR = BASE_DIR / "storage"
+ARTIFACT_PAGE_SIZE = int(os.getenv("ARTIFACT_PAGE_SIZE", "100"))
+ARTIFACT_MAX_PAGE_SIZE = int(os.getenv("ARTIFACT_MAX_PAGE_SIZE", "1000"))
+
 # Supported file types
 SUPPORTED_FILE_TYPES = {".pdf", ".docx", ".txt"} 
\ No newline at end of file
@@ -0,0 +1,203 @@
+import re
+import logging
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+from config import LLM_MODEL_NAME, CONTEXT_TOKEN_BUDGETS
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional, token counts fall back to a character heuristic
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio for English prose, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+# Chunks that would be cut below this many tokens are dropped rather than truncated
+MIN_TRUNCATED_TOKENS = 50
+
+TRUNCATION_MARKER = " [...]"
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]{3,}")
+
+@lru_cache(maxsize=8)
+def get_tokenizer(model_name: str = LLM_MODEL_NAME):
+    """
+    Get a tokenizer for the configured model.
+
+    Provider prefixes such as "groq/" are stripped before the lookup. Models
+    unknown to tiktoken use the cl100k_base encoding, which is close enough
+    for budgeting purposes.
+
+    Returns:
+        The tiktoken encoding, or None if tiktoken is unavailable
+    """
+    if tiktoken is None:
+        return None
+
+    base_name = model_name.split("/")[-1]
+    try:
+        return tiktoken.encoding_for_model(base_name)
+    except KeyError:
+        pass
+
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer, using character heuristic: {e}")
+        return None
+
+def count_tokens(text: str, model_name: str = LLM_MODEL_NAME) -> int:
+    """Count the tokens in text for the given model"""
+    if not text:
+        return 0
+
+    tokenizer = get_tokenizer(model_name)
+    if tokenizer is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: str = LLM_MODEL_NAME) -> str:
+    """
+    Truncate text to at most max_tokens tokens.
+
+    The cut is moved back to the last sentence or line boundary when one is
+    reasonably close, so truncated chunks don't end mid-word.
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model_name) <= max_tokens:
+        return text
+
+    tokenizer = get_tokenizer(model_name)
+    if tokenizer is None:
+        truncated = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        truncated = tokenizer.decode(tokenizer.encode(text, disallowed_special=())[:max_tokens])
+
+    # Prefer ending on a sentence or line boundary within the last fifth of the text
+    boundary = max(truncated.rfind(". "), truncated.rfind("\n"))
+    if boundary > len(truncated) * 0.8:
+        truncated = truncated[:boundary + 1]
+
+    return truncated.rstrip() + TRUNCATION_MARKER
+
+def get_context_budget(task: Optional[str]) -> int:
+    """Get the context token budget configured for a task type"""
+    return CONTEXT_TOKEN_BUDGETS.get(task or "default", CONTEXT_TOKEN_BUDGETS["default"])
+
+def rank_by_query(chunks: Sequence[str], query: str) -> List[int]:
+    """
+    Rank chunks by lexical overlap with the query.
+
+    Used for content that has no retrieval score of its own, such as a chapter
+    extracted page by page.
+
+    Returns:
+        List[int]: Chunk indices, highest scoring first
+    """
+    query_terms = set(_WORD_PATTERN.findall(query.lower())) if query else set()
+    if not query_terms:
+        return list(range(len(chunks)))
+
+    def score(index: int) -> int:
+        words = _WORD_PATTERN.findall(chunks[index].lower())
+        return sum(1 for word in words if word in query_terms)
+
+    # sorted() is stable, so ties keep document order
+    return sorted(range(len(chunks)), key=score, reverse=True)
+
+def pack_chunks(
+    chunks: Sequence[str],
+    budget: int,
+    order: Optional[Sequence[int]] = None,
+    preserve_order: bool = False,
+    model_name: str = LLM_MODEL_NAME
+) -> List[str]:
+    """
+    Pack chunks into a token budget, highest-value chunks first.
+
+    Args:
+        chunks: Candidate chunks
+        budget: Maximum number of tokens for the packed chunks
+        order: Chunk indices by value, highest first (defaults to the given order)
+        preserve_order: Return selected chunks in their original order
+        model_name: Model used for token counting
+
+    Returns:
+        List[str]: Selected chunks; the first chunk that overflows the budget is truncated
+    """
+    order = list(order) if order is not None else list(range(len(chunks)))
+    selected = {}
+    remaining = budget
+    seen = set()
+    truncated = 0
+
+    for index in order:
+        chunk = chunks[index].strip()
+        if not chunk or chunk in seen:
+            continue
+        seen.add(chunk)
+
+        tokens = count_tokens(chunk, model_name)
+        if tokens <= remaining:
+            selected[index] = chunk
+            remaining -= tokens
+        elif remaining >= MIN_TRUNCATED_TOKENS:
+            selected[index] = truncate_to_tokens(chunk, remaining, model_name)
+            truncated += 1
+            remaining = 0
+
+        if remaining < MIN_TRUNCATED_TOKENS:
+            break
+
+    logger.info(
+        f"Packed {len(selected)}/{len(chunks)} chunks into {budget - remaining}/{budget} tokens "
+        f"({truncated} truncated)"
+    )
+
+    indices = sorted(selected) if preserve_order else list(selected)
+    return [selected[index] for index in indices]
+
+def build_context(
+    chunks: Sequence[str],
+    task: Optional[str] = None,
+    budget: Optional[int] = None,
+    separator: str = "\n"
+) -> str:
+    """
+    Build prompt context from ranked retrieval chunks within a task's token budget.
+
+    Args:
+        chunks: Retrieved chunks, most relevant first
+        task: Task type used to look up the budget (chat, notes, flashcards, ...)
+        budget: Explicit token budget, overrides the task budget
+        separator: String used to join the packed chunks
+
+    Returns:
+        str: The packed context
+    """
+    budget = budget if budget is not None else get_context_budget(task)
+    return separator.join(pack_chunks(chunks, budget))
+
+def fit_text_to_budget(
+    text: str,
+    query: str = "",
+    task: Optional[str] = None,
+    budget: Optional[int] = None
+) -> str:
+    """
+    Fit a long block of text, such as a directly extracted chapter, into a task budget.
+
+    The text is split into paragraphs, the paragraphs most relevant to the query
+    are kept, and the result is returned in document order.
+    """
+    budget = budget if budget is not None else get_context_budget(task)
+    if count_tokens(text) <= budget:
+        return text
+
+    paragraphs = [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+    packed = pack_chunks(paragraphs, budget, order=rank_by_query(paragraphs, query), preserve_order=True)
+    return "\n\n".join(packed)
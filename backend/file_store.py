@@ -0,0 +1,149 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Union
+
+import aiofiles
+import aiofiles.os
+
+logger = logging.getLogger(__name__)
+
+FileData = Union[str, bytes]
+
+def _temp_path(path: Path) -> Path:
+    # Next to the target, so the rename stays on one filesystem; hidden and not *.json, so no glob picks it up
+    return path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+
+def _as_bytes(data: FileData) -> bytes:
+    return data.encode("utf-8") if isinstance(data, str) else data
+
+def _fsync_dir(directory: Path):
+    """Persist the renames in a directory; not supported on Windows, where the rename is enough"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def atomic_write(path: Union[str, Path], data: FileData):
+    """
+    Write a file so that readers see either the old or the new content, never part of it.
+
+    The data goes to a temporary file next to the target, which is flushed to
+    disk and then renamed over the target. For code that is not async; async
+    handlers use write_file.
+
+    Args:
+        path: The file to write
+        data: The content; text is written as UTF-8
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = _temp_path(path)
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(_as_bytes(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    _fsync_dir(path.parent)
+
+async def _write_temp(path: Path, chunks: AsyncIterator[bytes]) -> Path:
+    """Write chunks to a temporary file next to path, flushed to disk, and return its path"""
+    temp_path = _temp_path(path)
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            async for chunk in chunks:
+                await f.write(chunk)
+            await f.flush()
+            await asyncio.to_thread(os.fsync, f.fileno())
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return temp_path
+
+async def _single(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+async def write_files(files: Dict[Union[str, Path], FileData]):
+    """
+    Write several files at once, each atomically.
+
+    The files are written to temporary files concurrently and flushed to
+    disk; only once all of them are written are they renamed over their
+    targets, and each directory is synced once. If any write fails, none of
+    the targets is touched. Each rename is atomic, the batch as a whole is
+    not: a rename that fails leaves the files renamed before it in place.
+
+    Args:
+        files: Content by path; text is written as UTF-8
+    """
+    targets = [Path(path) for path in files]
+    for directory in {path.parent for path in targets}:
+        await aiofiles.os.makedirs(directory, exist_ok=True)
+
+    results = await asyncio.gather(
+        *(_write_temp(path, _single(_as_bytes(data))) for path, data in zip(targets, files.values())),
+        return_exceptions=True
+    )
+    temp_paths = [result for result in results if isinstance(result, Path)]
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        for temp_path in temp_paths:
+            temp_path.unlink(missing_ok=True)
+        raise errors[0]
+
+    try:
+        for temp_path, path in zip(temp_paths, targets):
+            await aiofiles.os.replace(temp_path, path)
+    except BaseException:
+        for temp_path in temp_paths:
+            temp_path.unlink(missing_ok=True)
+        raise
+    for directory in {path.parent for path in targets}:
+        await asyncio.to_thread(_fsync_dir, directory)
+
+async def write_file(path: Union[str, Path], data: FileData):
+    """Write one file atomically, without blocking the event loop; see write_files"""
+    await write_files({path: data})
+
+async def write_stream(path: Union[str, Path], chunks: AsyncIterator[bytes]):
+    """
+    Write a file atomically from chunks, e.g. an upload read a piece at a time.
+
+    Args:
+        path: The file to write
+        chunks: The content
+    """
+    path = Path(path)
+    await aiofiles.os.makedirs(path.parent, exist_ok=True)
+    temp_path = await _write_temp(path, chunks)
+    await aiofiles.os.replace(temp_path, path)
+    await asyncio.to_thread(_fsync_dir, path.parent)
+
+async def read_json(path: Union[str, Path], default: Any = None) -> Any:
+    """
+    Read a JSON file without blocking the event loop.
+
+    Returns:
+        Any: The parsed content, or default if the file does not exist or is not valid JSON
+    """
+    try:
+        async with aiofiles.open(path, "r") as f:
+            return json.loads(await f.read())
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read {path}: {e}")
+        return default
@@ -0,0 +1,231 @@
+import os
+import random
+import asyncio
+import inspect
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import litellm
+from crewai import LLM
+
+from config import (
+    LLM_PROVIDER, LLM_MODEL_NAME, LLM_BASE_URL, LLM_API_KEY, STUB_LLM_URL,
+    LLM_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_MAX_RETRIES, LLM_RETRY_BACKOFF, LLM_MAX_CONNECTIONS
+)
+from cancellation import current_token
+
+logger = logging.getLogger(__name__)
+
+# litellm model prefix, API key variable and default base URL of each provider
+PROVIDERS = {
+    "groq": {"prefix": "groq", "api_key_env": "GROQ_API_KEY", "base_url": None},
+    "openai": {"prefix": "openai", "api_key_env": "OPENAI_API_KEY", "base_url": None},
+    "stub": {"prefix": "openai", "api_key_env": None, "base_url": STUB_LLM_URL},
+}
+
+# Status codes worth retrying: timeouts, rate limits and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+MAX_BACKOFF_SECONDS = 30
+
+@dataclass
+class ProviderSettings:
+    name: str
+    model: str
+    base_url: Optional[str]
+    api_key: Optional[str]
+
+@lru_cache(maxsize=1)
+def get_provider_settings() -> ProviderSettings:
+    """Resolve the configured provider into a litellm model name, base URL and API key"""
+    if LLM_PROVIDER not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider: {LLM_PROVIDER} (expected one of {', '.join(PROVIDERS)})")
+    provider = PROVIDERS[LLM_PROVIDER]
+
+    # LLM_MODEL_NAME may carry a provider prefix such as "groq/"; the provider setting decides
+    model_name = LLM_MODEL_NAME.split("/", 1)[-1]
+    api_key = LLM_API_KEY or (os.environ.get(provider["api_key_env"], "") if provider["api_key_env"] else "stub")
+
+    settings = ProviderSettings(
+        name=LLM_PROVIDER,
+        model=f"{provider['prefix']}/{model_name}",
+        base_url=LLM_BASE_URL or provider["base_url"],
+        api_key=api_key or None
+    )
+    logger.info(f"Using LLM provider {settings.name} with model {settings.model}")
+    return settings
+
+@lru_cache(maxsize=1)
+def configure_http_clients():
+    """
+    Install pooled HTTP clients for all LLM calls.
+
+    litellm sends both the CrewAI agent calls and the streamed completions
+    through these clients, so connections to the provider are kept alive
+    and reused instead of being opened per request.
+    """
+    limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+    timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+    litellm.client_session = httpx.Client(limits=limits, timeout=timeout)
+    litellm.aclient_session = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+async def close_http_clients():
+    """Close the pooled HTTP clients, if they were created"""
+    if configure_http_clients.cache_info().currsize == 0:
+        return
+    litellm.client_session.close()
+    await litellm.aclient_session.aclose()
+    configure_http_clients.cache_clear()
+
+class CancellableLLM(LLM):
+    """
+    CrewAI LLM that honours the cancel token of the agent run calling it.
+
+    Every call first checks whether the run has been cancelled, and its
+    timeout is capped to the time left before the run's deadline, so an
+    expired request doesn't keep a worker waiting on the provider.
+    """
+    def _prepare_completion_params(self, messages, tools=None) -> Dict[str, Any]:
+        return limit_to_current_run(super()._prepare_completion_params(messages, tools))
+
+def limit_to_current_run(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply the current thread's cancel token to litellm completion parameters.
+
+    Raises if the run has been cancelled or has expired, and otherwise caps
+    the call's timeout to the time left before the run's deadline.
+    """
+    token = current_token()
+    if token is None:
+        return params
+
+    token.check()
+    remaining = token.remaining()
+    if remaining is not None and remaining < params.get("timeout", LLM_TIMEOUT):
+        params["timeout"] = remaining
+        # A retry couldn't finish before the deadline either
+        params["num_retries"] = 0
+    return params
+
+def create_llm(**kwargs) -> LLM:
+    """
+    Create the CrewAI LLM for the configured provider.
+
+    Failed calls are retried by litellm with exponential backoff, and calls
+    made for a cancelled or expiring agent run are cut short.
+
+    Args:
+        **kwargs: Extra completion parameters, e.g. temperature
+
+    Returns:
+        LLM: The CrewAI LLM
+    """
+    configure_http_clients()
+    settings = get_provider_settings()
+    return CancellableLLM(
+        model=settings.model,
+        base_url=settings.base_url,
+        api_key=settings.api_key,
+        timeout=LLM_TIMEOUT,
+        num_retries=LLM_MAX_RETRIES,
+        retry_strategy="exponential_backoff_retry",
+        **kwargs
+    )
+
+def complete_chat(messages: List[Dict[str, str]], **kwargs) -> Any:
+    """
+    Send a chat completion to the configured provider and wait for the answer.
+
+    Blocking, for the agent worker threads. Like the agents' calls, it is
+    retried by litellm with exponential backoff and honours the cancel
+    token of the agent run on the calling thread.
+
+    Args:
+        messages: Chat messages as role/content dicts
+        **kwargs: Extra completion parameters, e.g. response_format
+
+    Returns:
+        The litellm ModelResponse
+    """
+    configure_http_clients()
+    settings = get_provider_settings()
+    params = limit_to_current_run({
+        "model": settings.model,
+        "messages": messages,
+        "base_url": settings.base_url,
+        "api_key": settings.api_key,
+        "timeout": LLM_TIMEOUT,
+        "num_retries": LLM_MAX_RETRIES,
+        **kwargs
+    })
+    return litellm.completion(**params)
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed LLM call is worth retrying"""
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given retry attempt (0-based)"""
+    delay = LLM_RETRY_BACKOFF * (2 ** attempt)
+    return min(delay, MAX_BACKOFF_SECONDS) * random.uniform(0.5, 1.5)
+
+async def astream_chat(messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+    """
+    Stream a chat completion from the configured provider.
+
+    Opening the stream is retried with exponential backoff on transient
+    errors. Once tokens have been sent, a failure is raised as is, since
+    the output can't be taken back.
+
+    Args:
+        messages: Chat messages as role/content dicts
+        **kwargs: Extra completion parameters, e.g. temperature
+
+    Yields:
+        str: Chunks of generated text as they arrive
+    """
+    configure_http_clients()
+    settings = get_provider_settings()
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            response = await litellm.acompletion(
+                model=settings.model,
+                messages=messages,
+                base_url=settings.base_url,
+                api_key=settings.api_key,
+                timeout=LLM_TIMEOUT,
+                stream=True,
+                **kwargs
+            )
+            break
+        except Exception as e:
+            if attempt == LLM_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"LLM stream failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    try:
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        # Close the connection right away when the consumer stops early, instead of reading to the end
+        await close_stream(response)
+
+async def close_stream(response: Any):
+    """Close the HTTP stream behind a litellm streaming response"""
+    stream = getattr(response, "completion_stream", None)
+    for name in ("aclose", "close"):
+        close = getattr(stream, name, None)
+        if close is not None:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+            return
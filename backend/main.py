@@ -1,5 +1,6 @@
 import os
 import re
+import asyncio
 import hashlib
 import tempfile
 import json
@@ -89,6 +90,11 @@ from agents import (
     create_mock_interview_task,
     run_agent_task
 )
+from agent_runtime import shutdown_executor
+from llm_providers import close_http_clients
+from file_store import write_file
+from artifact_store import artifact_store
+from config import LOG_LEVEL
 
 # Configuration constants
 MAX_CHUNK_SIZE = 1000
@@ -144,18 +150,24 @@ def setup_logging():
     
     # Setup root logger
     root_logger = logging.getLogger()
-    root_logger.setLevel(logging.DEBUG)
+    root_logger.setLevel(LOG_LEVEL)
+    # Drop handlers installed by basicConfig on import, they would print every record twice
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
     root_logger.addHandler(file_handler)
     root_logger.addHandler(console_handler)
     
     # Create logger for this module
     logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
     
     # Reduce noise from watchfiles module
     logging.getLogger('watchfiles').setLevel(logging.ERROR)
     logging.getLogger('watchgod').setLevel(logging.ERROR)
     
+    # litellm logs every request at INFO, agent_trace already covers LLM calls
+    logging.getLogger('LiteLLM').setLevel(logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    
     return logger
 
 logger = setup_logging()
@@ -191,6 +203,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination headers of the list endpoints
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],
 )
 
 # Register routers with prefix
@@ -205,51 +219,49 @@ app.include_router(dsa_router, prefix="/api/dsa", tags=["dsa"])
 app.include_router(progress_router, prefix="/api/progress", tags=["progress"])
 app.include_router(forum_router, prefix="/api/forum", tags=["forum"])  # Register forum router
 
-# Error handling middleware
-@app.middleware("http")
-async def error_handling_middleware(request: Request, call_next):
-    """Global error handling middleware"""
-    try:
-        return await call_next(request)
-    except Exception as e:
-        # Log the full error with traceback
-        logger.error(
-            f"Unhandled error in {request.method} {request.url.path}",
-            exc_info=True,
-            extra={
-                "error_type": type(e).__name__,
-                "error_message": str(e),
-                "path": request.url.path,
-                "method": request.method
-            }
+# Global error handler. Registered as an exception handler rather than an HTTP
+# middleware, which would hide client disconnects from the endpoints.
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, e: Exception):
+    """Log unhandled errors and turn them into JSON error responses"""
+    # Log the full error with traceback
+    logger.error(
+        f"Unhandled error in {request.method} {request.url.path}",
+        exc_info=e,
+        extra={
+            "error_type": type(e).__name__,
+            "error_message": str(e),
+            "path": request.url.path,
+            "method": request.method
+        }
+    )
+    
+    # Return appropriate error response
+    if isinstance(e, HTTPException):
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"detail": e.detail}
+        )
+    elif isinstance(e, DocumentProcessingError):
+        return JSONResponse(
+            status_code=400,
+            content={"detail": str(e)}
+        )
+    elif isinstance(e, VectorStoreError):
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Vector store error: {str(e)}"}
+        )
+    elif isinstance(e, AgentError):
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"Agent error: {str(e)}"}
+        )
+    else:
+        return JSONResponse(
+            status_code=500,
+            content={"detail": "Internal server error"}
         )
-        
-        # Return appropriate error response
-        if isinstance(e, HTTPException):
-            return JSONResponse(
-                status_code=e.status_code,
-                content={"detail": e.detail}
-            )
-        elif isinstance(e, DocumentProcessingError):
-            return JSONResponse(
-                status_code=400,
-                content={"detail": str(e)}
-            )
-        elif isinstance(e, VectorStoreError):
-            return JSONResponse(
-                status_code=500,
-                content={"detail": f"Vector store error: {str(e)}"}
-            )
-        elif isinstance(e, AgentError):
-            return JSONResponse(
-                status_code=500,
-                content={"detail": f"Agent error: {str(e)}"}
-            )
-        else:
-            return JSONResponse(
-                status_code=500,
-                content={"detail": "Internal server error"}
-            )
 
 # Utility Functions
 def get_embeddings():
@@ -399,8 +411,7 @@ async def process_document_async(file: UploadFile):
         }
         
         # Cache the processed document
-        with open(cache_path, 'wb') as f:
-            pickle.dump(doc_info, f)
+        await write_file(cache_path, pickle.dumps(doc_info))
         
         logger.info(f"Successfully processed document: {file.filename}")
         return doc_info
@@ -495,12 +506,16 @@ async def startup_event():
     for dir_path in storage_dirs:
         Path(dir_path).mkdir(parents=True, exist_ok=True)
         logger.info(f"Ensured directory exists: {dir_path}")
+    # Opening the artifact store can import the legacy artifact files, so it happens off the event loop
+    await asyncio.to_thread(artifact_store.open)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Perform cleanup on shutdown"""
     logger.info("Shutting down application...")
-    # Add any cleanup tasks here
+    # Waiting for running LLM calls can take up to LLM_TIMEOUT, so it happens off the event loop
+    await asyncio.to_thread(shutdown_executor)
+    await close_http_clients()
 
 if __name__ == "__main__":
     try:
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Dict, Literal, Optional, Any
 from datetime import datetime
 
 class DocumentMetadata(BaseModel):
@@ -39,6 +39,15 @@ class NotesResponse(BaseModel):
     content: str
     document_id: str
     created_at: str
+    partial: bool = False  # Streamed notes cut short by the request deadline
+
+class BatchNotesRequest(BaseModel):
+    topics: List[str]
+    document_id: str
+
+class BatchNotesResponse(BaseModel):
+    notes: List[NotesResponse]
+    failed_topics: List[str] = []
 
 class FlashcardRequest(BaseModel):
     topic: str
@@ -55,17 +64,34 @@ class FlashcardDeck(BaseModel):
     document_id: str
     created_at: str
     cards: List[Flashcard]
+    partial: bool = False  # Streamed deck cut short by the request deadline
+
+class BatchFlashcardRequest(BaseModel):
+    topics: List[str]
+    document_id: str
+    num_cards: int = 10
+
+class BatchFlashcardResponse(BaseModel):
+    decks: List[FlashcardDeck]
+    failed_topics: List[str] = []
 
 class MindMapRequest(BaseModel):
     topic: str
     document_id: str
+    layout: Optional[Literal["radial", "tree", "off"]] = None  # Defaults to MINDMAP_LAYOUT
 
 class MindMapNode(BaseModel):
     id: int
     label: str
     group: int
+    level: int = 0  # Distance from the central concept
+    # Position from the server-side layout, relative to the center of the drawing
+    x: Optional[float] = None
+    y: Optional[float] = None
 
 class MindMapEdge(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
     from_: int = Field(..., alias="from")
     to: int
 
@@ -77,6 +103,7 @@ class MindMap(BaseModel):
     nodes: List[MindMapNode]
     edges: List[MindMapEdge]
     description: str
+    layout: Optional[str] = None  # Layout the node coordinates come from, None if they have none
 
 class RoadmapRequest(BaseModel):
     document_id: str
@@ -135,6 +162,19 @@ class DSAQuestion(BaseModel):
     link: Optional[str] = None
     platform: Optional[str] = None
 
+class CodeAnalysisRequest(BaseModel):
+    code: str
+    problem: str = ""
+    language: str = "python"
+
+class CodeAnalysisResponse(BaseModel):
+    bugs: List[str] = []
+    optimizations: List[str] = []
+    improved_code: str = ""
+    time_complexity: str = ""
+    space_complexity: str = ""
+    explanation: str = ""
+
 class MindMapResponse(BaseModel):
     nodes: List[MindMapNode]
     edges: List[MindMapEdge]
@@ -0,0 +1,385 @@
+"""
+Prompt templates for the document tasks and the longer agent backstories.
+
+Every template is split so that provider-side prompt caching can work:
+the static instructions come first and are byte-identical on every call,
+per-request inputs follow, and the retrieved context is always last.
+
+Each template has a "full" variant (the original wording) and a "compact"
+variant that keeps every instruction but drops the boilerplate around it;
+PROMPT_VARIANT selects which one is used. Bump a template's version when
+its wording changes, so cached responses from the old prompt are not reused.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from config import PROMPT_VARIANT
+from context_builder import count_tokens
+
+PROMPT_VARIANTS = ("full", "compact")
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    instructions: str     # Static prefix, identical on every call
+    inputs: str           # Per-request values other than the context, as a format string
+    expected_output: str
+
+TEMPLATE_VERSIONS = {
+    "explanation": 2,
+    "notes": 2,
+    "flashcards": 3,
+    "mindmaps": 2,
+    "tests": 2,
+    "notes_batch": 1,
+    "flashcards_batch": 2,
+}
+
+TEMPLATES: Dict[str, Dict[str, PromptTemplate]] = {
+    "explanation": {
+        "full": PromptTemplate(
+            instructions="""Explain the following concept using clear, concise language.
+Break down complex ideas into manageable parts. Use analogies where helpful.
+
+Guidelines:
+1. Start with a direct, clear answer to the question - get straight to the point
+2. Provide relevant examples from the context
+3. Break down complex concepts into simpler parts
+4. Use analogies or comparisons when helpful
+5. Reference specific information from the document when relevant
+6. If the question is unclear or lacks context, ask for clarification
+7. If the context appears to be an index, table of contents, or references section rather than actual content,
+   explain that you need more specific questions about concepts, not just terms from the index
+8. Always provide substantive educational value in your answers, not just listings or metadata
+9. Never respond with raw index entries, reference lists, or page numbers
+10. Focus on explaining the concept rather than reporting document metadata""",
+            inputs="Question: {question}",
+            expected_output="A clear, well-structured explanation that directly addresses the question while incorporating relevant context"
+        ),
+        "compact": PromptTemplate(
+            instructions="""Answer the question clearly and concisely:
+- Lead with a direct answer, then break complex ideas into simple parts
+- Use examples from the context and analogies where helpful
+- Ask for clarification if the question is unclear
+- Explain concepts; never list index entries, references, page numbers or document metadata
+- If the context is only an index or table of contents, ask for a more specific question about a concept""",
+            inputs="Question: {question}",
+            expected_output="A clear, well-structured explanation that directly addresses the question using the context"
+        ),
+    },
+    "notes": {
+        "full": PromptTemplate(
+            instructions="""Create comprehensive, well-structured study notes on the following topic.
+Include key concepts, definitions, examples, and relationships between ideas.
+Organize with clear headings and subheadings.""",
+            inputs="Topic: {topic}",
+            expected_output="Well-structured study notes in markdown format with headings, bullet points, and emphasis on key concepts."
+        ),
+        "compact": PromptTemplate(
+            instructions="""Write study notes on the topic: key concepts, definitions, examples and how the ideas relate, organized under headings and subheadings.""",
+            inputs="Topic: {topic}",
+            expected_output="Markdown study notes with headings, bullet points and emphasized key concepts."
+        ),
+    },
+    "tests": {
+        "full": PromptTemplate(
+            instructions="""Create a practice test on the following topic at the requested difficulty level.
+Include a mix of question types (multiple choice, short answer, essay questions).
+Provide an answer key with explanations.""",
+            inputs="Topic: {topic}\nDifficulty: {difficulty}",
+            expected_output="A practice test with varied question types and a comprehensive answer key."
+        ),
+        "compact": PromptTemplate(
+            instructions="""Write a practice test on the topic at the given difficulty, mixing multiple choice, short answer and essay questions, followed by an answer key with explanations.""",
+            inputs="Topic: {topic}\nDifficulty: {difficulty}",
+            expected_output="A practice test with varied question types and an answer key."
+        ),
+    },
+    "flashcards": {
+        "full": PromptTemplate(
+            instructions="""Create a set of flashcards for the following topic.
+Each flashcard should have a clear question/term on the front side and a concise answer/definition on the back side.
+Focus on key concepts, definitions, formulas, and important facts.
+
+IMPORTANT FORMATTING INSTRUCTIONS:
+1. Output the flashcards in JSON format as an array of objects
+2. Each flashcard object MUST have exactly two fields: "front" and "back"
+3. The "front" should contain a clear, concise question or term (typically 1-2 sentences)
+4. The "back" should contain a comprehensive yet concise answer or explanation (typically 1-3 sentences)
+5. Ensure the front and back are related and form a logical pair
+6. Do NOT include any markdown formatting, just plain text
+7. Do NOT include card numbers or labels like "Card 1:" in the content
+8. Make sure content is appropriate for flashcard display (not too long)
+9. Always use complete sentences and proper grammar
+
+EXAMPLE FORMAT (but create your own content):
+[
+  {
+    "front": "What is a binary search tree?",
+    "back": "A binary tree data structure where each node has at most two children, with all left descendants less than the node and all right descendants greater than the node."
+  },
+  {
+    "front": "What is time complexity?",
+    "back": "A measure of the amount of time an algorithm takes to run as a function of the length of the input."
+  }
+]
+
+Remember to extract the most important concepts from the context that are related to the topic and create high-quality, educational flashcards.""",
+            inputs="Topic: {topic}\nNumber of cards to generate: {num_cards}",
+            expected_output="A JSON array of flashcard objects, each with 'front' and 'back' fields in proper format for display."
+        ),
+        "compact": PromptTemplate(
+            instructions="""Create flashcards on the key concepts, definitions, formulas and facts of the topic found in the context.
+Output only a JSON array of objects with exactly two string fields:
+- "front": a concise question or term (1-2 sentences)
+- "back": a concise, complete answer (1-3 sentences)
+Plain text only: no markdown, no card numbers or labels. Use complete sentences.
+Example: [{"front": "What is time complexity?", "back": "A measure of how an algorithm's running time grows with the size of its input."}]""",
+            inputs="Topic: {topic}\nNumber of cards: {num_cards}",
+            expected_output="A JSON array of flashcard objects with 'front' and 'back' fields."
+        ),
+    },
+    "mindmaps": {
+        "full": PromptTemplate(
+            instructions="""Create a detailed mind map for the following topic. Follow the specific formatting instructions below.
+
+FORMATTING INSTRUCTIONS:
+
+1. Begin with identifying the central concept that best represents the topic
+
+2. Identify 4-8 main branches (key concepts/categories) that connect directly to the central concept
+
+3. For each main branch, identify 2-5 sub-branches (related concepts, details, or examples)
+
+4. Structure your response in a hierarchical format showing:
+  - Central concept (the topic)
+  - Main branches (key concepts)
+  - Sub-branches for each main branch
+
+5. IMPORTANT: Use a clear hierarchical format with the following levels:
+  - Central Concept/Topic: The main subject
+  - Branch 1: First key concept
+      - Sub-branch 1.1: Detail or example for Branch 1
+      - Sub-branch 1.2: Another detail or example for Branch 1
+  - Branch 2: Second key concept
+      - Sub-branch 2.1: Detail or example for Branch 2
+  - ...and so on
+
+6. Ensure concepts and relationships are clearly labeled and accurate based on the context information.
+
+7. Keep branch and sub-branch descriptions concise (preferably under 60 characters) to fit well in the visualization.
+
+Remember that this mind map will be visualized as an interactive diagram with nodes and connections, so focus on creating a clear hierarchical structure that shows the relationships between concepts.""",
+            inputs="Topic: {topic}",
+            expected_output="A detailed mind map with central concept, branches, and sub-branches in a clear hierarchical format."
+        ),
+        "compact": PromptTemplate(
+            instructions="""Create a mind map of the topic as an indented outline, accurate to the context:
+- Central Concept: the topic
+  - Branch 1: a key concept (4-8 branches)
+      - Sub-branch 1.1: a detail or example (2-5 per branch)
+Keep every label under 60 characters; the outline is drawn as an interactive diagram.""",
+            inputs="Topic: {topic}",
+            expected_output="A mind map outline with a central concept, branches and sub-branches."
+        ),
+    },
+    # Several topics in one call; each topic's answer goes under its own TOPIC_MARKER line
+    "notes_batch": {
+        "full": PromptTemplate(
+            instructions="""Create comprehensive, well-structured study notes for each of the following topics.
+For each topic, include key concepts, definitions, examples, and relationships between ideas,
+organized with clear headings and subheadings. Use only the context given for that topic.
+
+IMPORTANT FORMATTING INSTRUCTIONS:
+1. Start the notes for each topic with a line of the form "### Topic: <topic name>", using the topic name exactly as given
+2. Write the topics in the order they are listed
+3. Do not write anything before the first topic line""",
+            inputs="Topics: {topics}",
+            expected_output="Markdown study notes for every topic, each starting with its '### Topic: <topic name>' line."
+        ),
+        "compact": PromptTemplate(
+            instructions="""Write study notes for each topic from that topic's context: key concepts, definitions, examples and how the ideas relate, organized under headings and subheadings.
+Start each topic's notes with the line "### Topic: <topic name>" (name exactly as given), in the listed order, with nothing before the first one.""",
+            inputs="Topics: {topics}",
+            expected_output="Markdown study notes per topic, each under its '### Topic: <topic name>' line."
+        ),
+    },
+    "flashcards_batch": {
+        "full": PromptTemplate(
+            instructions="""Create a set of flashcards for each of the following topics, using only the context given for that topic.
+Each flashcard should have a clear question/term on the front side and a concise answer/definition on the back side.
+Focus on key concepts, definitions, formulas, and important facts.
+
+IMPORTANT FORMATTING INSTRUCTIONS:
+1. Start the flashcards for each topic with a line of the form "### Topic: <topic name>", using the topic name exactly as given
+2. Under each topic line, output that topic's flashcards as a JSON array of objects
+3. Each flashcard object MUST have exactly two fields: "front" and "back"
+4. The "front" should contain a clear, concise question or term (typically 1-2 sentences)
+5. The "back" should contain a comprehensive yet concise answer or explanation (typically 1-3 sentences)
+6. Do NOT include any markdown formatting, card numbers or labels in the content
+7. Write the topics in the order they are listed and do not write anything before the first topic line""",
+            inputs="Topics: {topics}\nNumber of cards to generate per topic: {num_cards}",
+            expected_output="For every topic, its '### Topic: <topic name>' line followed by a JSON array of flashcard objects with 'front' and 'back' fields."
+        ),
+        "compact": PromptTemplate(
+            instructions="""Create flashcards for each topic on the key concepts, definitions, formulas and facts in that topic's context.
+Start each topic with the line "### Topic: <topic name>" (name exactly as given), in the listed order, followed by only a JSON array of objects with exactly two string fields:
+- "front": a concise question or term (1-2 sentences)
+- "back": a concise, complete answer (1-3 sentences)
+Plain text only: no markdown, no card numbers or labels.""",
+            inputs="Topics: {topics}\nNumber of cards per topic: {num_cards}",
+            expected_output="Per topic, its '### Topic: <topic name>' line followed by a JSON array of flashcard objects."
+        ),
+    },
+}
+
+TOPIC_MARKER = "### Topic: {topic}"
+
+# Extra instructions appended to the explanation prompt in special cases
+EXPLANATION_NOTES = {
+    "full": {
+        "chapter": """11. This question is about Chapter {chapter}. Focus your answer specifically on the content
+    and concepts from this chapter.
+12. If you can't find sufficient information about Chapter {chapter} in the context,
+    explain what specific content would help you provide a better answer.
+13. Structure your answer to reflect the organization of Chapter {chapter} if possible.""",
+        "thin_context": """Important: The context information is limited or missing. Please:
+1. Acknowledge the limited information available
+2. Provide general information about the topic based on your knowledge
+3. Explain what specific details from the document would help you give a more complete answer
+4. Suggest alternative questions that might yield better results""",
+        "index_context": """Important: The context appears to be primarily from an index or reference section rather than
+substantive content. Please:
+1. Explain that you can see references to the topic but not the actual content
+2. Suggest more specific questions about concepts rather than just asking about a chapter or topic name
+3. Provide general information about the topic based on your knowledge
+4. Don't list the index entries or page numbers as they aren't helpful""",
+    },
+    "compact": {
+        "chapter": """The question is about Chapter {chapter}: focus on that chapter, follow its structure, and say what content is missing if the context doesn't cover it.""",
+        "thin_context": """The context is limited: say so, answer from general knowledge, and suggest what document details or other questions would help.""",
+        "index_context": """The context looks like an index: say the actual content isn't available, answer from general knowledge, and suggest asking about a specific concept.""",
+    },
+}
+
+# Agent backstories long enough to be worth a compact variant
+BACKSTORIES = {
+    "study_tutor": {
+        "full": """You are an expert educator with years of experience breaking down difficult concepts
+into understandable explanations. You excel at adapting your teaching style to match different
+learning preferences and maintaining engaging conversations.
+
+Your key strengths include:
+1. Breaking down complex topics into digestible pieces
+2. Providing clear, concrete examples
+3. Using analogies to connect new concepts with familiar ones
+4. Maintaining context across a conversation
+5. Identifying and addressing gaps in understanding
+6. Encouraging critical thinking and deeper exploration
+7. Adapting explanations based on the student's responses
+8. Referencing source material effectively
+
+You aim to not just answer questions, but to ensure deep understanding and
+help students build connections between different concepts.""",
+        "compact": "You are an expert educator who explains difficult concepts with clear examples and analogies, references the source material, and helps students connect ideas.",
+    },
+    "dsa_recommender": {
+        "full": "You are a seasoned technical interview coach with deep knowledge of data structures and algorithms. "
+                "You've helped hundreds of candidates prepare for top tech companies and understand the patterns "
+                "each company tends to focus on. You excel at creating personalized study plans based on a "
+                "candidate's background, target companies, and available preparation time.",
+        "compact": "You are a technical interview coach who knows which DSA patterns each company favors and tailors practice to a candidate's background, targets and time.",
+    },
+    "dsa_expert": {
+        "full": "You are an expert in data structures and algorithms with extensive experience in technical interviews. "
+                "You have a deep understanding of problem-solving techniques, algorithm design, and implementation. "
+                "You can generate practice questions, create study plans, and analyze code solutions to help candidates "
+                "prepare effectively for technical interviews.",
+        "compact": "You are a data structures and algorithms expert with technical interview experience who writes practice questions, study plans and code reviews.",
+    },
+    "coding_pattern_expert": {
+        "full": "You are an algorithm design expert who specializes in recognizing common patterns across seemingly "
+                "different problems. You help students develop a pattern-based approach to DSA problems rather than "
+                "memorizing individual solutions. You can break down complex problems into familiar patterns and "
+                "explain the underlying principles that connect different questions.",
+        "compact": "You are an algorithm design expert who teaches problems through the reusable patterns and principles behind them rather than memorized solutions.",
+    },
+    "interview_strategist": {
+        "full": "You are an expert in technical interview preparation with experience as both a candidate and "
+                "an interviewer at major tech companies. You understand that success in technical interviews "
+                "requires more than just solving problems - it requires clear communication, asking clarifying "
+                "questions, discussing trade-offs, and demonstrating problem-solving thought processes. You "
+                "help candidates develop these meta-skills alongside their technical knowledge.",
+        "compact": "You are an experienced interviewer and candidate who coaches communication, clarifying questions, trade-off discussions and visible problem solving alongside technical skill.",
+    },
+    "company_expert": {
+        "full": "You have extensive knowledge about the unique interview processes and preferences of major "
+                "tech companies. You understand how Amazon's leadership principles influence their questions, "
+                "how Google emphasizes algorithm efficiency, how Facebook focuses on scale, and how Microsoft "
+                "looks for well-rounded problem solvers. You help candidates customize their preparation for "
+                "specific target companies.",
+        "compact": "You know the interview styles of major tech companies (Amazon's leadership principles, Google's algorithmic efficiency, Facebook's scale, Microsoft's breadth) and tailor preparation to them.",
+    },
+}
+
+def get_variant(variant: Optional[str] = None) -> str:
+    variant = variant or PROMPT_VARIANT
+    if variant not in PROMPT_VARIANTS:
+        raise ValueError(f"Unknown prompt variant: {variant} (expected one of {', '.join(PROMPT_VARIANTS)})")
+    return variant
+
+def get_template(name: str, variant: Optional[str] = None) -> PromptTemplate:
+    return TEMPLATES[name][get_variant(variant)]
+
+def get_template_version(name: str, variant: Optional[str] = None) -> str:
+    """Version identifier of the prompt a task is rendered with, used in cache keys"""
+    return f"{TEMPLATE_VERSIONS.get(name, 0)}-{get_variant(variant)}"
+
+def get_backstory(role: str, variant: Optional[str] = None) -> str:
+    return BACKSTORIES[role][get_variant(variant)]
+
+def get_explanation_note(kind: str, variant: Optional[str] = None, **values) -> str:
+    return EXPLANATION_NOTES[get_variant(variant)][kind].format(**values)
+
+def render_prompt(
+    name: str,
+    context: Optional[str] = None,
+    notes: Optional[list] = None,
+    variant: Optional[str] = None,
+    **inputs
+) -> str:
+    """
+    Render a task description from a template.
+
+    Args:
+        name: Template name (explanation, notes, flashcards, mindmaps, tests)
+        context: Retrieved document context, placed last; omitted when None
+        notes: Extra per-request instructions, placed after the static instructions
+        variant: Template variant, defaults to PROMPT_VARIANT
+        **inputs: Values for the template's input fields
+
+    Returns:
+        str: The task description
+    """
+    template = get_template(name, variant)
+    parts = [template.instructions]
+    parts.extend(notes or [])
+    parts.append(template.inputs.format(**inputs))
+    if context is not None:
+        parts.append(f"Context information:\n{context}")
+    return "\n\n".join(parts)
+
+def format_topic_contexts(topics: List[str], contexts: List[str]) -> str:
+    """Join the contexts of a multi-topic task, each under its topic's marker line"""
+    return "\n\n".join(
+        f"{TOPIC_MARKER.format(topic=topic)}\n{context}" for topic, context in zip(topics, contexts)
+    )
+
+def measure_templates() -> Dict[str, Dict[str, int]]:
+    """Token counts of each template's static part (instructions and expected output), per variant"""
+    return {
+        name: {
+            variant: count_tokens(template.instructions) + count_tokens(template.expected_output)
+            for variant, template in variants.items()
+        }
+        for name, variants in TEMPLATES.items()
+    }
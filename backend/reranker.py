@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+from config import (
+    RERANK_MODEL_NAME, RERANK_BATCH_SIZE, RERANK_MAX_PENDING, RERANK_MAX_WAIT, RERANK_CACHE_SIZE
+)
+from retrieval_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+class ScoreCache:
+    """Thread-safe LRU cache of cross-encoder scores keyed by (query, chunk_id)"""
+
+    def __init__(self, max_size: int = RERANK_CACHE_SIZE):
+        self.max_size = max_size
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def set(self, key: Tuple[str, str], score: float):
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+
+score_cache = ScoreCache()
+
+# Number of rerank calls running or waiting for the model, used to shed load when the queue is deep
+_pending = 0
+_pending_lock = threading.Lock()
+# One batch is scored at a time; the model already uses every core
+_model_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def get_cross_encoder():
+    """Get cached instance of the cross-encoder used for reranking"""
+    from sentence_transformers import CrossEncoder
+
+    logger.info(f"Loading cross-encoder model {RERANK_MODEL_NAME}...")
+    model = CrossEncoder(RERANK_MODEL_NAME, device="cpu", max_length=512)
+    logger.info("Cross-encoder model loaded successfully")
+    return model
+
+def get_chunk_id(doc: Any) -> str:
+    """Get a stable identifier for a retrieved chunk"""
+    metadata = getattr(doc, "metadata", None) or {}
+    if "source" in metadata and "chunk" in metadata:
+        return f"{metadata['source']}:{metadata['chunk']}"
+    return hashlib.md5(doc.page_content.encode("utf-8")).hexdigest()
+
+def _try_acquire_slot() -> bool:
+    global _pending
+    with _pending_lock:
+        if _pending >= RERANK_MAX_PENDING:
+            return False
+        _pending += 1
+        return True
+
+def _release_slot():
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+def rerank_documents(query: str, docs: List[Any], top_k: int) -> List[Any]:
+    """
+    Rerank ANN hits with a cross-encoder and return the top_k best.
+
+    Scores are cached per (query, chunk_id), so only unseen pairs are sent to
+    the model, in batches. The model scores one call at a time; when
+    RERANK_MAX_PENDING calls are already running or waiting, or the model
+    stays busy for RERANK_MAX_WAIT seconds, the ANN order is returned
+    unchanged instead. Blocks, so async code calls it on a worker thread.
+
+    Args:
+        query: Query string
+        docs: Candidate documents from the vector search, best first
+        top_k: Number of documents to return
+
+    Returns:
+        List: The top_k documents by cross-encoder score
+    """
+    if len(docs) <= 1:
+        return docs[:top_k]
+
+    if not _try_acquire_slot():
+        logger.warning(f"Rerank queue is full ({RERANK_MAX_PENDING} pending), skipping reranking")
+        return docs[:top_k]
+
+    try:
+        normalized_query = normalize_query(query)
+        keys = [(normalized_query, get_chunk_id(doc)) for doc in docs]
+        scores = [score_cache.get(key) for key in keys]
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            model = get_cross_encoder()
+            pairs = [(query, docs[i].page_content) for i in missing]
+            if not _model_lock.acquire(timeout=RERANK_MAX_WAIT):
+                logger.warning(f"Cross-encoder busy for {RERANK_MAX_WAIT}s, skipping reranking")
+                return docs[:top_k]
+            try:
+                predicted = model.predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+            finally:
+                _model_lock.release()
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+                score_cache.set(keys[i], scores[i])
+
+        logger.info(f"Reranked {len(docs)} candidates ({len(docs) - len(missing)} cached scores)")
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order[:top_k]]
+    except Exception as e:
+        logger.error(f"Reranking failed, using vector search order: {e}", exc_info=True)
+        return docs[:top_k]
+    finally:
+        _release_slot()
@@ -0,0 +1,288 @@
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_DIR, RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_SEMANTIC, RESPONSE_CACHE_SIMILARITY
+)
+from prompts import get_template_version
+from llm_providers import get_provider_settings
+from file_store import write_file
+from retrieval_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ResponseKey:
+    """Everything a generated response depends on"""
+    task_type: str
+    template_version: str
+    model: str
+    topic: str
+    context_digest: str
+    document_id: Optional[str] = None
+    options: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(json.dumps([
+            self.task_type, self.template_version, self.model, self.topic,
+            self.context_digest, self.document_id, self.options
+        ], sort_keys=True).encode("utf-8")).hexdigest()
+
+    @property
+    def scope(self) -> tuple:
+        """Entries in the same scope may answer each other's near-duplicate topics"""
+        return (self.task_type, self.template_version, self.model, self.document_id,
+                json.dumps(self.options, sort_keys=True))
+
+class ResponseCache:
+    """
+    LRU cache of generated LLM responses, persisted to disk.
+
+    Exact hits require the same task, prompt template version, model,
+    normalized topic and retrieved context; the context is identified by a
+    digest of the retrieved chunks. With semantic matching enabled, a miss
+    falls back to the most similar cached topic for the same document and
+    options, provided its embedding similarity reaches the threshold.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = RESPONSE_CACHE_DIR,
+        max_entries: int = RESPONSE_CACHE_SIZE,
+        semantic: bool = RESPONSE_CACHE_SEMANTIC,
+        similarity_threshold: float = RESPONSE_CACHE_SIMILARITY
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self._entries: Optional[OrderedDict] = None
+        # Topic embeddings by normalized topic, so a lookup and the following store embed a topic once
+        self._embeddings: OrderedDict = OrderedDict()
+        # Cached entries' embeddings as arrays, by digest, built on the first semantic lookup that needs them
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def make_key(
+        self,
+        task_type: str,
+        topic: str,
+        context: str,
+        document_id: Optional[str] = None,
+        **options: Any
+    ) -> ResponseKey:
+        """
+        Build the cache key for a generation request.
+
+        Args:
+            task_type: Artifact type (notes, flashcards, mindmaps, tests)
+            topic: Requested topic
+            context: Retrieved document context sent to the LLM
+            document_id: Source document, used to scope semantic matches
+            **options: Other inputs that change the output, e.g. num_cards
+
+        Returns:
+            ResponseKey: The cache key
+        """
+        return ResponseKey(
+            task_type=task_type,
+            template_version=get_template_version(task_type),
+            model=get_provider_settings().model,
+            topic=normalize_query(topic),
+            context_digest=hashlib.sha256(context.encode("utf-8")).hexdigest(),
+            document_id=document_id,
+            options=options
+        )
+
+    def _read_entries(self) -> OrderedDict:
+        """Read the persisted entries, least recently written first"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                with open(path, "r") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable response cache entry {path.name}: {e}")
+                continue
+            # Truncated or older-format entries are skipped like unreadable ones
+            if not isinstance(entry, dict) or not entry.get("digest") or "response" not in entry:
+                logger.warning(f"Skipping incomplete response cache entry {path.name}")
+                continue
+            entries.append(entry)
+        entries.sort(key=lambda entry: entry.get("created_at", 0))
+        logger.info(f"Loaded {len(entries)} cached responses from {self.cache_dir}")
+        return OrderedDict((entry["digest"], entry) for entry in entries)
+
+    async def _load(self) -> OrderedDict:
+        """Load the persisted entries on first use; the files are read on a worker thread, not the event loop"""
+        if self._entries is None:
+            entries = await asyncio.to_thread(self._read_entries)
+            with self._lock:
+                if self._entries is None:
+                    self._entries = entries
+        return self._entries
+
+    def _remove_files(self, digests: List[str]):
+        for digest in digests:
+            (self.cache_dir / f"{digest}.json").unlink(missing_ok=True)
+
+    @staticmethod
+    def _compute_embedding(topic: str) -> Optional[List[float]]:
+        try:
+            from utils import get_embeddings
+            return get_embeddings().embed_query(topic)
+        except Exception as e:
+            logger.warning(f"Could not embed topic for semantic response cache: {e}")
+            return None
+
+    async def _embed(self, topic: str) -> Optional[List[float]]:
+        """Embedding of a normalized topic; the model runs on the agent thread pool, not the event loop"""
+        with self._lock:
+            embedding = self._embeddings.get(topic)
+            if embedding is not None:
+                self._embeddings.move_to_end(topic)
+                return embedding
+
+        from agent_runtime import run_blocking
+        embedding = await run_blocking(self._compute_embedding, topic)
+        if embedding is not None:
+            with self._lock:
+                self._embeddings[topic] = embedding
+                while len(self._embeddings) > self.max_entries:
+                    self._embeddings.popitem(last=False)
+        return embedding
+
+    def _find_similar(self, candidates: List[dict], key: ResponseKey, embedding: List[float]) -> Optional[dict]:
+        """The candidate most similar to the embedding, if it reaches the threshold; blocks, runs off the loop"""
+        query = np.asarray(embedding, dtype=np.float32)
+        matches = []
+        for entry in candidates:
+            vector = self._vectors.get(entry["digest"])
+            if vector is None:
+                vector = self._vectors[entry["digest"]] = np.asarray(entry["embedding"], dtype=np.float32)
+            # Entries embedded by another model cannot be compared
+            if vector.shape == query.shape:
+                matches.append((entry, vector))
+        if not matches:
+            return None
+
+        # Embeddings are L2-normalized, so the dot product is the cosine similarity
+        scores = np.stack([vector for _, vector in matches]) @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        entry = matches[best][0]
+        logger.info(f"Semantic response cache match: '{key.topic}' ~ '{entry['topic']}' ({scores[best]:.3f})")
+        return entry
+
+    async def get(self, key: ResponseKey) -> Optional[str]:
+        """Get the cached response for a key, or None"""
+        if not RESPONSE_CACHE_ENABLED:
+            return None
+
+        entries = await self._load()
+        with self._lock:
+            entry = entries.get(key.digest)
+            if entry is not None:
+                entries.move_to_end(key.digest)
+                self.hits += 1
+                return entry["response"]
+
+            if not self.semantic:
+                self.misses += 1
+                return None
+
+        # Embed and compare outside the lock, both are slow compared to a lookup
+        embedding = await self._embed(key.topic)
+        entry = None
+        if embedding is not None:
+            with self._lock:
+                candidates = [entry for entry in entries.values()
+                              if tuple(entry.get("scope") or ()) == key.scope and entry.get("embedding")]
+            if candidates:
+                from agent_runtime import run_blocking
+                entry = await run_blocking(self._find_similar, candidates, key, embedding)
+        with self._lock:
+            if entry is None or entry["digest"] not in entries:
+                self.misses += 1
+                return None
+            entries.move_to_end(entry["digest"])
+            self.semantic_hits += 1
+            return entry["response"]
+
+    async def set(self, key: ResponseKey, response: str):
+        """Cache a generated response and persist it"""
+        if not RESPONSE_CACHE_ENABLED or not response:
+            return
+
+        entry = {
+            "digest": key.digest,
+            "scope": list(key.scope),
+            "task_type": key.task_type,
+            "topic": key.topic,
+            "document_id": key.document_id,
+            "response": response,
+            "embedding": await self._embed(key.topic) if self.semantic else None,
+            "created_at": time.time(),
+        }
+
+        # The lock covers only the in-memory LRU; the files are written and removed after it is released
+        entries = await self._load()
+        with self._lock:
+            entries[key.digest] = entry
+            entries.move_to_end(key.digest)
+            self._vectors.pop(key.digest, None)
+            evicted = []
+            while len(entries) > self.max_entries:
+                digest, _ = entries.popitem(last=False)
+                self._vectors.pop(digest, None)
+                evicted.append(digest)
+
+        try:
+            await write_file(self.cache_dir / f"{key.digest}.json", json.dumps(entry))
+        except OSError as e:
+            logger.warning(f"Could not persist cached response: {e}")
+        with self._lock:
+            # Evicted or invalidated while it was being written
+            if key.digest not in entries:
+                evicted.append(key.digest)
+        if evicted:
+            await asyncio.to_thread(self._remove_files, evicted)
+
+    async def invalidate_document(self, document_id: str):
+        """Drop every cached response generated from a document"""
+        entries = await self._load()
+        with self._lock:
+            digests = [d for d, entry in entries.items() if entry.get("document_id") == document_id]
+            for digest in digests:
+                del entries[digest]
+                self._vectors.pop(digest, None)
+        await asyncio.to_thread(self._remove_files, digests)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters since startup; entries counts the cached responses loaded so far"""
+        with self._lock:
+            return {
+                "entries": len(self._entries or ()),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses
+            }
+
+response_cache = ResponseCache()
@@ -0,0 +1,109 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from config import RETRIEVAL_CACHE_SIZE, VECTOR_STORE_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query: str) -> str:
+    """
+    Case- and whitespace-insensitive form of a query or topic.
+
+    Shared by the retrieval, rerank score and response caches, so they agree
+    on which queries are the same.
+    """
+    return " ".join(query.lower().split())
+
+class RetrievalCache:
+    """
+    In-process cache of retrieved contexts and loaded vector stores.
+
+    Every document has a generation counter that is part of each cache key.
+    Reindexing or deleting a document bumps its generation, so stale entries
+    can never be returned; they are also dropped eagerly to free memory.
+    """
+
+    def __init__(self, max_contexts: int = RETRIEVAL_CACHE_SIZE, max_stores: int = VECTOR_STORE_CACHE_SIZE):
+        self.max_contexts = max_contexts
+        self.max_stores = max_stores
+        self._generations: Dict[str, int] = {}
+        self._contexts = OrderedDict()
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_generation(self, doc_id: str) -> int:
+        with self._lock:
+            return self._generations.get(doc_id, 0)
+
+    def invalidate_document(self, doc_id: str) -> int:
+        """Bump a document's generation and drop its cached entries"""
+        with self._lock:
+            generation = self._generations.get(doc_id, 0) + 1
+            self._generations[doc_id] = generation
+            for cache in (self._contexts, self._stores):
+                for key in [key for key in cache if key[0] == doc_id]:
+                    del cache[key]
+        logger.info(f"Invalidated retrieval cache for document {doc_id} (generation {generation})")
+        return generation
+
+    def make_key(self, doc_id: str, query: str, top_k: int, *options: Hashable) -> Tuple:
+        return (doc_id, self.get_generation(doc_id), normalize_query(query), top_k) + options
+
+    def get_context(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is None:
+                self.misses += 1
+                return None
+            self._contexts.move_to_end(key)
+            self.hits += 1
+            return context
+
+    def set_context(self, key: Tuple, context: str):
+        with self._lock:
+            # Skip results computed against a generation that has since been invalidated
+            if key[1] != self._generations.get(key[0], 0):
+                return
+            self._contexts[key] = context
+            self._contexts.move_to_end(key)
+            while len(self._contexts) > self.max_contexts:
+                self._contexts.popitem(last=False)
+
+    def get_vector_store(self, doc_id: str) -> Any:
+        with self._lock:
+            key = (doc_id, self._generations.get(doc_id, 0))
+            vector_store = self._stores.get(key)
+            if vector_store is not None:
+                self._stores.move_to_end(key)
+            return vector_store
+
+    def set_vector_store(self, doc_id: str, vector_store: Any, generation: Optional[int] = None):
+        with self._lock:
+            current = self._generations.get(doc_id, 0)
+            if generation is not None and generation != current:
+                return
+            key = (doc_id, current)
+            self._stores[key] = vector_store
+            self._stores.move_to_end(key)
+            while len(self._stores) > self.max_stores:
+                self._stores.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._contexts.clear()
+            self._stores.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "contexts": len(self._contexts),
+                "vector_stores": len(self._stores),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+retrieval_cache = RetrievalCache()
@@ -18,6 +18,8 @@ from utils import (
     get_processed_documents,
     DocumentProcessingError
 )
+from retrieval_cache import retrieval_cache
+from response_cache import response_cache
 
 # Constants
 SUPPORTED_FILE_TYPES = {'pdf', 'docx', 'txt'}
@@ -216,6 +218,10 @@ async def delete_document(document_id: str):
         if vector_store_path.exists() and vector_store_path.is_dir():
             import shutil
             shutil.rmtree(vector_store_path)
+        
+        # Drop cached retrieval results and generated responses for the deleted document
+        retrieval_cache.invalidate_document(document_id)
+        await response_cache.invalidate_document(document_id)
             
         return {"message": f"Document {document_id} deleted successfully"}
     except Exception as e:
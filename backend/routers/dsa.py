@@ -1,53 +1,31 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Request, Depends
 from typing import List, Dict, Any
-from pydantic import BaseModel
-import os
-import json
 import uuid
 from datetime import datetime
 
-from models.schemas import DSAFilterRequest, DSAQuestion
-from agents import create_dsa_expert_agent, create_dsa_question_generation_task, create_dsa_plan_generation_task, create_dsa_code_analysis_task, run_agent_task
+from models.schemas import DSAFilterRequest, DSAQuestion, CodeAnalysisRequest, CodeAnalysisResponse
+from agents import create_dsa_question_generation_task, create_dsa_plan_generation_task, create_dsa_code_analysis_task
+from agent_runtime import run_agent_task_async
+from structured_output import structured_artifact
+from artifact_store import artifact_store, ArtifactQuery, list_artifacts
 
 router = APIRouter()
 
-# Storage directory
-DSA_DIR = "./storage/dsa"
-os.makedirs(DSA_DIR, exist_ok=True)
-
-# New model for code analysis request
-class CodeAnalysisRequest(BaseModel):
-    code: str
-    problem: str = ""
-    language: str = "python"
-
-# New model for code analysis response
-class CodeAnalysisResponse(BaseModel):
-    bugs: List[str] = []
-    optimizations: List[str] = []
-    improved_code: str = ""
-    time_complexity: str = ""
-    space_complexity: str = ""
-    explanation: str = ""
-
 @router.get("/questions", response_model=List[DSAQuestion])
-async def get_dsa_questions(filter_request: DSAFilterRequest):
+async def get_dsa_questions(filter_request: DSAFilterRequest, http_request: Request):
     """Get DSA questions based on filters"""
     try:
-        # Create DSA expert agent
-        dsa_expert = create_dsa_expert_agent()
-        
-        # Create question generation task
-        question_task = create_dsa_question_generation_task(
-            dsa_expert,
+        # Create and execute the question generation task
+        questions_data = await run_agent_task_async(
+            "dsa_expert",
+            create_dsa_question_generation_task,
             filter_request.topic,
             filter_request.difficulty,
-            filter_request.count
+            filter_request.count,
+            route="dsa",
+            request=http_request
         )
         
-        # Execute task
-        questions_data = run_agent_task(dsa_expert, question_task)
-        
         # Parse questions data
         from utils import parse_dsa_questions_from_text
         questions = parse_dsa_questions_from_text(questions_data)
@@ -58,26 +36,25 @@ async def get_dsa_questions(filter_request: DSAFilterRequest):
             question.created_at = datetime.now().isoformat()
         
         return questions
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating DSA questions: {str(e)}")
 
 @router.post("/plan")
-async def generate_dsa_plan(days_available: int = Body(10), hours_per_day: int = Body(2)):
+async def generate_dsa_plan(http_request: Request, days_available: int = Body(10), hours_per_day: int = Body(2)):
     """Generate a personalized DSA study plan"""
     try:
-        # Create DSA expert agent
-        dsa_expert = create_dsa_expert_agent()
-        
-        # Create plan generation task
-        plan_task = create_dsa_plan_generation_task(
-            dsa_expert,
+        # Create and execute the plan generation task
+        plan_data = await run_agent_task_async(
+            "dsa_expert",
+            create_dsa_plan_generation_task,
             days_available,
-            hours_per_day
+            hours_per_day,
+            route="dsa",
+            request=http_request
         )
         
-        # Execute task
-        plan_data = run_agent_task(dsa_expert, plan_task)
-        
         # Parse plan data
         from utils import parse_dsa_plan_from_text
         plan = parse_dsa_plan_from_text(plan_data)
@@ -85,40 +62,42 @@ async def generate_dsa_plan(days_available: int = Body(10), hours_per_day: int =
         # Generate a unique ID for the plan
         plan_id = str(uuid.uuid4())[:8]
         
-        # Save plan to file
+        # Save plan
         plan["id"] = plan_id
         plan["created_at"] = datetime.now().isoformat()
-        
-        with open(f"{DSA_DIR}/plan_{plan_id}.json", "w") as f:
-            json.dump(plan, f)
+        await artifact_store.put_async("dsa_plans", plan)
         
         return plan
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating DSA plan: {str(e)}")
 
 @router.post("/analyze-code", response_model=CodeAnalysisResponse)
-async def analyze_code(request: CodeAnalysisRequest):
+async def analyze_code(request: CodeAnalysisRequest, http_request: Request):
     """Analyze and debug DSA code submission"""
     try:
-        # Create DSA expert agent
-        dsa_expert = create_dsa_expert_agent()
-        
-        # Create code analysis task with problem context
-        analysis_task = create_dsa_code_analysis_task(
-            dsa_expert,
+        # Create and execute the code analysis task with problem context
+        structured = structured_artifact("code_analysis")
+        analysis_data = await run_agent_task_async(
+            "dsa_expert",
+            create_dsa_code_analysis_task,
             request.code,
             request.language,
-            request.problem
+            request.problem,
+            route="dsa",
+            request=http_request,
+            structured_output=structured
         )
         
-        # Execute task
-        analysis_data = run_agent_task(dsa_expert, analysis_task)
-        
         # Parse analysis data
-        from utils import parse_code_analysis
-        analysis = parse_code_analysis(analysis_data)
+        if structured:
+            analysis = CodeAnalysisResponse.model_validate_json(analysis_data).model_dump()
+        else:
+            from utils import parse_code_analysis
+            analysis = parse_code_analysis(analysis_data)
         
-        # Save analysis to file for history tracking
+        # Save analysis for history tracking
         analysis_id = str(uuid.uuid4())[:8]
         analysis_record = {
             "id": analysis_id,
@@ -129,52 +108,33 @@ async def analyze_code(request: CodeAnalysisRequest):
             "created_at": datetime.now().isoformat()
         }
         
-        os.makedirs(f"{DSA_DIR}/code_analysis", exist_ok=True)
-        with open(f"{DSA_DIR}/code_analysis/analysis_{analysis_id}.json", "w") as f:
-            json.dump(analysis_record, f)
+        await artifact_store.put_async("code_analyses", analysis_record)
         
         return analysis
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing code: {str(e)}")
 
 @router.get("/plans")
-async def get_all_plans():
-    """Get all DSA study plans"""
-    plans = []
-    
-    if not os.path.exists(DSA_DIR):
-        return plans
-    
-    for file in os.listdir(DSA_DIR):
-        if file.startswith("plan_") and file.endswith(".json"):
-            with open(f"{DSA_DIR}/{file}", "r") as f:
-                plan = json.load(f)
-                plans.append(plan)
-    
-    # Sort by creation date (newest first)
-    plans.sort(key=lambda x: x["created_at"], reverse=True)
-    return plans
+async def get_all_plans(query: ArtifactQuery = Depends()):
+    """Get DSA study plans, newest first, a page at a time"""
+    return await list_artifacts("dsa_plans", query)
 
 @router.get("/plans/{plan_id}")
 async def get_plan(plan_id: str):
     """Get a specific DSA study plan"""
-    plan_path = f"{DSA_DIR}/plan_{plan_id}.json"
+    plan = await artifact_store.get_async("dsa_plans", plan_id)
     
-    if not os.path.exists(plan_path):
+    if plan is None:
         raise HTTPException(status_code=404, detail="Plan not found")
     
-    with open(plan_path, "r") as f:
-        plan = json.load(f)
-    
     return plan
 
 @router.delete("/plans/{plan_id}")
 async def delete_plan(plan_id: str):
     """Delete a DSA study plan"""
-    plan_path = f"{DSA_DIR}/plan_{plan_id}.json"
-    
-    if not os.path.exists(plan_path):
+    if not await artifact_store.delete_async("dsa_plans", plan_id):
         raise HTTPException(status_code=404, detail="Plan not found")
     
-    os.remove(plan_path)
     return {"status": "success", "message": "Plan deleted successfully"}
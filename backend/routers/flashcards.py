@@ -1,23 +1,131 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, HTTPException, Request, Depends
+from typing import Any, Dict, List
 import os
-import json
 import uuid
 from datetime import datetime
-import re
+import logging
+from pydantic import ValidationError
 
-from models.schemas import FlashcardRequest, FlashcardDeck, Flashcard
-from utils import get_document_context, get_document_by_id
-from agents import create_flashcard_specialist_agent, create_flashcard_generation_task, run_agent_task
+from models.schemas import (
+    FlashcardRequest, FlashcardDeck, Flashcard, FlashcardResponse, BatchFlashcardRequest, BatchFlashcardResponse
+)
+from utils import (
+    get_document_context_async, get_document_contexts_async, get_document_by_id, parse_flashcards_from_text, normalize_flashcards
+)
+from agents import create_flashcard_generation_task, create_batch_flashcard_generation_task
+from agent_runtime import run_agent_task_async, stream_agent_task
+from batching import unique_topics, run_batch_tasks
+from cancellation import request_deadline
+from config import BATCH_MAX_TOPICS
+from response_cache import response_cache
+from structured_output import structured_artifact, JSONArrayStream
+from streaming import stream_tokens
+from artifact_store import artifact_store, ArtifactQuery, list_artifacts
+from file_store import write_file
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-# Storage directory
+# Raw responses that could not be parsed are kept here for debugging
 FLASHCARDS_DIR = "./storage/flashcards"
 os.makedirs(FLASHCARDS_DIR, exist_ok=True)
 
+async def parse_flashcard_data(flashcard_data: str, structured: bool = False) -> List[Dict[str, Any]]:
+    """Parse the generated flashcards; raw responses without any card are saved for debugging"""
+    logger.debug(f"Raw AI response length: {len(flashcard_data)} characters")
+    
+    # Parse flashcard data
+    try:
+        if structured:
+            # Already validated JSON, see structured_output
+            flashcards = [card.model_dump() for card in FlashcardResponse.model_validate_json(flashcard_data).cards]
+        else:
+            flashcards = parse_flashcards_from_text(flashcard_data)
+    except Exception as parse_error:
+        logger.error(f"Error parsing flashcards: {str(parse_error)}")
+        # Save the raw response for troubleshooting
+        debug_path = f"{FLASHCARDS_DIR}/debug_error_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        await write_file(debug_path, flashcard_data)
+        # Create fallback flashcards
+        flashcards = [
+            {
+                "front": "Error Card - Failed to parse flashcards", 
+                "back": "Please try regenerating with a different topic"
+            }
+        ]
+        
+    logger.debug(f"Parsed {len(flashcards)} flashcards from AI response")
+    if len(flashcards) == 0:
+        logger.warning("No flashcards were parsed, saving raw response for debugging")
+        # Save the raw response for debugging
+        debug_path = f"{FLASHCARDS_DIR}/debug_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        await write_file(debug_path, flashcard_data)
+        
+        # Create at least one default card to prevent empty deck
+        flashcards = [
+            {
+                "front": "Error Card - The AI generated no parseable flashcards", 
+                "back": "Please try regenerating cards with a more specific topic"
+            }
+        ]
+    
+    return flashcards
+
+def new_flashcard_deck(
+    topic: str, document_id: str, flashcards: List[Dict[str, Any]], partial: bool = False
+) -> FlashcardDeck:
+    """Normalize parsed flashcards into a new, unsaved deck; the card text is kept exactly as generated"""
+    valid_flashcards = normalize_flashcards(flashcards)
+    
+    # If all cards were invalid, add an error card
+    if not valid_flashcards:
+        valid_flashcards = [{
+            "front": "Error - No valid flashcards could be created", 
+            "back": "Please try again with more specific instructions"
+        }]
+    
+    logger.info(f"Final count after validation: {len(valid_flashcards)} flashcards")
+    
+    # Generate a unique ID for the deck
+    deck_id = str(uuid.uuid4())[:8]
+    
+    # Create flashcard deck
+    return FlashcardDeck(
+        id=deck_id,
+        topic=topic,
+        cards=valid_flashcards,  # Uses 'cards' to match the schema
+        document_id=document_id,
+        created_at=datetime.now().isoformat(),
+        partial=partial
+    )
+
+async def save_flashcard_deck(
+    topic: str, document_id: str, flashcards: List[Dict[str, Any]], partial: bool = False
+) -> FlashcardDeck:
+    """Normalize parsed flashcards and save them as a new deck; partial marks a deck cut short by the deadline"""
+    deck = new_flashcard_deck(topic, document_id, flashcards, partial)
+    
+    try:
+        await artifact_store.put_async("flashcards", deck.dict())
+        return deck
+    except Exception as save_error:
+        logger.error(f"Error saving flashcard deck: {str(save_error)}")
+        # Create a simple error-free deck as fallback
+        fallback_deck = FlashcardDeck(
+            id=deck.id,
+            topic=topic,
+            cards=[{"front": "Error creating flashcards", "back": "Please try again with a different topic"}],
+            document_id=document_id,
+            created_at=datetime.now().isoformat()
+        )
+        return fallback_deck
+
+async def build_flashcard_deck(topic: str, document_id: str, flashcard_data: str, structured: bool = False) -> FlashcardDeck:
+    """Parse the generated flashcards, then save them as a new deck"""
+    return await save_flashcard_deck(topic, document_id, await parse_flashcard_data(flashcard_data, structured))
+
 @router.post("/generate", response_model=FlashcardDeck)
-async def generate_flashcards(request: FlashcardRequest):
+async def generate_flashcards(request: FlashcardRequest, http_request: Request):
     """Generate flashcards for a topic and document"""
     # Validate document exists
     document = get_document_by_id(request.document_id)
@@ -26,183 +134,154 @@ async def generate_flashcards(request: FlashcardRequest):
     
     try:
         # Get document context
-        context = get_document_context(request.topic, request.document_id)
+        context = await get_document_context_async(request.topic, request.document_id, task="flashcards", rerank=True)
         
-        # Create flashcard specialist agent
-        flashcard_specialist = create_flashcard_specialist_agent()
-        
-        # Create flashcard generation task
-        flashcard_task = create_flashcard_generation_task(
-            flashcard_specialist, 
-            request.topic, 
+        # Create and execute the flashcard generation task
+        logger.info(f"Generating flashcards for topic: {request.topic} with {request.num_cards} cards requested")
+        structured = structured_artifact("flashcards")
+        flashcard_data = await run_agent_task_async(
+            "flashcard_specialist",
+            create_flashcard_generation_task,
+            request.topic,
             context,
-            num_cards=request.num_cards
-        )
-        
-        # Execute task
-        print(f"Generating flashcards for topic: {request.topic} with {request.num_cards} cards requested")
-        flashcard_data = run_agent_task(flashcard_specialist, flashcard_task)
-        print(f"Raw AI response length: {len(flashcard_data)} characters")
-        print(f"First 200 chars of AI response: {flashcard_data[:200]}...")
-        
-        # Safety: Escape any potential string format specifiers in the AI response
-        # This prevents "%s" or similar in the text from being interpreted as format specifiers
-        flashcard_data = flashcard_data.replace("%", "%%")
-        
-        # Parse flashcard data
-        from utils import parse_flashcards_from_text
-        try:
-            flashcards = parse_flashcards_from_text(flashcard_data)
-        except Exception as parse_error:
-            print(f"ERROR parsing flashcards: {str(parse_error)}")
-            # Create a debug file with escaped content for troubleshooting
-            debug_path = f"{FLASHCARDS_DIR}/debug_error_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-            with open(debug_path, "w") as f:
-                f.write(flashcard_data)
-            # Create fallback flashcards
-            flashcards = [
-                {
-                    "front": "Error Card - Failed to parse flashcards", 
-                    "back": "Please try regenerating with a different topic"
-                }
-            ]
-            
-        print(f"Parsed {len(flashcards)} flashcards from AI response")
-        if len(flashcards) == 0:
-            print("WARNING: No flashcards were parsed! Saving raw response for debugging.")
-            # Save the raw response for debugging
-            debug_path = f"{FLASHCARDS_DIR}/debug_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-            with open(debug_path, "w") as f:
-                f.write(flashcard_data)
-            
-            # Create at least one default card to prevent empty deck
-            flashcards = [
-                {
-                    "front": "Error Card - The AI generated no parseable flashcards", 
-                    "back": "Please try regenerating cards with a more specific topic"
-                }
-            ]
-        
-        # Final validation and normalization of flashcards - with extra safety measures
-        valid_flashcards = []
-        for i, card in enumerate(flashcards):
-            try:
-                # Skip cards without both front and back
-                if not card.get('front') or not card.get('back'):
-                    print(f"Skipping card {i} - missing front or back content")
-                    continue
-                    
-                # Ensure the card has exactly front and back fields with proper escaping
-                valid_card = {
-                    "front": str(card.get('front', '')).replace("%", "%%").strip(),
-                    "back": str(card.get('back', '')).replace("%", "%%").strip()
-                }
-                
-                # Remove any card numbers or prefixes like "Card 1:" from content
-                for side in ['front', 'back']:
-                    content = valid_card[side]
-                    # Remove "Card X:" prefixes
-                    content = re.sub(r'^Card\s*\d+:?\s*', '', content)
-                    # Remove "Front:" or "Back:" prefixes
-                    content = re.sub(r'^(Front|Back):\s*', '', content)
-                    # Remove "Question:" or "Answer:" prefixes
-                    content = re.sub(r'^(Question|Answer):\s*', '', content)
-                    # Trim any extra whitespace
-                    valid_card[side] = content.strip()
-                
-                # Only add card if both sides have content after cleanup
-                if valid_card["front"] and valid_card["back"]:
-                    valid_flashcards.append(valid_card)
-            except Exception as card_error:
-                print(f"Error processing card {i}: {str(card_error)}")
-                continue
-        
-        # If all cards were invalid, add an error card
-        if not valid_flashcards:
-            valid_flashcards = [{
-                "front": "Error - No valid flashcards could be created", 
-                "back": "Please try again with more specific instructions"
-            }]
-        
-        print(f"Final count after validation: {len(valid_flashcards)} flashcards")
-        
-        # Generate a unique ID for the deck
-        deck_id = str(uuid.uuid4())[:8]
-        
-        # Create flashcard deck
-        deck = FlashcardDeck(
-            id=deck_id,
-            topic=request.topic,
-            cards=valid_flashcards,  # Uses 'cards' to match the schema
-            document_id=request.document_id,
-            created_at=datetime.now().isoformat()
-        )
-        
-        # Extra safety: validate serialization before saving
-        try:
-            # Test JSON serialization to catch any formatting issues
-            json_data = json.dumps(deck.dict())
-            
-            # Save deck to file
-            with open(f"{FLASHCARDS_DIR}/{deck_id}.json", "w") as f:
-                f.write(json_data)
-            
-            return deck
-        except Exception as json_error:
-            print(f"ERROR in JSON serialization: {str(json_error)}")
-            # Create a simple error-free deck as fallback
-            fallback_deck = FlashcardDeck(
-                id=deck_id,
-                topic=request.topic,
-                cards=[{"front": "Error creating flashcards", "back": "Please try again with a different topic"}],
-                document_id=request.document_id,
-                created_at=datetime.now().isoformat()
+            num_cards=request.num_cards,
+            route="flashcards",
+            request=http_request,
+            structured_output=structured,
+            cache_key=response_cache.make_key(
+                "flashcards", request.topic, context, request.document_id, num_cards=request.num_cards
             )
-            return fallback_deck
-            
+        )
+        return await build_flashcard_deck(request.topic, request.document_id, flashcard_data, structured=bool(structured))
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"ERROR in flashcard generation: {str(e)}")
+        logger.error(f"Error in flashcard generation: {str(e)}", exc_info=True)
         # Provide a more generic error message to avoid exposing formatting issues
         raise HTTPException(status_code=500, detail="Error generating flashcards. Please try again with a different topic.")
 
-@router.get("/", response_model=List[FlashcardDeck])
-async def get_all_flashcards():
-    """Get all flashcard decks"""
-    decks = []
+@router.post("/generate/stream")
+async def generate_flashcards_stream(request: FlashcardRequest, http_request: Request):
+    """Generate flashcards, streaming each card as a server-sent event once it is complete; the saved deck is sent last"""
+    # Validate document exists
+    document = get_document_by_id(request.document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    try:
+        context = await get_document_context_async(request.topic, request.document_id, task="flashcards", rerank=True)
+    except Exception as e:
+        logger.error(f"Error in flashcard generation: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error generating flashcards. Please try again with a different topic.")
+    
+    # The cards are read from the JSON answer as it arrives
+    parser = JSONArrayStream()
+    cards = []
+    
+    def new_cards(chunk: str):
+        for item in parser.feed(chunk):
+            try:
+                card = Flashcard.model_validate(item)
+            except ValidationError:
+                logger.warning(f"Skipping invalid streamed flashcard: {str(item)[:100]}")
+                continue
+            cards.append(card)
+            yield card.dict()
+    
+    async def done(flashcard_data: str, partial: bool):
+        # Built from the streamed cards, so a partial answer keeps every card that was complete
+        deck = await save_flashcard_deck(
+            request.topic, request.document_id, [card.dict() for card in cards], partial=partial
+        )
+        return deck.dict()
+    
+    logger.info(f"Streaming flashcards for topic: {request.topic} with {request.num_cards} cards requested")
+    tokens = stream_agent_task(
+        "flashcard_specialist",
+        create_flashcard_generation_task,
+        request.topic,
+        context,
+        num_cards=request.num_cards,
+        route="flashcards",
+        request=http_request,
+        structured_output="flashcards",
+        cache_key=response_cache.make_key(
+            "flashcards", request.topic, context, request.document_id, num_cards=request.num_cards
+        )
+    )
+    return stream_tokens(tokens, done, items=new_cards, item_event="card")
+
+@router.post("/generate/batch", response_model=BatchFlashcardResponse)
+async def generate_flashcards_batch(request: BatchFlashcardRequest, http_request: Request):
+    """Generate a flashcard deck for each of several topics of one document"""
+    # Validate document exists
+    document = get_document_by_id(request.document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    topics = unique_topics(request.topics)
+    if not topics:
+        raise HTTPException(status_code=400, detail="No topics given")
+    if len(topics) > BATCH_MAX_TOPICS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_TOPICS} topics can be generated at once")
+    
+    try:
+        # One batched search for all topics, then as few LLM calls as the context budget allows
+        contexts = await get_document_contexts_async(topics, request.document_id, task="flashcards", rerank=True)
+        logger.info(f"Generating flashcards for {len(topics)} topics with {request.num_cards} cards each")
+        results = await run_batch_tasks(
+            "flashcard_specialist",
+            create_flashcard_generation_task,
+            create_batch_flashcard_generation_task,
+            "flashcards",
+            topics,
+            contexts,
+            request.document_id,
+            route="flashcards",
+            deadline=request_deadline("batch"),
+            request=http_request,
+            num_cards=request.num_cards
+        )
+    except Exception as e:
+        logger.error(f"Error in batch flashcard generation: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error generating flashcards. Please try again.")
     
-    if not os.path.exists(FLASHCARDS_DIR):
-        return decks
+    decks = []
+    failed_topics = []
+    for topic, flashcard_data in zip(topics, results):
+        if flashcard_data is None:
+            failed_topics.append(topic)
+        else:
+            decks.append(new_flashcard_deck(topic, request.document_id, await parse_flashcard_data(flashcard_data)))
     
-    for file in os.listdir(FLASHCARDS_DIR):
-        if file.endswith(".json"):
-            with open(f"{FLASHCARDS_DIR}/{file}", "r") as f:
-                deck = json.load(f)
-                decks.append(FlashcardDeck(**deck))
+    # All decks in one transaction
+    try:
+        await artifact_store.put_many_async("flashcards", [deck.dict() for deck in decks])
+    except Exception as e:
+        logger.error(f"Error saving flashcard decks: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error saving flashcards. Please try again.")
     
-    # Sort by creation date (newest first)
-    decks.sort(key=lambda x: x.created_at, reverse=True)
-    return decks
+    return BatchFlashcardResponse(decks=decks, failed_topics=failed_topics)
+
+@router.get("/", response_model=List[FlashcardDeck])
+async def get_all_flashcards(query: ArtifactQuery = Depends()):
+    """Get flashcard decks, newest first, a page at a time, optionally filtered by document or topic"""
+    return await list_artifacts("flashcards", query)
 
 @router.get("/{deck_id}", response_model=FlashcardDeck)
 async def get_flashcard_deck(deck_id: str):
     """Get a specific flashcard deck"""
-    deck_path = f"{FLASHCARDS_DIR}/{deck_id}.json"
+    deck = await artifact_store.get_async("flashcards", deck_id)
     
-    if not os.path.exists(deck_path):
+    if deck is None:
         raise HTTPException(status_code=404, detail="Flashcard deck not found")
     
-    with open(deck_path, "r") as f:
-        deck = json.load(f)
-    
     return FlashcardDeck(**deck)
 
 @router.delete("/{deck_id}")
 async def delete_flashcard_deck(deck_id: str):
     """Delete a flashcard deck"""
-    deck_path = f"{FLASHCARDS_DIR}/{deck_id}.json"
-    
-    if not os.path.exists(deck_path):
+    if not await artifact_store.delete_async("flashcards", deck_id):
         raise HTTPException(status_code=404, detail="Flashcard deck not found")
     
-    os.remove(deck_path)
     return {"status": "success", "message": "Flashcard deck deleted successfully"}
\ No newline at end of file
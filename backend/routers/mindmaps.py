@@ -1,22 +1,49 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Depends
 from typing import List
-import os
-import json
 import uuid
+import asyncio
 from datetime import datetime
 
 from models.schemas import MindMapRequest, MindMap
-from utils import get_document_context, get_document_by_id
-from agents import create_visual_learning_expert_agent, create_mind_map_task, run_agent_task
+from utils import (
+    get_document_context_async, get_document_by_id, generate_mind_map_data, layout_mind_map, MINDMAP_LAYOUTS
+)
+from config import MINDMAP_LAYOUT
+from agents import create_mind_map_task
+from agent_runtime import run_agent_task_async
+from response_cache import response_cache
+from artifact_store import artifact_store, ArtifactQuery, list_artifacts
 
 router = APIRouter()
 
-# Storage directory
-MINDMAPS_DIR = "./storage/mindmaps"
-os.makedirs(MINDMAPS_DIR, exist_ok=True)
+def apply_layout(mindmap: MindMap, layout: str = MINDMAP_LAYOUT) -> bool:
+    """
+    Set the mind map's node coordinates from a server-side layout; returns whether any were set.
+
+    The layout is recorded even when it sets none, "off" included, so only maps
+    saved before server-side layouts are left with layout None.
+    """
+    mindmap.layout = layout if layout in MINDMAP_LAYOUTS else "off"
+    positions = layout_mind_map(
+        [node.dict() for node in mindmap.nodes],
+        [edge.dict(by_alias=True) for edge in mindmap.edges],
+        layout
+    )
+    if not positions:
+        return False
+    for node in mindmap.nodes:
+        node.x, node.y = positions.get(node.id, (None, None))
+    return True
+
+def load_mindmap(data: dict) -> MindMap:
+    """A saved mind map; maps saved before server-side layouts are laid out as they are read, not saved again"""
+    mindmap = MindMap(**data)
+    if mindmap.layout is None:
+        apply_layout(mindmap)
+    return mindmap
 
 @router.post("/generate", response_model=MindMap)
-async def generate_mindmap(request: MindMapRequest):
+async def generate_mindmap(request: MindMapRequest, http_request: Request):
     """Generate a mind map for a topic and document"""
     # Validate document exists
     document = get_document_by_id(request.document_id)
@@ -25,24 +52,21 @@ async def generate_mindmap(request: MindMapRequest):
     
     try:
         # Get document context
-        context = get_document_context(request.topic, request.document_id)
-        
-        # Create visual learning expert agent
-        visual_expert = create_visual_learning_expert_agent()
+        context = await get_document_context_async(request.topic, request.document_id, task="mindmaps")
         
-        # Create mind map task
-        mindmap_task = create_mind_map_task(
-            visual_expert, 
-            request.topic, 
-            context
+        # Create and execute the mind map task
+        mindmap_data = await run_agent_task_async(
+            "visual_learning_expert",
+            create_mind_map_task,
+            request.topic,
+            context,
+            route="mindmaps",
+            request=http_request,
+            cache_key=response_cache.make_key("mindmaps", request.topic, context, request.document_id)
         )
         
-        # Execute task
-        mindmap_data = run_agent_task(visual_expert, mindmap_task)
-        
-        # Parse mind map data
-        from utils import generate_mind_map_data
-        graph_data = generate_mind_map_data(mindmap_data)
+        # Parse the outline into nodes and edges
+        graph_data = generate_mind_map_data(mindmap_data, topic=request.topic)
         
         # Generate a unique ID for the mind map
         map_id = str(uuid.uuid4())[:8]
@@ -54,55 +78,42 @@ async def generate_mindmap(request: MindMapRequest):
             nodes=graph_data["nodes"],
             edges=graph_data["edges"],
             document_id=request.document_id,
-            created_at=datetime.now().isoformat()
+            created_at=datetime.now().isoformat(),
+            description=mindmap_data
         )
+        apply_layout(mindmap, request.layout or MINDMAP_LAYOUT)
         
-        # Save mind map to file
-        with open(f"{MINDMAPS_DIR}/{map_id}.json", "w") as f:
-            json.dump(mindmap.dict(), f)
+        await artifact_store.put_async("mindmaps", mindmap.dict(by_alias=True))
         
         return mindmap
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating mind map: {str(e)}")
 
 @router.get("/", response_model=List[MindMap])
-async def get_all_mindmaps():
-    """Get all mind maps"""
-    mindmaps = []
-    
-    if not os.path.exists(MINDMAPS_DIR):
-        return mindmaps
-    
-    for file in os.listdir(MINDMAPS_DIR):
-        if file.endswith(".json"):
-            with open(f"{MINDMAPS_DIR}/{file}", "r") as f:
-                mindmap = json.load(f)
-                mindmaps.append(MindMap(**mindmap))
-    
-    # Sort by creation date (newest first)
-    mindmaps.sort(key=lambda x: x.created_at, reverse=True)
-    return mindmaps
+async def get_all_mindmaps(query: ArtifactQuery = Depends()):
+    """Get mind maps, newest first, a page at a time, optionally filtered by document or topic"""
+    return await list_artifacts(
+        "mindmaps", query,
+        prepare=lambda mindmap: load_mindmap(mindmap).dict(by_alias=True), prepared_fields={"nodes", "layout"}
+    )
 
 @router.get("/{map_id}", response_model=MindMap)
 async def get_mindmap(map_id: str):
     """Get a specific mind map"""
-    map_path = f"{MINDMAPS_DIR}/{map_id}.json"
+    mindmap = await artifact_store.get_async("mindmaps", map_id)
     
-    if not os.path.exists(map_path):
+    if mindmap is None:
         raise HTTPException(status_code=404, detail="Mind map not found")
     
-    with open(map_path, "r") as f:
-        mindmap = json.load(f)
-    
-    return MindMap(**mindmap)
+    # An old map is laid out here, which is CPU work
+    return await asyncio.to_thread(load_mindmap, mindmap)
 
 @router.delete("/{map_id}")
 async def delete_mindmap(map_id: str):
     """Delete a mind map"""
-    map_path = f"{MINDMAPS_DIR}/{map_id}.json"
-    
-    if not os.path.exists(map_path):
+    if not await artifact_store.delete_async("mindmaps", map_id):
         raise HTTPException(status_code=404, detail="Mind map not found")
     
-    os.remove(map_path)
     return {"status": "success", "message": "Mind map deleted successfully"}
\ No newline at end of file
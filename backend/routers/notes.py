@@ -1,22 +1,43 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import List, Dict, Any
 import uuid
-import os
-import json
 from datetime import datetime
 
-from models.schemas import NotesRequest, NotesResponse
-from utils import get_document_context, get_document_by_id
-from agents import create_note_taker_agent
+from models.schemas import NotesRequest, NotesResponse, BatchNotesRequest, BatchNotesResponse
+from utils import get_document_context_async, get_document_contexts_async, get_document_by_id
+from agents import create_notes_generation_task, create_batch_notes_generation_task
+from agent_runtime import run_agent_task_async, stream_agent_task
+from batching import unique_topics, run_batch_tasks
+from cancellation import request_deadline
+from config import BATCH_MAX_TOPICS
+from response_cache import response_cache
+from streaming import stream_tokens
+from artifact_store import artifact_store, ArtifactQuery, list_artifacts
 
 router = APIRouter()
 
-# Store notes in a persistent file
-NOTES_DIR = "./storage/notes"
-os.makedirs(NOTES_DIR, exist_ok=True)
+def new_notes(request: NotesRequest, notes_content: str, partial: bool = False) -> Dict[str, Any]:
+    """A new, unsaved notes record for generated notes"""
+    # Generate a unique ID for the notes
+    note_id = str(uuid.uuid4())[:8]
+    
+    return {
+        "id": note_id,
+        "topic": request.topic,
+        "content": notes_content,
+        "document_id": request.document_id,
+        "created_at": datetime.now().isoformat(),
+        "partial": partial
+    }
+
+async def save_notes(request: NotesRequest, notes_content: str, partial: bool = False) -> Dict[str, Any]:
+    """Save generated notes and return the stored record; partial marks notes cut short by the deadline"""
+    notes = new_notes(request, notes_content, partial)
+    await artifact_store.put_async("notes", notes)
+    return notes
 
 @router.post("/generate", response_model=NotesResponse)
-async def generate_notes(request: NotesRequest):
+async def generate_notes(request: NotesRequest, http_request: Request):
     """Generate study notes for a document and topic"""
     # Validate document exists
     document = get_document_by_id(request.document_id)
@@ -25,77 +46,105 @@ async def generate_notes(request: NotesRequest):
     
     try:
         # Get document context
-        context = get_document_context(request.topic, request.document_id)
-        
-        # Create note taker agent
-        from agents import create_note_taker_agent, create_notes_generation_task, run_agent_task
-        note_taker = create_note_taker_agent()
+        context = await get_document_context_async(request.topic, request.document_id, task="notes", rerank=True)
         
         # Use the existing notes generation task function instead of creating a Task directly
         # This ensures proper handling of the context parameter
-        task = create_notes_generation_task(note_taker, request.topic, context)
-        
-        # Execute the task using the helper function
-        notes_content = run_agent_task(note_taker, task)
+        notes_content = await run_agent_task_async(
+            "note_taker", create_notes_generation_task, request.topic, context, route="notes",
+            cache_key=response_cache.make_key("notes", request.topic, context, request.document_id),
+            request=http_request
+        )
         
-        # Generate a unique ID for the notes
-        note_id = str(uuid.uuid4())[:8]
-        
-        # Create notes response
-        notes = {
-            "id": note_id,
-            "topic": request.topic,
-            "content": notes_content,
-            "document_id": request.document_id,
-            "created_at": datetime.now().isoformat()
-        }
-        
-        # Save notes to file
-        with open(f"{NOTES_DIR}/{note_id}.json", "w") as f:
-            json.dump(notes, f)
-        
-        return NotesResponse(**notes)
+        return NotesResponse(**await save_notes(request, notes_content))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating notes: {str(e)}")
 
-@router.get("/", response_model=List[NotesResponse])
-async def get_all_notes():
-    """Get all saved notes"""
-    notes = []
+@router.post("/generate/stream")
+async def generate_notes_stream(request: NotesRequest, http_request: Request):
+    """Generate study notes, streaming them as server-sent events; the saved notes are sent last"""
+    # Validate document exists
+    document = get_document_by_id(request.document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
     
-    if not os.path.exists(NOTES_DIR):
-        return notes
+    try:
+        context = await get_document_context_async(request.topic, request.document_id, task="notes", rerank=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating notes: {str(e)}")
     
-    for file in os.listdir(NOTES_DIR):
-        if file.endswith(".json"):
-            with open(f"{NOTES_DIR}/{file}", "r") as f:
-                note = json.load(f)
-                notes.append(NotesResponse(**note))
+    async def done(notes_content: str, partial: bool):
+        return await save_notes(request, notes_content, partial=partial)
     
-    # Sort by creation date (newest first)
-    notes.sort(key=lambda x: x.created_at, reverse=True)
-    return notes
+    tokens = stream_agent_task(
+        "note_taker", create_notes_generation_task, request.topic, context, route="notes",
+        cache_key=response_cache.make_key("notes", request.topic, context, request.document_id),
+        request=http_request
+    )
+    return stream_tokens(tokens, done)
+
+@router.post("/generate/batch", response_model=BatchNotesResponse)
+async def generate_notes_batch(request: BatchNotesRequest, http_request: Request):
+    """Generate study notes for each of several topics of one document"""
+    # Validate document exists
+    document = get_document_by_id(request.document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    topics = unique_topics(request.topics)
+    if not topics:
+        raise HTTPException(status_code=400, detail="No topics given")
+    if len(topics) > BATCH_MAX_TOPICS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_TOPICS} topics can be generated at once")
+    
+    try:
+        # One batched search for all topics, then as few LLM calls as the context budget allows
+        contexts = await get_document_contexts_async(topics, request.document_id, task="notes", rerank=True)
+        results = await run_batch_tasks(
+            "note_taker", create_notes_generation_task, create_batch_notes_generation_task,
+            "notes", topics, contexts, request.document_id, route="notes",
+            deadline=request_deadline("batch"), request=http_request
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating notes: {str(e)}")
+    
+    notes = []
+    failed_topics = []
+    for topic, notes_content in zip(topics, results):
+        if notes_content is None:
+            failed_topics.append(topic)
+        else:
+            notes.append(new_notes(NotesRequest(topic=topic, document_id=request.document_id), notes_content))
+    
+    # All notes in one transaction
+    try:
+        await artifact_store.put_many_async("notes", notes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving notes: {str(e)}")
+    
+    return BatchNotesResponse(notes=[NotesResponse(**record) for record in notes], failed_topics=failed_topics)
+
+@router.get("/", response_model=List[NotesResponse])
+async def get_all_notes(query: ArtifactQuery = Depends()):
+    """Get saved notes, newest first, a page at a time, optionally filtered by document or topic"""
+    return await list_artifacts("notes", query)
 
 @router.get("/{note_id}", response_model=NotesResponse)
 async def get_note(note_id: str):
     """Get a specific note by ID"""
-    note_path = f"{NOTES_DIR}/{note_id}.json"
+    note = await artifact_store.get_async("notes", note_id)
     
-    if not os.path.exists(note_path):
+    if note is None:
         raise HTTPException(status_code=404, detail="Note not found")
     
-    with open(note_path, "r") as f:
-        note = json.load(f)
-    
     return NotesResponse(**note)
 
 @router.delete("/{note_id}")
 async def delete_note(note_id: str):
     """Delete a specific note"""
-    note_path = f"{NOTES_DIR}/{note_id}.json"
-    
-    if not os.path.exists(note_path):
+    if not await artifact_store.delete_async("notes", note_id):
         raise HTTPException(status_code=404, detail="Note not found")
     
-    os.remove(note_path)
     return {"status": "success", "message": "Note deleted successfully"}
\ No newline at end of file
@@ -1,22 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Depends
 from typing import List
-import os
-import json
 import uuid
 from datetime import datetime
 
 from models.schemas import RoadmapRequest, Roadmap
-from utils import get_document_context, get_document_by_id
-from agents import create_roadmap_planner_agent, create_roadmap_generation_task, create_quick_roadmap_generation_task, run_agent_task
+from utils import get_document_context_async, get_document_by_id
+from agents import create_roadmap_generation_task, create_quick_roadmap_generation_task
+from agent_runtime import run_agent_task_async
+from artifact_store import artifact_store, ArtifactQuery, list_artifacts
 
 router = APIRouter()
 
-# Storage directory
-ROADMAPS_DIR = "./storage/roadmaps"
-os.makedirs(ROADMAPS_DIR, exist_ok=True)
-
 @router.post("/generate", response_model=Roadmap)
-async def generate_roadmap(request: RoadmapRequest):
+async def generate_roadmap(request: RoadmapRequest, http_request: Request):
     """Generate a study roadmap for a document"""
     # Validate document exists
     document = get_document_by_id(request.document_id)
@@ -25,31 +21,25 @@ async def generate_roadmap(request: RoadmapRequest):
     
     try:
         # Get document context
-        context = get_document_context("", request.document_id)
-        
-        # Create roadmap planner agent
-        roadmap_planner = create_roadmap_planner_agent()
+        context = await get_document_context_async("", request.document_id, task="roadmaps")
         
-        # Create roadmap generation task
+        # Pick the roadmap generation task
         if request.quick_mode:
-            roadmap_task = create_quick_roadmap_generation_task(
-                roadmap_planner, 
-                document["filename"],
-                request.days_available,
-                request.hours_per_day,
-                context
-            )
+            task_factory = create_quick_roadmap_generation_task
         else:
-            roadmap_task = create_roadmap_generation_task(
-                roadmap_planner, 
-                document["filename"],
-                request.days_available,
-                request.hours_per_day,
-                context
-            )
+            task_factory = create_roadmap_generation_task
         
         # Execute task
-        roadmap_data = run_agent_task(roadmap_planner, roadmap_task)
+        roadmap_data = await run_agent_task_async(
+            "roadmap_planner",
+            task_factory,
+            document["filename"],
+            request.days_available,
+            request.hours_per_day,
+            context,
+            route="roadmaps",
+            request=http_request
+        )
         
         # Parse roadmap data
         from utils import parse_roadmap_from_text
@@ -69,52 +59,33 @@ async def generate_roadmap(request: RoadmapRequest):
             created_at=datetime.now().isoformat()
         )
         
-        # Save roadmap to file
-        with open(f"{ROADMAPS_DIR}/{roadmap_id}.json", "w") as f:
-            json.dump(roadmap.dict(), f)
+        await artifact_store.put_async("roadmaps", roadmap.dict())
         
         return roadmap
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating roadmap: {str(e)}")
 
 @router.get("/", response_model=List[Roadmap])
-async def get_all_roadmaps():
-    """Get all roadmaps"""
-    roadmaps = []
-    
-    if not os.path.exists(ROADMAPS_DIR):
-        return roadmaps
-    
-    for file in os.listdir(ROADMAPS_DIR):
-        if file.endswith(".json"):
-            with open(f"{ROADMAPS_DIR}/{file}", "r") as f:
-                roadmap = json.load(f)
-                roadmaps.append(Roadmap(**roadmap))
-    
-    # Sort by creation date (newest first)
-    roadmaps.sort(key=lambda x: x.created_at, reverse=True)
-    return roadmaps
+async def get_all_roadmaps(query: ArtifactQuery = Depends()):
+    """Get roadmaps, newest first, a page at a time, optionally filtered by document"""
+    return await list_artifacts("roadmaps", query)
 
 @router.get("/{roadmap_id}", response_model=Roadmap)
 async def get_roadmap(roadmap_id: str):
     """Get a specific roadmap"""
-    roadmap_path = f"{ROADMAPS_DIR}/{roadmap_id}.json"
+    roadmap = await artifact_store.get_async("roadmaps", roadmap_id)
     
-    if not os.path.exists(roadmap_path):
+    if roadmap is None:
         raise HTTPException(status_code=404, detail="Roadmap not found")
     
-    with open(roadmap_path, "r") as f:
-        roadmap = json.load(f)
-    
     return Roadmap(**roadmap)
 
 @router.delete("/{roadmap_id}")
 async def delete_roadmap(roadmap_id: str):
     """Delete a roadmap"""
-    roadmap_path = f"{ROADMAPS_DIR}/{roadmap_id}.json"
-    
-    if not os.path.exists(roadmap_path):
+    if not await artifact_store.delete_async("roadmaps", roadmap_id):
         raise HTTPException(status_code=404, detail="Roadmap not found")
     
-    os.remove(roadmap_path)
     return {"status": "success", "message": "Roadmap deleted successfully"}
@@ -1,22 +1,20 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Depends
 from typing import List
-import os
-import json
 import uuid
 from datetime import datetime
 
-from models.schemas import TestRequest, Test, TestSubmission
-from utils import get_document_context, get_document_by_id
-from agents import create_assessment_expert_agent, create_test_generation_task, run_agent_task
+from models.schemas import TestRequest, Test, TestSubmission, TestResponse
+from utils import get_document_context_async, get_document_by_id
+from agents import create_test_generation_task
+from agent_runtime import run_agent_task_async
+from response_cache import response_cache
+from structured_output import structured_artifact
+from artifact_store import artifact_store, ArtifactQuery, list_artifacts
 
 router = APIRouter()
 
-# Storage directory
-TESTS_DIR = "./storage/tests"
-os.makedirs(TESTS_DIR, exist_ok=True)
-
 @router.post("/generate", response_model=Test)
-async def generate_test(request: TestRequest):
+async def generate_test(request: TestRequest, http_request: Request):
     """Generate a test for a topic and optional document"""
     context = ""
     
@@ -25,26 +23,31 @@ async def generate_test(request: TestRequest):
         document = get_document_by_id(request.document_id)
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
-        context = get_document_context(request.topic, request.document_id)
+        context = await get_document_context_async(request.topic, request.document_id, task="tests", rerank=True)
     
     try:
-        # Create assessment expert agent
-        assessment_expert = create_assessment_expert_agent()
-        
-        # Create test generation task
-        test_task = create_test_generation_task(
-            assessment_expert, 
-            request.topic, 
+        # Create and execute the test generation task
+        structured = structured_artifact("tests")
+        test_data = await run_agent_task_async(
+            "assessment_expert",
+            create_test_generation_task,
+            request.topic,
             request.difficulty,
-            context
+            context,
+            route="tests",
+            request=http_request,
+            structured_output=structured,
+            cache_key=response_cache.make_key(
+                "tests", request.topic, context, request.document_id, difficulty=request.difficulty
+            )
         )
         
-        # Execute task
-        test_data = run_agent_task(assessment_expert, test_task)
-        
         # Parse test data
-        from utils import parse_test_from_text
-        parsed_test = parse_test_from_text(test_data)
+        if structured:
+            parsed_test = TestResponse.model_validate_json(test_data).model_dump()
+        else:
+            from utils import parse_test_from_text
+            parsed_test = parse_test_from_text(test_data)
         
         # Generate a unique ID for the test
         test_id = str(uuid.uuid4())[:8]
@@ -59,67 +62,45 @@ async def generate_test(request: TestRequest):
             created_at=datetime.now().isoformat()
         )
         
-        # Save test to file
-        with open(f"{TESTS_DIR}/{test_id}.json", "w") as f:
-            json.dump(test.dict(), f)
+        await artifact_store.put_async("tests", test.dict())
         
         return test
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating test: {str(e)}")
 
 @router.get("/", response_model=List[Test])
-async def get_all_tests():
-    """Get all tests"""
-    tests = []
-    
-    if not os.path.exists(TESTS_DIR):
-        return tests
-    
-    for file in os.listdir(TESTS_DIR):
-        if file.endswith(".json"):
-            with open(f"{TESTS_DIR}/{file}", "r") as f:
-                test = json.load(f)
-                tests.append(Test(**test))
-    
-    # Sort by creation date (newest first)
-    tests.sort(key=lambda x: x.created_at, reverse=True)
-    return tests
+async def get_all_tests(query: ArtifactQuery = Depends()):
+    """Get tests, newest first, a page at a time, optionally filtered by document or topic"""
+    return await list_artifacts("tests", query)
 
 @router.get("/{test_id}", response_model=Test)
 async def get_test(test_id: str):
     """Get a specific test"""
-    test_path = f"{TESTS_DIR}/{test_id}.json"
+    test = await artifact_store.get_async("tests", test_id)
     
-    if not os.path.exists(test_path):
+    if test is None:
         raise HTTPException(status_code=404, detail="Test not found")
     
-    with open(test_path, "r") as f:
-        test = json.load(f)
-    
     return Test(**test)
 
 @router.delete("/{test_id}")
 async def delete_test(test_id: str):
     """Delete a test"""
-    test_path = f"{TESTS_DIR}/{test_id}.json"
-    
-    if not os.path.exists(test_path):
+    if not await artifact_store.delete_async("tests", test_id):
         raise HTTPException(status_code=404, detail="Test not found")
     
-    os.remove(test_path)
     return {"status": "success", "message": "Test deleted successfully"}
 
 @router.post("/{test_id}/submit", response_model=dict)
 async def submit_test_answers(test_id: str, submission: TestSubmission):
     """Submit answers for a test"""
-    test_path = f"{TESTS_DIR}/{test_id}.json"
+    test = await artifact_store.get_async("tests", test_id)
     
-    if not os.path.exists(test_path):
+    if test is None:
         raise HTTPException(status_code=404, detail="Test not found")
     
-    with open(test_path, "r") as f:
-        test = json.load(f)
-    
     # Calculate score
     correct_answers = 0
     total_questions = len(test["questions"])
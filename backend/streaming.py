@@ -0,0 +1,86 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional
+
+from fastapi.responses import StreamingResponse
+
+from cancellation import DeadlineExceeded, RequestCancelled
+
+logger = logging.getLogger(__name__)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Stop reverse proxies such as nginx from buffering the stream
+    "X-Accel-Buffering": "no",
+}
+
+def format_sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Format one server-sent event with a JSON payload"""
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    return message
+
+def stream_tokens(
+    tokens: AsyncIterator[str],
+    on_complete: Optional[Callable[[str, bool], Awaitable[Dict[str, Any]]]] = None,
+    items: Optional[Callable[[str], Iterable[Dict[str, Any]]]] = None,
+    item_event: str = "item"
+) -> StreamingResponse:
+    """
+    Stream generated text to the client as server-sent events.
+
+    Each chunk is sent as a "token" event. When generation finishes,
+    on_complete receives the full text and whether it is partial, and its
+    result is sent as the "done" event; failures are reported as an "error"
+    event, since the response status has already been sent by then. If the
+    deadline passes mid-stream, on_complete gets the text generated so far
+    with partial set, so anything it saves can be flagged, and the "done"
+    event carries "partial": true.
+
+    For structured answers, items turns each chunk into the items it
+    completes, e.g. flashcards, and those are sent as item_event events in
+    place of the raw text.
+
+    Args:
+        tokens: Async iterator of generated text chunks
+        on_complete: Optional coroutine called with the full text and the partial flag, e.g. to save it
+        items: Optional function returning the items completed by a chunk
+        item_event: Event name for the items
+
+    Returns:
+        StreamingResponse: The text/event-stream response
+    """
+    async def events():
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                if items is None:
+                    yield format_sse({"content": token}, event="token")
+                    continue
+                for item in items(token):
+                    yield format_sse(item, event=item_event)
+
+            result = await on_complete("".join(parts), False) if on_complete else {}
+            yield format_sse(result, event="done")
+        except RequestCancelled:
+            # The client is gone, there is nobody left to tell
+            logger.info("Client disconnected, stopped streaming")
+        except DeadlineExceeded as e:
+            if not parts:
+                yield format_sse({"detail": e.detail}, event="error")
+                return
+            # Keep what was generated in time, flagged as partial
+            logger.warning(f"Deadline exceeded after {len(parts)} chunks, completing with a partial result")
+            result = await on_complete("".join(parts), True) if on_complete else {}
+            yield format_sse({**result, "partial": True}, event="done")
+        except Exception as e:
+            logger.error(f"Error while streaming response: {str(e)}", exc_info=True)
+            yield format_sse({"detail": str(e)}, event="error")
+        finally:
+            # Stop generation as soon as the client stops reading
+            if hasattr(tokens, "aclose"):
+                await tokens.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
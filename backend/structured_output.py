@@ -0,0 +1,205 @@
+import re
+import json
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from config import STRUCTURED_OUTPUT_MODE, STRUCTURED_OUTPUT_REPAIRS
+from llm_providers import complete_chat
+from models.schemas import FlashcardResponse, TestResponse, CodeAnalysisResponse
+
+logger = logging.getLogger(__name__)
+
+# Output model of each structured artifact, and the list field that must not come back empty
+ARTIFACTS: Dict[str, Tuple[Type[BaseModel], Optional[str]]] = {
+    "flashcards": (FlashcardResponse, "cards"),
+    "tests": (TestResponse, "questions"),
+    "code_analysis": (CodeAnalysisResponse, None),
+}
+
+# Some models wrap their JSON in a markdown code fence even in JSON mode
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?[ \t]*\n(.*?)\n?[ \t]*```\s*$", re.DOTALL)
+
+class StructuredOutputError(ValueError):
+    """The model's output was still invalid after the repair attempts"""
+
+@dataclass
+class StructuredResult:
+    output: BaseModel
+    repairs: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+class JSONArrayStream:
+    """
+    Incremental parser for a JSON answer that arrives in chunks.
+
+    Each object in the answer's first array, e.g. each card of
+    {"cards": [{...}, {...}]}, is decoded as soon as its closing brace
+    arrives, so it can be used before the rest of the answer is generated.
+    Text around the JSON, such as a code fence, is ignored.
+    """
+    def __init__(self):
+        self._containers: List[str] = []  # Brackets and braces currently open
+        self._array_depth: Optional[int] = None  # Nesting depth of the array whose objects are decoded
+        self._in_string = False
+        self._escaped = False
+        self._partial: Optional[str] = None  # Text of an element started in an earlier chunk
+        self.finished = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Parse the next chunk of the answer.
+
+        Args:
+            chunk: The next piece of generated text
+
+        Returns:
+            List[Any]: The array elements completed by this chunk
+        """
+        items = []
+        start = 0 if self._partial is not None else None
+        for i, char in enumerate(chunk):
+            if self.finished:
+                break
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                if char == "{" and len(self._containers) == self._array_depth:
+                    start, self._partial = i, ""
+                self._containers.append(char)
+                if char == "[" and self._array_depth is None:
+                    self._array_depth = len(self._containers)
+            elif char in "]}" and self._containers:
+                self._containers.pop()
+                if self._array_depth is None:
+                    continue
+                if char == "}" and start is not None and len(self._containers) == self._array_depth:
+                    text = self._partial + chunk[start:i + 1]
+                    start, self._partial = None, None
+                    try:
+                        items.append(json.loads(text))
+                    except ValueError:
+                        logger.debug(f"Skipping malformed array element: {text[:100]}")
+                elif len(self._containers) < self._array_depth:
+                    self.finished = True
+
+        if start is not None:
+            self._partial += chunk[start:]
+        return items
+
+def structured_artifact(artifact: str) -> Optional[str]:
+    """The artifact name if structured output is enabled, None if the free-text parsers should be used"""
+    return None if STRUCTURED_OUTPUT_MODE == "off" else artifact
+
+@lru_cache(maxsize=None)
+def _json_schema(artifact: str) -> Dict[str, Any]:
+    return ARTIFACTS[artifact][0].model_json_schema()
+
+@lru_cache(maxsize=None)
+def schema_instructions(artifact: str) -> str:
+    """Prompt text asking for the artifact as JSON, added after the task's own instructions"""
+    return (
+        "Ignore any answer format described above. Respond with a single JSON object, and nothing else, "
+        f"matching this JSON schema:\n{json.dumps(_json_schema(artifact))}"
+    )
+
+def response_format(artifact: str) -> Dict[str, Any]:
+    """The response_format completion parameter for the configured structured output mode"""
+    if STRUCTURED_OUTPUT_MODE == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": artifact, "schema": _json_schema(artifact)}}
+    return {"type": "json_object"}
+
+def validate_output(artifact: str, text: str) -> BaseModel:
+    """
+    Parse and validate the model's output for an artifact.
+
+    Args:
+        artifact: Artifact name, e.g. "flashcards"
+        text: The model's answer
+
+    Returns:
+        BaseModel: The artifact's output model
+
+    Raises:
+        ValueError: The output isn't valid JSON or doesn't match the artifact's schema
+    """
+    model, required = ARTIFACTS[artifact]
+    fenced = _CODE_FENCE.match(text)
+    if fenced:
+        text = fenced.group(1)
+
+    output = model.model_validate_json(text)
+    if required and not getattr(output, required):
+        raise ValueError(f'"{required}" must not be empty')
+    return output
+
+def describe_errors(error: ValueError) -> str:
+    """Short description of why an output failed validation, for the repair prompt and the logs"""
+    if not isinstance(error, ValidationError):
+        return str(error)
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'output'}: {detail['msg']}"
+        for detail in error.errors(include_url=False)
+    )
+
+def repair_messages(messages: List[Dict[str, str]], answer: str, errors: str) -> List[Dict[str, str]]:
+    """The conversation so far, followed by a request to fix the listed errors"""
+    return messages + [
+        {"role": "assistant", "content": answer},
+        {"role": "user", "content": (
+            f"Your answer is not valid: {errors}. "
+            "Reply with the corrected JSON object only, matching the schema."
+        )},
+    ]
+
+def generate_structured(messages: List[Dict[str, str]], artifact: str) -> StructuredResult:
+    """
+    Generate an artifact as JSON and validate it against the artifact's model.
+
+    The messages should already ask for the artifact as JSON (see
+    schema_instructions). Output that fails validation is sent back to the
+    model together with the validation errors, up to STRUCTURED_OUTPUT_REPAIRS
+    times. Blocking, for the agent worker threads.
+
+    Args:
+        messages: Chat messages for the task
+        artifact: Artifact name, e.g. "flashcards"
+
+    Returns:
+        StructuredResult: The validated output, with repair and token counts
+
+    Raises:
+        StructuredOutputError: The output was still invalid after the last repair
+    """
+    result = StructuredResult(output=None)
+    for attempt in range(STRUCTURED_OUTPUT_REPAIRS + 1):
+        response = complete_chat(messages, response_format=response_format(artifact))
+        answer = response.choices[0].message.content or ""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            result.prompt_tokens += usage.prompt_tokens or 0
+            result.completion_tokens += usage.completion_tokens or 0
+
+        try:
+            result.output = validate_output(artifact, answer)
+            return result
+        except ValueError as e:
+            errors = describe_errors(e)
+            logger.warning(f"Invalid {artifact} output (attempt {attempt + 1}): {errors[:300]}")
+
+        if attempt < STRUCTURED_OUTPUT_REPAIRS:
+            result.repairs += 1
+            messages = repair_messages(messages, answer, errors)
+
+    raise StructuredOutputError(f"The model did not return valid {artifact}: {errors}")
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The backend modules import each other by their flat names, as when the app is run from the backend directory
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
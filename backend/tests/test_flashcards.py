@@ -0,0 +1,59 @@
+"""
+Flashcard parsing keeps card text exactly as generated, "%" signs included.
+
+Usage (from the backend directory):
+    python -m pytest tests
+"""
+import json
+
+import pytest
+
+from utils import parse_flashcards_from_text, normalize_flashcards
+
+DECK = [
+    {"front": "what share of requests may fail at 99.9% uptime?", "back": "0.1%, about 43 minutes a month."},
+    {"front": "what does %s mean in a format string?", "back": "a placeholder, as in %d items or %(name)s."},
+    {"front": "how is a literal %% written?", "back": "as %% in printf, but 100% as typed here."},
+    {"front": "a 5% fee on 20% of orders?", "back": "1% of all orders."},
+]
+
+FORMATS = {
+    "json_array": lambda deck: json.dumps(deck, indent=2),
+    "json_cards": lambda deck: json.dumps({"cards": deck}),
+    "json_flashcards": lambda deck: json.dumps({"flashcards": deck}),
+    "json_front_back": lambda deck: json.dumps(
+        {"front": [card["front"] for card in deck], "back": [card["back"] for card in deck]}
+    ),
+    "qa_text": lambda deck: "\n\n".join(f"Q: {card['front']}\nA: {card['back']}" for card in deck),
+    "card_text": lambda deck: "\n\n".join(
+        f"Card {i}:\nFront: {card['front']}\nBack: {card['back']}" for i, card in enumerate(deck, 1)
+    ),
+}
+
+@pytest.mark.parametrize("render", FORMATS.values(), ids=FORMATS.keys())
+def test_percent_signs_survive_parsing(render):
+    assert normalize_flashcards(parse_flashcards_from_text(render(DECK))) == DECK
+
+def test_doubled_percent_signs_are_not_collapsed():
+    cards = normalize_flashcards(parse_flashcards_from_text(json.dumps([{"front": "50%% off?", "back": "%%"}])))
+    assert cards == [{"front": "50%% off?", "back": "%%"}]
+
+def test_normalize_strips_labels_and_whitespace_only():
+    cards = normalize_flashcards([
+        {"front": "  Card 3: Front: what is 10% of 50?  ", "back": "Answer: 5 (10%)\n"},
+        {"front": "Question: 100%?", "back": "Back: %d"},
+    ])
+    assert cards == [
+        {"front": "what is 10% of 50?", "back": "5 (10%)"},
+        {"front": "100%?", "back": "%d"},
+    ]
+
+def test_normalize_drops_incomplete_cards():
+    cards = normalize_flashcards([
+        {"front": "50%", "back": ""},
+        {"front": "Front:", "back": "100%"},
+        {"back": "only a back"},
+        "not a card",
+        {"front": "kept", "back": "100%"},
+    ])
+    assert cards == [{"front": "kept", "back": "100%"}]
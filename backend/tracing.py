@@ -0,0 +1,51 @@
+import json
+import time
+import logging
+from typing import Any, Optional
+
+from config import AGENT_TRACE_LEVEL
+
+trace_logger = logging.getLogger("agent_trace")
+
+# Characters of prompt and output kept in debug traces
+PREVIEW_CHARS = 200
+
+class AgentTrace:
+    """
+    Structured trace of one agent call, logged as a single JSON line.
+
+    Records timings, token counts and how the call was served (cache,
+    coalesced or executed). Full prompts and outputs are never logged;
+    with AGENT_TRACE_LEVEL=debug short previews are added.
+    """
+
+    def __init__(self, role: str, task: str, route: Optional[str] = None):
+        self.start = time.perf_counter()
+        self.record = {"role": role, "task": task, "route": route or "default"}
+
+    @property
+    def enabled(self) -> bool:
+        return AGENT_TRACE_LEVEL != "off"
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 1)
+
+    def set(self, **fields: Any):
+        self.record.update(fields)
+
+    def mark(self, name: str):
+        """Record the time since the start of the call under name"""
+        self.record[name] = self.elapsed_ms()
+
+    def preview(self, name: str, text: str):
+        if AGENT_TRACE_LEVEL == "debug" and text:
+            self.record[name] = text[:PREVIEW_CHARS]
+
+    def finish(self, status: str = "ok", error: Optional[BaseException] = None):
+        if not self.enabled:
+            return
+        self.record["status"] = status
+        self.record["duration_ms"] = self.elapsed_ms()
+        if error is not None:
+            self.record["error"] = type(error).__name__
+        trace_logger.info(json.dumps(self.record))
@@ -1,13 +1,16 @@
 import os
 import re
+import math
+import asyncio
 import hashlib
 import tempfile
 import json
 import concurrent.futures
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, AsyncIterator, Iterable, Optional, Tuple
 from pathlib import Path
 import pickle
+import numpy as np
 import matplotlib.pyplot as plt
 import networkx as nx
 from functools import lru_cache
@@ -28,6 +31,12 @@ from fastapi import UploadFile, HTTPException
 import aiofiles
 from datetime import datetime
 
+from config import RERANK_ENABLED, RERANK_CANDIDATES, MINDMAP_MAX_DEPTH, MINDMAP_MAX_NODES, MINDMAP_LAYOUT
+from context_builder import build_context, fit_text_to_budget
+from reranker import rerank_documents
+from retrieval_cache import retrieval_cache
+from file_store import atomic_write, write_stream
+
 # Configuration constants
 MAX_CHUNK_SIZE = 1000
 OVERLAP_SIZE = 200
@@ -182,6 +191,11 @@ def extract_text_from_txt(file_bytes):
     
     return text_by_page
 
+async def read_upload_chunks(file: UploadFile, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """The content of an uploaded file, 1MB at a time"""
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
 async def process_document_async(file: UploadFile) -> dict:
     """
     Process an uploaded document asynchronously.
@@ -203,11 +217,8 @@ async def process_document_async(file: UploadFile) -> dict:
         # Save file
         file_path = UPLOAD_DIR / file.filename
         try:
-            with open(file_path, "wb") as buffer:
-                # Read and write in chunks to handle large files
-                chunk_size = 1024 * 1024  # 1MB chunks
-                while chunk := await file.read(chunk_size):
-                    buffer.write(chunk)
+            # Read and write in chunks to handle large files
+            await write_stream(file_path, read_upload_chunks(file))
         except Exception as e:
             logger.error(f"Error saving file: {str(e)}")
             raise DocumentProcessingError("Failed to save file")
@@ -228,7 +239,8 @@ async def process_document_async(file: UploadFile) -> dict:
         
         # Process document
         try:
-            doc_info = process_document(str(file_path))
+            # Text extraction and the cache write block, so they run on a worker thread
+            doc_info = await asyncio.to_thread(process_document, str(file_path))
             return {
                 "id": doc_info["id"],
                 "filename": file.filename,
@@ -318,8 +330,7 @@ def process_document(file_path: str) -> dict:
         }
         
         # Cache the processed document
-        with open(cache_path, 'wb') as f:
-            pickle.dump(doc_info, f)
+        atomic_write(cache_path, pickle.dumps(doc_info))
         
         return doc_info
     except Exception as e:
@@ -451,13 +462,16 @@ def create_vector_store(doc_info: dict) -> Any:
             # Try again with alternative serialization
             try:
                 import pickle
-                with open(vector_store_path / "vector_store.pkl", "wb") as f:
-                    pickle.dump(vector_store, f)
+                atomic_write(vector_store_path / "vector_store.pkl", pickle.dumps(vector_store))
                 logger.info(f"Saved vector store using pickle serialization")
             except Exception as pickle_error:
                 logger.error(f"Failed to save vector store with pickle: {pickle_error}")
                 # We'll still return the vector store even if we couldn't save it
         
+        # The document was (re)indexed: drop cached results and cache the new store
+        retrieval_cache.invalidate_document(str(doc_id))
+        retrieval_cache.set_vector_store(str(doc_id), vector_store)
+        
         return vector_store
         
     except Exception as e:
@@ -478,6 +492,13 @@ def load_vector_store(doc_id: str) -> Any:
         DocumentNotFoundError: If document not found
         VectorStoreError: If vector store cannot be loaded or created
     """
+    # Reuse the vector store if it is already loaded in this process
+    vector_store = retrieval_cache.get_vector_store(doc_id)
+    if vector_store is not None:
+        logger.info(f"Using cached vector store for {doc_id}")
+        return vector_store
+    generation = retrieval_cache.get_generation(doc_id)
+    
     # Check if document exists
     doc_info = get_document_by_id(doc_id)
     if not doc_info:
@@ -504,6 +525,7 @@ def load_vector_store(doc_id: str) -> Any:
                     allow_dangerous_deserialization=True
                 )
                 logger.info(f"Successfully loaded vector store for {doc_id}")
+                retrieval_cache.set_vector_store(doc_id, vector_store, generation)
                 return vector_store
             except Exception as e:
                 logger.warning(f"Standard loading of vector store failed: {e}")
@@ -516,6 +538,7 @@ def load_vector_store(doc_id: str) -> Any:
                         with open(pickle_path, "rb") as f:
                             vector_store = pickle.load(f)
                         logger.info(f"Successfully loaded vector store from pickle for {doc_id}")
+                        retrieval_cache.set_vector_store(doc_id, vector_store, generation)
                         return vector_store
                     except Exception as pickle_e:
                         logger.warning(f"Pickle loading of vector store failed: {pickle_e}")
@@ -536,7 +559,14 @@ def load_vector_store(doc_id: str) -> Any:
         logger.error(f"Error loading or creating vector store: {str(e)}", exc_info=True)
         raise VectorStoreError(f"Failed to load or create vector store: {str(e)}")
 
-def get_document_context(query: str, vectorstore_or_doc_id: Any, top_k: int = 3) -> str:
+def get_document_context(
+    query: str,
+    vectorstore_or_doc_id: Any,
+    top_k: int = 3,
+    task: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    rerank: bool = False
+) -> str:
     """
     Get relevant context from a document or vectorstore for a given query.
     
@@ -544,15 +574,30 @@ def get_document_context(query: str, vectorstore_or_doc_id: Any, top_k: int = 3)
         query: Query string
         vectorstore_or_doc_id: Either a vector store object or document ID string
         top_k: Number of chunks to retrieve
+        task: Task type (chat, notes, flashcards, ...) whose token budget the context must fit
+        token_budget: Explicit token budget, overrides the task budget
+        rerank: Rerank the top ANN hits with the cross-encoder (if RERANK_ENABLED)
         
     Returns:
         str: Relevant context from the document
     """
     try:
+        cache_key = None
+        
         # Check if input is a document ID or a vector store
         if isinstance(vectorstore_or_doc_id, str):
             # It's a document ID
             doc_id = vectorstore_or_doc_id
+            
+            # Return the cached result for this (document, query, k) if we have one
+            cache_key = retrieval_cache.make_key(
+                doc_id, query, top_k, task, token_budget, rerank and RERANK_ENABLED
+            )
+            cached_context = retrieval_cache.get_context(cache_key)
+            if cached_context is not None:
+                logger.info(f"Using cached context for query: {query[:50]}...")
+                return cached_context
+            
             # Check if document exists
             doc_info = get_document_by_id(doc_id)
             if not doc_info:
@@ -571,11 +616,19 @@ def get_document_context(query: str, vectorstore_or_doc_id: Any, top_k: int = 3)
             
         # Search for relevant chunks
         logger.info(f"Searching for context relevant to query: {query[:50]}...")
-        docs = vector_store.similarity_search(query, k=top_k)
+        if rerank and RERANK_ENABLED and query.strip():
+            candidates = vector_store.similarity_search(query, k=max(RERANK_CANDIDATES, top_k))
+            docs = rerank_documents(query, candidates, top_k)
+        else:
+            docs = vector_store.similarity_search(query, k=top_k)
         logger.info(f"Found {len(docs)} relevant chunks")
         
-        # Combine chunks into context
-        context = "\n".join(doc.page_content for doc in docs)
+        # Combine chunks into context, packed into the task's token budget if one applies
+        chunks = [doc.page_content for doc in docs]
+        if task is not None or token_budget is not None:
+            context = build_context(chunks, task=task, budget=token_budget)
+        else:
+            context = "\n".join(chunks)
         
         # Process the context to filter out index-like sections
         cleaned_context = preprocess_document_context(context)
@@ -586,6 +639,9 @@ def get_document_context(query: str, vectorstore_or_doc_id: Any, top_k: int = 3)
         if context_length < 50:
             logger.warning(f"Very short context retrieved ({context_length} chars): '{cleaned_context}'")
         
+        if cache_key is not None:
+            retrieval_cache.set_context(cache_key, cleaned_context)
+        
         return cleaned_context
         
     except DocumentNotFoundError:
@@ -598,6 +654,123 @@ def get_document_context(query: str, vectorstore_or_doc_id: Any, top_k: int = 3)
         logger.error(f"Error getting document context: {str(e)}", exc_info=True)
         raise DocumentProcessingError(f"Failed to get document context: {str(e)}")
 
+def get_document_contexts(
+    queries: List[str],
+    doc_id: str,
+    top_k: int = 3,
+    task: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    rerank: bool = False
+) -> List[str]:
+    """
+    Get the context for several queries against one document.
+
+    Queries with a cached context are answered from the retrieval cache; the
+    rest are searched together with a single batched similarity search. Each
+    context is built exactly as get_document_context would build it, so the
+    two share cache entries.
+
+    Args:
+        queries: Query strings
+        doc_id: Document ID
+        top_k: Number of chunks to retrieve per query
+        task: Task type whose token budget each context must fit
+        token_budget: Explicit token budget, overrides the task budget
+        rerank: Rerank the top ANN hits with the cross-encoder (if RERANK_ENABLED)
+
+    Returns:
+        List[str]: The context for each query, in query order
+    """
+    try:
+        use_rerank = rerank and RERANK_ENABLED
+        cache_keys = [
+            retrieval_cache.make_key(doc_id, query, top_k, task, token_budget, use_rerank)
+            for query in queries
+        ]
+        contexts = [retrieval_cache.get_context(key) for key in cache_keys]
+        missing = [i for i, context in enumerate(contexts) if context is None]
+        if not missing:
+            logger.info(f"Using cached context for all {len(queries)} queries")
+            return contexts
+
+        if not get_document_by_id(doc_id):
+            logger.error(f"Document {doc_id} not found in cache")
+            raise DocumentNotFoundError(f"Document {doc_id} not found")
+        vector_store = load_vector_store(doc_id)
+
+        logger.info(f"Batched search for {len(missing)} of {len(queries)} queries")
+        k = max(RERANK_CANDIDATES, top_k) if use_rerank else top_k
+        results = similarity_search_batch(vector_store, [queries[i] for i in missing], k=k)
+
+        for i, docs in zip(missing, results):
+            if use_rerank and queries[i].strip():
+                docs = rerank_documents(queries[i], docs, top_k)
+            chunks = [doc.page_content for doc in docs]
+            if task is not None or token_budget is not None:
+                context = build_context(chunks, task=task, budget=token_budget)
+            else:
+                context = "\n".join(chunks)
+            contexts[i] = preprocess_document_context(context)
+            retrieval_cache.set_context(cache_keys[i], contexts[i])
+
+        return contexts
+
+    except DocumentNotFoundError:
+        raise
+    except VectorStoreError as e:
+        logger.error(f"Vector store error: {str(e)}")
+        raise DocumentProcessingError(f"Vector store error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error getting document contexts: {str(e)}", exc_info=True)
+        raise DocumentProcessingError(f"Failed to get document contexts: {str(e)}")
+
+async def get_document_context_async(*args, **kwargs) -> str:
+    """get_document_context on a worker thread, as the vector search and reranking block; same arguments"""
+    return await asyncio.to_thread(get_document_context, *args, **kwargs)
+
+async def get_document_contexts_async(*args, **kwargs) -> List[str]:
+    """get_document_contexts on a worker thread, as the vector search and reranking block; same arguments"""
+    return await asyncio.to_thread(get_document_contexts, *args, **kwargs)
+
+def similarity_search_batch(vector_store: Any, queries: List[str], k: int = 5) -> List[List[Any]]:
+    """
+    Run several similarity searches against a FAISS vector store in one batch.
+    
+    All queries are embedded with a single encode call and the index is
+    searched once with the matrix of query vectors.
+    
+    Args:
+        vector_store: The FAISS vector store to search
+        queries: Query strings
+        k: Number of chunks to retrieve per query
+        
+    Returns:
+        List[List[Document]]: The results for each query, in query order
+    """
+    if not queries:
+        return []
+    
+    embedder = getattr(vector_store, "embeddings", None) or get_embeddings()
+    vectors = np.asarray(embedder.embed_documents(queries), dtype=np.float32)
+    if getattr(vector_store, "_normalize_L2", False):
+        import faiss
+        faiss.normalize_L2(vectors)
+    
+    _, indices = vector_store.index.search(vectors, k)
+    
+    results = []
+    for row in indices:
+        docs = []
+        for i in row:
+            # FAISS pads with -1 when the index holds fewer than k vectors
+            if i == -1:
+                continue
+            doc = vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+            if isinstance(doc, LangchainDocument):
+                docs.append(doc)
+        results.append(docs)
+    return results
+
 def preprocess_document_context(context: str) -> str:
     """
     Preprocess document context to filter out index entries, tables of contents,
@@ -792,120 +965,76 @@ def parse_test_from_text(text):
         logger.error(f"Error parsing test: {e}")
         return {"questions": [], "answer_key": {}}
         
+# Field names models use for the two sides of a JSON flashcard, in order of preference
+_FLASHCARD_FIELDS = (("front", "back"), ("question", "answer"), ("q", "a"), ("term", "definition"))
+# Labels models put at the start of a card side despite being asked not to
+_FLASHCARD_LABEL = re.compile(r"^(?:Card\s*\d+:?\s*)?(?:(?:Front|Back):\s*)?(?:(?:Question|Answer):\s*)?")
+
+def _json_flashcard(item: Any) -> Optional[Dict[str, str]]:
+    """Front and back of one JSON flashcard object, whichever field names the model used"""
+    if not isinstance(item, dict):
+        return None
+    for front, back in _FLASHCARD_FIELDS:
+        if front in item and back in item:
+            return {"front": str(item[front]), "back": str(item[back])}
+    # Cards nested in a wrapper object
+    for key in ("content", "card", "text"):
+        if key in item:
+            return _json_flashcard(item[key])
+    return None
+
+def _clean_flashcard_side(text: str) -> str:
+    text = text.strip()
+    label = _FLASHCARD_LABEL.match(text)
+    return text[label.end():] if label.end() else text
+
+def normalize_flashcards(cards: Iterable[Any]) -> List[Dict[str, str]]:
+    """
+    Clean up parsed flashcards once, before they are saved.
+
+    Surrounding whitespace and leftover labels such as "Card 1:" or "Front:"
+    are removed; the text is otherwise kept exactly as generated. Cards
+    missing either side are dropped.
+
+    Args:
+        cards: Cards as dicts with "front" and "back"
+
+    Returns:
+        List[Dict[str, str]]: The cards that have both sides
+    """
+    normalized = []
+    for card in cards:
+        if not isinstance(card, dict):
+            continue
+        front = _clean_flashcard_side(str(card.get("front") or ""))
+        back = _clean_flashcard_side(str(card.get("back") or ""))
+        if front and back:
+            normalized.append({"front": front, "back": back})
+    return normalized
+
 def parse_flashcards_from_text(text):
     """Parse flashcard data from text response with enhanced robustness"""
     try:
-        # Sanitize any potential string format specifiers in the input text
-        # This helps prevent '%s', '%d', etc. from causing string formatting errors
-        text = text.replace("%", "%%")
-        
         # First try to see if it's valid JSON
         try:
             json_data = json.loads(text)
-            if isinstance(json_data, list):
-                # If it's already a list of objects with front/back, return it
-                if json_data and isinstance(json_data[0], dict) and "front" in json_data[0] and "back" in json_data[0]:
-                    print(f"Found valid flashcards JSON list with {len(json_data)} cards")
-                    # Escape any % characters in the content to prevent format string issues
-                    return [{
-                        "front": str(card.get("front", "")).replace("%", "%%"),
-                        "back": str(card.get("back", "")).replace("%", "%%")
-                    } for card in json_data]
-                # Check for other formats like Q/A keys
-                formatted_cards = []
-                for item in json_data:
-                    if isinstance(item, dict):
-                        if "question" in item and "answer" in item:
-                            formatted_cards.append({
-                                "front": str(item["question"]).replace("%", "%%"), 
-                                "back": str(item["answer"]).replace("%", "%%")
-                            })
-                        elif "q" in item and "a" in item:
-                            formatted_cards.append({
-                                "front": str(item["q"]).replace("%", "%%"), 
-                                "back": str(item["a"]).replace("%", "%%")
-                            })
-                        elif "term" in item and "definition" in item:
-                            formatted_cards.append({
-                                "front": str(item["term"]).replace("%", "%%"), 
-                                "back": str(item["definition"]).replace("%", "%%")
-                            })
-                        # Handle potential nested content
-                        elif any(key in item for key in ["content", "card", "text"]):
-                            for key in ["content", "card", "text"]:
-                                if key in item and isinstance(item[key], dict):
-                                    card_content = item[key]
-                                    if "front" in card_content and "back" in card_content:
-                                        formatted_cards.append({
-                                            "front": str(card_content["front"]).replace("%", "%%"),
-                                            "back": str(card_content["back"]).replace("%", "%%")
-                                        })
-                                    break
-                if formatted_cards:
-                    print(f"Converted JSON format to standard format, found {len(formatted_cards)} cards")
-                    return formatted_cards
-            elif isinstance(json_data, dict):
-                # Check for nested flashcards field
-                if "flashcards" in json_data and isinstance(json_data["flashcards"], list):
-                    print(f"Found flashcards field in JSON with {len(json_data['flashcards'])} cards")
-                    cards = []
-                    for card in json_data["flashcards"]:
-                        if isinstance(card, dict):
-                            if "front" in card and "back" in card:
-                                cards.append({
-                                    "front": str(card["front"]).replace("%", "%%"), 
-                                    "back": str(card["back"]).replace("%", "%%")
-                                })
-                            elif "question" in card and "answer" in card:
-                                cards.append({
-                                    "front": str(card["question"]).replace("%", "%%"), 
-                                    "back": str(card["answer"]).replace("%", "%%")
-                                })
-                    if cards:
-                        return cards
-                    # If we couldn't convert, at least ensure the strings are escaped
-                    return [{
-                        "front": str(card.get("front", "")).replace("%", "%%") if isinstance(card, dict) else str(card).replace("%", "%%"), 
-                        "back": str(card.get("back", "")).replace("%", "%%") if isinstance(card, dict) else "No content available"
-                    } for card in json_data["flashcards"]]
-                elif "cards" in json_data and isinstance(json_data["cards"], list):
-                    print(f"Found cards field in JSON with {len(json_data['cards'])} cards")
-                    cards = []
-                    for card in json_data["cards"]:
-                        if isinstance(card, dict):
-                            if "front" in card and "back" in card:
-                                cards.append({
-                                    "front": str(card["front"]).replace("%", "%%"), 
-                                    "back": str(card["back"]).replace("%", "%%")
-                                })
-                            elif "question" in card and "answer" in card:
-                                cards.append({
-                                    "front": str(card["question"]).replace("%", "%%"), 
-                                    "back": str(card["answer"]).replace("%", "%%")
-                                })
-                    if cards:
-                        return cards
-                    # If we couldn't convert, at least ensure the strings are escaped
-                    return [{
-                        "front": str(card.get("front", "")).replace("%", "%%") if isinstance(card, dict) else str(card).replace("%", "%%"), 
-                        "back": str(card.get("back", "")).replace("%", "%%") if isinstance(card, dict) else "No content available"
-                    } for card in json_data["cards"]]
-                # Check direct front/back arrays
-                elif "front" in json_data and "back" in json_data:
-                    fronts = json_data["front"]
-                    backs = json_data["back"]
-                    if isinstance(fronts, list) and isinstance(backs, list) and len(fronts) == len(backs):
-                        cards = []
-                        for i in range(len(fronts)):
-                            cards.append({
-                                "front": str(fronts[i]).replace("%", "%%"), 
-                                "back": str(backs[i]).replace("%", "%%")
-                            })
-                        print(f"Created {len(cards)} cards from front/back arrays")
-                        return cards
         except json.JSONDecodeError:
-            print("JSON parsing failed, trying text patterns")
-            pass
+            logger.debug("JSON parsing failed, trying text patterns")
+            json_data = None
+        
+        if isinstance(json_data, dict):
+            # Direct front/back arrays
+            fronts, backs = json_data.get("front"), json_data.get("back")
+            if isinstance(fronts, list) and isinstance(backs, list) and len(fronts) == len(backs):
+                logger.debug(f"Created {len(fronts)} cards from front/back arrays")
+                return [{"front": str(front), "back": str(back)} for front, back in zip(fronts, backs)]
+            # Cards nested in a flashcards or cards field
+            json_data = json_data.get("flashcards", json_data.get("cards"))
+        if isinstance(json_data, list):
+            cards = [card for card in map(_json_flashcard, json_data) if card]
+            if cards:
+                logger.debug(f"Found {len(cards)} cards in JSON")
+                return cards
             
         # If not valid JSON, try to parse structured text
         flashcards = []
@@ -916,12 +1045,11 @@ def parse_flashcards_from_text(text):
         if matches:
             for q, a in matches:
                 if q.strip() and a.strip():  # Only add if both sides have content
-                    # Escape % characters in both front and back content
                     flashcards.append({
-                        "front": q.strip().replace("%", "%%"), 
-                        "back": a.strip().replace("%", "%%")
+                        "front": q.strip(), 
+                        "back": a.strip()
                     })
-            print(f"Found {len(flashcards)} cards using Q/A pattern")
+            logger.debug(f"Found {len(flashcards)} cards using Q/A pattern")
             if len(flashcards) > 0:
                 return flashcards
         
@@ -931,12 +1059,11 @@ def parse_flashcards_from_text(text):
         if matches:
             for _, front, back in matches:
                 if front.strip() and back.strip():  # Only add if both sides have content
-                    # Escape % characters in both front and back content
                     flashcards.append({
-                        "front": front.strip().replace("%", "%%"), 
-                        "back": back.strip().replace("%", "%%")
+                        "front": front.strip(), 
+                        "back": back.strip()
                     })
-            print(f"Found {len(flashcards)} cards using Card/Front/Back pattern")
+            logger.debug(f"Found {len(flashcards)} cards using Card/Front/Back pattern")
             if len(flashcards) > 0:
                 return flashcards
         
@@ -946,12 +1073,11 @@ def parse_flashcards_from_text(text):
         if matches:
             for front, back in matches:
                 if front.strip() and back.strip():  # Only add if both sides have content
-                    # Escape % characters in both front and back content
                     flashcards.append({
-                        "front": front.strip().replace("%", "%%"), 
-                        "back": back.strip().replace("%", "%%")
+                        "front": front.strip(), 
+                        "back": back.strip()
                     })
-            print(f"Found {len(flashcards)} cards using simple Front/Back pattern")
+            logger.debug(f"Found {len(flashcards)} cards using simple Front/Back pattern")
             if len(flashcards) > 0:
                 return flashcards
             
@@ -961,12 +1087,11 @@ def parse_flashcards_from_text(text):
         if matches:
             for _, front, back in matches:
                 if front.strip() and back.strip():  # Only add if both sides have content
-                    # Escape % characters in both front and back content
                     flashcards.append({
-                        "front": front.strip().replace("%", "%%"), 
-                        "back": back.strip().replace("%", "%%")
+                        "front": front.strip(), 
+                        "back": back.strip()
                     })
-            print(f"Found {len(flashcards)} cards using numbered item pattern")
+            logger.debug(f"Found {len(flashcards)} cards using numbered item pattern")
             if len(flashcards) > 0:
                 return flashcards
             
@@ -976,12 +1101,11 @@ def parse_flashcards_from_text(text):
         if matches:
             for term, definition in matches:
                 if term.strip() and definition.strip() and len(term.strip()) < 150:  # Reasonable term length
-                    # Escape % characters in both front and back content
                     flashcards.append({
-                        "front": term.strip().replace("%", "%%"), 
-                        "back": definition.strip().replace("%", "%%")
+                        "front": term.strip(), 
+                        "back": definition.strip()
                     })
-            print(f"Found {len(flashcards)} cards using term:definition pattern")
+            logger.debug(f"Found {len(flashcards)} cards using term:definition pattern")
             if len(flashcards) > 0:
                 return flashcards
         
@@ -993,14 +1117,13 @@ def parse_flashcards_from_text(text):
                 if len(parts) == 2:
                     front, back = parts
                     if front.strip() and back.strip() and len(front.strip().split()) <= 20:  # Reasonable card front length
-                        # Escape % characters in both front and back content
                         flashcards.append({
-                            "front": front.strip().replace("%", "%%"), 
-                            "back": back.strip().replace("%", "%%")
+                            "front": front.strip(), 
+                            "back": back.strip()
                         })
             
             if flashcards:
-                print(f"Found {len(flashcards)} cards using paragraph pattern")
+                logger.debug(f"Found {len(flashcards)} cards using paragraph pattern")
                 return flashcards
         
         # Try a last resort pattern that looks for any kind of term-definition structure
@@ -1019,19 +1142,18 @@ def parse_flashcards_from_text(text):
                             len(potential_front) < 200 and 
                             potential_front != potential_back and
                             not potential_front.startswith('---')):
-                        # Escape % characters in both front and back content
                         potential_cards.append({
-                            "front": potential_front.replace("%", "%%"),
-                            "back": potential_back.replace("%", "%%")
+                            "front": potential_front,
+                            "back": potential_back
                         })
             
             if potential_cards:
-                print(f"Found {len(potential_cards)} cards using last-resort pattern")
+                logger.debug(f"Found {len(potential_cards)} cards using last-resort pattern")
                 return potential_cards
                 
         # If all else fails, try to extract any content from markdown/bullet points
         if not flashcards:
-            print("Trying markdown/bullet extraction as last resort")
+            logger.debug("Trying markdown/bullet extraction as last resort")
             bullet_points = re.findall(r"(?:^|\n)[\*\-•]\s*(.*?)(?=(?:\n[\*\-•])|$)", text, re.DOTALL)
             if len(bullet_points) >= 2 and len(bullet_points) % 2 == 0:
                 # If we have an even number of bullet points, try to pair them
@@ -1040,28 +1162,27 @@ def parse_flashcards_from_text(text):
                         front = bullet_points[i].strip()
                         back = bullet_points[i+1].strip()
                         if front and back:
-                            # Escape % characters in both front and back content
                             flashcards.append({
-                                "front": front.replace("%", "%%"),
-                                "back": back.replace("%", "%%")
+                                "front": front,
+                                "back": back
                             })
                 
                 if flashcards:
-                    print(f"Created {len(flashcards)} cards from bullet points")
+                    logger.debug(f"Created {len(flashcards)} cards from bullet points")
                     return flashcards
         
         # If we still have no flashcards, return a safe default message
         if not flashcards:
-            print("No flashcards found in the response, returning safe default")
+            logger.debug("No flashcards found in the response, returning safe default")
             return [{
                 "front": "No valid flashcards could be parsed", 
                 "back": "Please try again with a different topic or format."
             }]
                 
-        print("No flashcards found in the response")
+        logger.debug("No flashcards found in the response")
         return []
     except Exception as e:
-        print(f"Error parsing flashcards: {e}")
+        logger.error(f"Error parsing flashcards: {e}")
         import traceback
         traceback.print_exc()
         # Return a safe default in case of error
@@ -1241,6 +1362,265 @@ def calculate_dsa_progress_metrics(user_progress):
         logger.error(f"Error calculating progress metrics: {e}")
         return {}
         
+# Mind map outline lines: markdown header or list marker, and the role labels the mind map prompt asks for
+_OUTLINE_HEADER = re.compile(r"^(#{1,6})\s+")
+_OUTLINE_MARKER = re.compile(r"^(?:[-*+•◦▪]|\d+(?:\.\d+)*[.)]?(?=\s)|[a-zA-Z][.)](?=\s))\s*")
+_OUTLINE_ROLE = re.compile(
+    r"^(?:(?P<central>central\s+(?:concept|topic|idea)(?:\s*/\s*topic)?|main\s+topic|root)"
+    r"|(?P<sub>(?:sub[- ]?)+)branch(?:\s*[\d.]+)?|(?:main\s+)?branch(?:\s*[\d.]+)?)\s*[:\-–—]\s*",
+    re.IGNORECASE
+)
+_OUTLINE_EMPHASIS = re.compile(r"\*\*|__|`")
+_OUTLINE_SKIP = re.compile(r"^(?:```|---+$|===+$|(?:thought|final answer)\s*:)", re.IGNORECASE)
+# Longer unmarked lines are prose around the outline rather than part of it
+_OUTLINE_MAX_PLAIN_LINE = 100
+# Stack marker for the entries nested below one dropped by the depth or node limit
+_DROPPED = -1
+
+def _outline_entry(line: str) -> Optional[Tuple[int, str]]:
+    """Nesting key and label of one outline line, or None if the line isn't part of the outline"""
+    expanded = line.expandtabs(4)
+    text = expanded.strip()
+    if not text or _OUTLINE_SKIP.match(text):
+        return None
+
+    # Headers nest by level and come before any list item, role labels come before both
+    header = _OUTLINE_HEADER.match(text)
+    if header:
+        key = len(header.group(1)) - 100
+        text = text[header.end():]
+    else:
+        marker = _OUTLINE_MARKER.match(text)
+        if marker:
+            text = text[marker.end():]
+        elif len(text) > _OUTLINE_MAX_PLAIN_LINE or text.endswith(":"):
+            return None
+        key = len(expanded) - len(expanded.lstrip())
+
+    text = _OUTLINE_EMPHASIS.sub("", text).strip()
+    role = _OUTLINE_ROLE.match(text)
+    if role:
+        text = text[role.end():].strip()
+        if role.group("central"):
+            key = -1000
+        else:
+            key = -999 + (role.group("sub") or "").lower().count("sub")
+    text = text.strip(" :*_")
+    return (key, text) if text else None
+
+def generate_mind_map_data(
+    text: str,
+    topic: Optional[str] = None,
+    max_depth: int = MINDMAP_MAX_DEPTH,
+    max_nodes: int = MINDMAP_MAX_NODES
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Turn a mind map outline into graph nodes and edges in a single pass over its lines.
+
+    Nesting comes from indentation, markdown header levels and the role
+    labels the mind map prompt asks for ("Central Concept:", "Branch 1:",
+    "Sub-branch 1.1:"). If the outline has no single central concept, the
+    topic becomes the root. A repeated label under the same parent, or a
+    child repeating its parent, is merged into the existing node.
+
+    Args:
+        text: The mind map outline from the visual learning agent
+        topic: Label for the root when the outline has several top-level entries
+        max_depth: Entries nested deeper than this below the root are dropped
+        max_nodes: Maximum number of nodes
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: "nodes" with id, label, group (the branch
+        a node belongs to, 0 for the root) and level (its depth), and "edges"
+        with "from" and "to" node ids
+    """
+    labels: List[str] = []
+    parents: List[Optional[int]] = []
+    depths: List[int] = []
+    # Open ancestors of the next entry as (nesting key, node id; _DROPPED below a dropped entry),
+    # and nodes by (parent, normalized label)
+    stack: List[Tuple[int, int]] = []
+    by_label: Dict[Tuple[Optional[int], str], int] = {}
+
+    for line in text.splitlines():
+        entry = _outline_entry(line)
+        if entry is None:
+            continue
+        key, label = entry
+        while stack and stack[-1][0] >= key:
+            stack.pop()
+        parent = stack[-1][1] if stack else None
+        if parent == _DROPPED:
+            stack.append((key, _DROPPED))
+            continue
+
+        normalized = " ".join(label.lower().split())
+        depth = 0 if parent is None else depths[parent] + 1
+        if parent is not None and normalized == " ".join(labels[parent].lower().split()):
+            node = parent
+        elif (parent, normalized) in by_label:
+            node = by_label[(parent, normalized)]
+        elif depth > max_depth or len(labels) >= max_nodes:
+            node = _DROPPED
+        else:
+            node = len(labels)
+            labels.append(label)
+            parents.append(parent)
+            depths.append(depth)
+            by_label[(parent, normalized)] = node
+        stack.append((key, node))
+
+    roots = [node for node, parent in enumerate(parents) if parent is None]
+    if len(roots) != 1:
+        # Several top-level entries (or none): hang them under the topic
+        root = len(labels)
+        labels.append(topic or "Mind Map")
+        parents.append(None)
+        for node in roots:
+            parents[node] = root
+    else:
+        root = roots[0]
+
+    # Parents are always created before their children, except the added root; adding
+    # a root moves everything one level down, so the depth limit is applied again
+    levels: Dict[int, int] = {root: 0}
+    groups: Dict[int, int] = {root: 0}
+    nodes, edges = [], []
+    branch_count = 0
+    for node in [root] + [node for node in range(len(labels)) if node != root]:
+        parent = parents[node]
+        if node != root:
+            if parent not in levels or levels[parent] >= max_depth:
+                continue
+            levels[node] = levels[parent] + 1
+            if parent == root:
+                branch_count += 1
+                groups[node] = branch_count
+            else:
+                groups[node] = groups[parent]
+            edges.append({"from": parent + 1, "to": node + 1})
+        nodes.append({"id": node + 1, "label": labels[node], "group": groups[node], "level": levels[node]})
+
+    return {"nodes": nodes, "edges": edges}
+
+# Mind map layout spacing, in the frontend's pixels: distance between levels, and minimum
+# distance between neighbouring leaves (the radial layout widens its rings to keep it)
+_MINDMAP_LEVEL_SPACING = 120.0
+_MINDMAP_LEAF_SPACING = 70.0
+MINDMAP_LAYOUTS = ("radial", "tree")
+
+def layout_mind_map(
+    nodes: List[Dict[str, Any]],
+    edges: List[Dict[str, Any]],
+    layout: str = MINDMAP_LAYOUT
+) -> Dict[int, Tuple[float, float]]:
+    """
+    Compute node positions for a mind map, so the frontend doesn't have to simulate them.
+
+    The map is laid out as a tree from its root (the level 0 node). Each
+    subtree gets room in proportion to its number of leaves: a wedge around
+    the root in the "radial" layout, a horizontal band in the "tree" layout,
+    where levels go from top to bottom. The drawing is centered on (0, 0).
+
+    Args:
+        nodes: Nodes as returned by generate_mind_map_data
+        edges: Edges with "from" and "to" node ids
+        layout: "radial" or "tree"; anything else gives no positions
+
+    Returns:
+        Dict[int, Tuple[float, float]]: Position of each node reachable from the root, by node id
+    """
+    if layout not in MINDMAP_LAYOUTS or not nodes:
+        return {}
+
+    graph = nx.DiGraph()
+    graph.add_nodes_from(node["id"] for node in nodes)
+    graph.add_edges_from((edge["from"], edge["to"]) for edge in edges)
+    root = next((node["id"] for node in nodes if node.get("level") == 0), nodes[0]["id"])
+    tree = nx.bfs_tree(graph, root)
+
+    # Leaves below each node, children before parents
+    leaves: Dict[int, int] = {}
+    for node in nx.dfs_postorder_nodes(tree, root):
+        leaves[node] = sum(leaves[child] for child in tree.successors(node)) or 1
+    depth = nx.shortest_path_length(tree, root)
+    max_depth = max(depth.values())
+
+    # Where each subtree's share of the leaves starts, in leaf units, in outline order
+    start = {root: 0.0}
+    for node in nx.dfs_preorder_nodes(tree, root):
+        offset = start[node]
+        for child in tree.successors(node):
+            start[child] = offset
+            offset += leaves[child]
+
+    total = leaves[root]
+    positions = {}
+    if layout == "radial":
+        # Widen the rings if the outermost one can't fit every leaf
+        spacing = _MINDMAP_LEVEL_SPACING
+        if max_depth:
+            spacing = max(spacing, total * _MINDMAP_LEAF_SPACING / (2 * math.pi * max_depth))
+        for node in tree:
+            angle = 2 * math.pi * (start[node] + leaves[node] / 2) / total
+            radius = depth[node] * spacing
+            positions[node] = (round(radius * math.cos(angle), 1), round(radius * math.sin(angle), 1))
+    else:
+        for node in tree:
+            x = (start[node] + leaves[node] / 2 - total / 2) * _MINDMAP_LEAF_SPACING
+            y = (depth[node] - max_depth / 2) * _MINDMAP_LEVEL_SPACING
+            positions[node] = (round(x, 1), round(y, 1))
+    return positions
+
+# Section headers of the code analysis answer (see agents.create_dsa_code_analysis_task)
+_ANALYSIS_HEADERS = r"(bugs|optimizations|improved_code|time_complexity|space_complexity|explanation)(:?)"
+_ANALYSIS_HEADER = re.compile(_ANALYSIS_HEADERS)
+_ANALYSIS_HEADER_ANY_CASE = re.compile(_ANALYSIS_HEADERS, re.IGNORECASE)
+_ANALYSIS_LIST_ITEM = re.compile(r"(?:^|\n)(?:\d+\.|\*|-)\s*(.*?)(?=(?:\n(?:\d+\.|\*|-)|$))", re.DOTALL)
+_CODE_FENCE_OPEN = re.compile(r"^```\w*\n")
+_CODE_FENCE_CLOSE = re.compile(r"\n```$")
+_CODE_BLOCK = re.compile(r"```(?:\w*\n)?(.*?)```", re.DOTALL)
+_ISSUE_WORDS = re.compile(r"issue|bug|problem|incorrect|wrong|error|fail", re.IGNORECASE)
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+def split_analysis_sections(text: str) -> Dict[str, str]:
+    """
+    Split code analysis output into its sections in a single scan for the headers.
+
+    A section starts at the first mention of its header and runs until the
+    next header of another section that is followed by a colon, or to the
+    end of the text.
+
+    Args:
+        text: Raw text output from the debugging agent
+
+    Returns:
+        Dict[str, str]: Text of each section found, keyed by lowercase header name
+    """
+    # Lowercasing ASCII text keeps every offset, and a case-sensitive scan is several times faster
+    if text.isascii():
+        matches = _ANALYSIS_HEADER.finditer(text.lower())
+    else:
+        matches = _ANALYSIS_HEADER_ANY_CASE.finditer(text)
+    headers = [(match.group(1).lower(), match.start(), match.end(), bool(match.group(2))) for match in matches]
+    sections = {}
+    for i, (name, _, content_start, _) in enumerate(headers):
+        if name in sections:
+            continue
+        content_end = next(
+            (start for other, start, _, colon in headers[i + 1:] if colon and other != name),
+            len(text)
+        )
+        sections[name] = text[content_start:content_end].strip()
+    return sections
+
+def _analysis_items(section: str) -> List[str]:
+    # Bullet points or numbered items, else one item per line
+    items = _ANALYSIS_LIST_ITEM.findall(section)
+    if items:
+        return [item.strip() for item in items if item.strip()]
+    return [line.strip() for line in section.split("\n") if line.strip()]
+
 def parse_code_analysis(text):
     """
     Parse code analysis output from debugging agent into a structured format
@@ -1262,75 +1642,36 @@ def parse_code_analysis(text):
             "explanation": ""
         }
         
-        # Extract bugs section
-        bugs_pattern = re.compile(r"BUGS:?\s*(.*?)(?=OPTIMIZATIONS:|TIME_COMPLEXITY:|IMPROVED_CODE:|SPACE_COMPLEXITY:|EXPLANATION:|$)", re.DOTALL | re.IGNORECASE)
-        bugs_match = bugs_pattern.search(text)
-        if bugs_match:
-            bugs_text = bugs_match.group(1).strip()
-            # Extract individual bugs (bullet points or numbered)
-            bug_items = re.findall(r"(?:^|\n)(?:\d+\.|\*|-)\s*(.*?)(?=(?:\n(?:\d+\.|\*|-)|$))", bugs_text, re.DOTALL)
-            if bug_items:
-                analysis["bugs"] = [bug.strip() for bug in bug_items if bug.strip()]
-            else:
-                # If no bullet points found, split by newlines
-                analysis["bugs"] = [line.strip() for line in bugs_text.split("\n") if line.strip()]
-        
-        # Extract optimizations section
-        opt_pattern = re.compile(r"OPTIMIZATIONS:?\s*(.*?)(?=BUGS:|TIME_COMPLEXITY:|IMPROVED_CODE:|SPACE_COMPLEXITY:|EXPLANATION:|$)", re.DOTALL | re.IGNORECASE)
-        opt_match = opt_pattern.search(text)
-        if opt_match:
-            opt_text = opt_match.group(1).strip()
-            # Extract individual optimizations
-            opt_items = re.findall(r"(?:^|\n)(?:\d+\.|\*|-)\s*(.*?)(?=(?:\n(?:\d+\.|\*|-)|$))", opt_text, re.DOTALL)
-            if opt_items:
-                analysis["optimizations"] = [opt.strip() for opt in opt_items if opt.strip()]
-            else:
-                # If no bullet points found, split by newlines
-                analysis["optimizations"] = [line.strip() for line in opt_text.split("\n") if line.strip()]
-        
-        # Extract time complexity
-        time_pattern = re.compile(r"TIME_COMPLEXITY:?\s*(.*?)(?=BUGS:|OPTIMIZATIONS:|IMPROVED_CODE:|SPACE_COMPLEXITY:|EXPLANATION:|$)", re.DOTALL | re.IGNORECASE)
-        time_match = time_pattern.search(text)
-        if time_match:
-            analysis["time_complexity"] = time_match.group(1).strip()
-        
-        # Extract space complexity
-        space_pattern = re.compile(r"SPACE_COMPLEXITY:?\s*(.*?)(?=BUGS:|OPTIMIZATIONS:|TIME_COMPLEXITY:|IMPROVED_CODE:|EXPLANATION:|$)", re.DOTALL | re.IGNORECASE)
-        space_match = space_pattern.search(text)
-        if space_match:
-            analysis["space_complexity"] = space_match.group(1).strip()
-        
-        # Extract improved code section
-        code_pattern = re.compile(r"IMPROVED_CODE:?\s*(.*?)(?=BUGS:|OPTIMIZATIONS:|TIME_COMPLEXITY:|SPACE_COMPLEXITY:|EXPLANATION:|$)", re.DOTALL | re.IGNORECASE)
-        code_match = code_pattern.search(text)
-        if code_match:
-            code_text = code_match.group(1).strip()
+        sections = split_analysis_sections(text)
+        
+        if "bugs" in sections:
+            analysis["bugs"] = _analysis_items(sections["bugs"])
+        if "optimizations" in sections:
+            analysis["optimizations"] = _analysis_items(sections["optimizations"])
+        
+        analysis["time_complexity"] = sections.get("time_complexity", "")
+        analysis["space_complexity"] = sections.get("space_complexity", "")
+        analysis["explanation"] = sections.get("explanation", "")
+        
+        if "improved_code" in sections:
             # Remove code block markers if present
-            code_text = re.sub(r"^```\w*\n", "", code_text)
-            code_text = re.sub(r"\n```$", "", code_text)
+            code_text = _CODE_FENCE_OPEN.sub("", sections["improved_code"])
+            code_text = _CODE_FENCE_CLOSE.sub("", code_text)
             analysis["improved_code"] = code_text.strip()
         
-        # Extract explanation
-        explanation_pattern = re.compile(r"EXPLANATION:?\s*(.*?)(?=BUGS:|OPTIMIZATIONS:|TIME_COMPLEXITY:|SPACE_COMPLEXITY:|IMPROVED_CODE:|$)", re.DOTALL | re.IGNORECASE)
-        explanation_match = explanation_pattern.search(text)
-        if explanation_match:
-            analysis["explanation"] = explanation_match.group(1).strip()
-        
         # If we couldn't extract any bugs but the analysis mentions issues, try to extract them from the explanation
         if not analysis["bugs"] and analysis["explanation"]:
             # Look for mention of issues in the explanation
-            if re.search(r'issue|bug|problem|incorrect|wrong|error|fail', analysis["explanation"], re.IGNORECASE):
-                # Split explanation into sentences
-                sentences = re.split(r'(?<=[.!?])\s+', analysis["explanation"])
-                # Filter sentences that seem to describe issues
-                for sentence in sentences:
-                    if re.search(r'issue|bug|problem|incorrect|wrong|error|fail', sentence, re.IGNORECASE):
+            if _ISSUE_WORDS.search(analysis["explanation"]):
+                # Keep the sentences that seem to describe issues
+                for sentence in _SENTENCE_BREAK.split(analysis["explanation"]):
+                    if _ISSUE_WORDS.search(sentence):
                         analysis["bugs"].append(sentence.strip())
         
         # If we couldn't find any improved code using structured parsing, try a more general approach
         if not analysis["improved_code"]:
             # Look for code blocks
-            code_blocks = re.findall(r"```(?:\w*\n)?(.*?)```", text, re.DOTALL)
+            code_blocks = _CODE_BLOCK.findall(text)
             if code_blocks:
                 # Use the largest code block found
                 analysis["improved_code"] = max(code_blocks, key=len).strip()
@@ -1489,7 +1830,13 @@ def extract_chapter_directly(doc_info: dict, chapter_number: int) -> str:
         logger.error(f"Error extracting chapter: {str(e)}", exc_info=True)
         return ""
 
-def get_chapter_specific_context(query: str, doc_id: str, chapter_number: int = None, top_k: int = 5) -> str:
+def get_chapter_specific_context(
+    query: str,
+    doc_id: str,
+    chapter_number: int = None,
+    top_k: int = 5,
+    task: Optional[str] = None
+) -> str:
     """
     Get context specifically about a particular chapter from a document.
     This function is optimized for chapter-focused queries.
@@ -1499,6 +1846,7 @@ def get_chapter_specific_context(query: str, doc_id: str, chapter_number: int =
         doc_id: Document ID
         chapter_number: Target chapter number (extracted from query if None)
         top_k: Number of chunks to retrieve
+        task: Task type whose token budget the context must fit (unbounded if None)
         
     Returns:
         str: Context relevant to the specified chapter
@@ -1513,7 +1861,13 @@ def get_chapter_specific_context(query: str, doc_id: str, chapter_number: int =
         if chapter_number is None:
             # Fall back to standard context retrieval if no chapter specified
             logger.info("No chapter number specified, falling back to standard context retrieval")
-            return get_document_context(query, doc_id, top_k)
+            return get_document_context(query, doc_id, top_k, task=task)
+        
+        cache_key = retrieval_cache.make_key(doc_id, query, top_k, "chapter", chapter_number, task)
+        cached_context = retrieval_cache.get_context(cache_key)
+        if cached_context is not None:
+            logger.info(f"Using cached context for Chapter {chapter_number}")
+            return cached_context
             
         # Get document info
         doc_info = get_document_by_id(doc_id)
@@ -1529,6 +1883,9 @@ def get_chapter_specific_context(query: str, doc_id: str, chapter_number: int =
         if chapter_content and len(chapter_content.strip()) > 200:
             # If direct extraction found substantial content, use it
             logger.info(f"Successfully extracted Chapter {chapter_number} directly, content length: {len(chapter_content)}")
+            if task is not None:
+                chapter_content = fit_text_to_budget(chapter_content, query, task=task)
+            retrieval_cache.set_context(cache_key, chapter_content)
             return chapter_content
         else:
             logger.info(f"Direct extraction failed or returned insufficient content ({len(chapter_content) if chapter_content else 0} chars)")
@@ -1537,10 +1894,10 @@ def get_chapter_specific_context(query: str, doc_id: str, chapter_number: int =
         # Load or create vector store
         vector_store = load_vector_store(doc_id)
                 
-        # First try a chapter-specific query
+        # Search for the chapter-specific query and the original query in one batch
         chapter_query = f"chapter {chapter_number}"
-        logger.info(f"Performing vector search for '{chapter_query}'")
-        docs = vector_store.similarity_search(chapter_query, k=top_k)
+        logger.info(f"Performing batched vector search for '{chapter_query}' and the original query")
+        docs, original_docs = similarity_search_batch(vector_store, [chapter_query, query], k=top_k)
         
         # Filter for chunks actually containing the chapter
         chapter_pattern = re.compile(f"chapter\\s*{chapter_number}\\b", re.IGNORECASE)
@@ -1548,13 +1905,12 @@ def get_chapter_specific_context(query: str, doc_id: str, chapter_number: int =
         logger.info(f"Found {len(chapter_docs)} chunks specifically mentioning Chapter {chapter_number}")
         
         if not chapter_docs:
-            # If no exact chapter matches, add the original query results
-            logger.info(f"No chapter-specific chunks found, trying with original query: {query}")
-            original_docs = vector_store.similarity_search(query, k=top_k)
+            # If no exact chapter matches, use the original query results
+            logger.info(f"No chapter-specific chunks found, using results for original query: {query}")
             docs = original_docs
         else:
             # If we have chapter matches, use those and try to add the original query results
-            additional_docs = vector_store.similarity_search(query, k=top_k)
+            additional_docs = original_docs
             logger.info(f"Adding query-specific results to chapter-specific chunks")
             # Combine without duplicates
             seen_content = set(doc.page_content for doc in chapter_docs)
@@ -1590,6 +1946,9 @@ def get_chapter_specific_context(query: str, doc_id: str, chapter_number: int =
                     logger.info(f"Manual page search found content of length: {len(cleaned_context)}")
             
             if len(cleaned_context) > 100:
+                if task is not None:
+                    cleaned_context = fit_text_to_budget(cleaned_context, query, task=task)
+                retrieval_cache.set_context(cache_key, cleaned_context)
                 return cleaned_context
         
         # If we still don't have good content, return a helpful message
@@ -172,17 +172,13 @@ export default function Flashcards() {
           } 
           // If card is already an object
           else if (typeof card === 'object' && card !== null) {
-            // Safety check for format strings (e.g., %s) to prevent errors
-            let frontContent = card.front || card.question || card.term || "Question not available";
-            let backContent = card.back || card.answer || card.definition || "Answer not available";
+            const frontContent = card.front || card.question || card.term || "Question not available";
+            const backContent = card.back || card.answer || card.definition || "Answer not available";
             
             // Make sure we handle both string and non-string cases
-            frontContent = String(frontContent).replace(/%/g, '%%');
-            backContent = String(backContent).replace(/%/g, '%%');
-            
             return {
-              front: frontContent,
-              back: backContent
+              front: String(frontContent),
+              back: String(backContent)
             };
           }
           // Fallback for any other unexpected format
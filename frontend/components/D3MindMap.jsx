@@ -17,26 +17,34 @@ const D3MindMap = ({ nodes, edges }) => {
     // Ensure we have valid data
     if (!nodes || !edges) return { nodes: [], links: [] };
     
+    // The API sends edges as {from, to}
+    const graphEdges = Array.isArray(edges)
+      ? edges.map(edge => ({ ...edge, source: edge.source ?? edge.from, target: edge.target ?? edge.to }))
+      : edges;
+    
     let processedNodes = [];
     let processedLinks = [];
     
     // Process nodes
     if (Array.isArray(nodes)) {
       // Identify the root node (usually has level 0 or the lowest level)
-      const rootNodeId = findRootNode(nodes, edges);
+      const rootNodeId = findRootNode(nodes, graphEdges);
       
       processedNodes = nodes.map(node => ({
         id: node.id.toString(),
         label: node.label || node.text || node.id.toString(),
         group: determineNodeGroup(node, rootNodeId),
-        level: determineNodeLevel(node, rootNodeId, edges),
-        isRoot: node.id.toString() === rootNodeId.toString()
+        level: determineNodeLevel(node, rootNodeId, graphEdges),
+        isRoot: node.id.toString() === rootNodeId.toString(),
+        // Position from the server-side layout, relative to the center of the drawing
+        layoutX: node.x,
+        layoutY: node.y
       }));
     }
     
     // Process edges
-    if (Array.isArray(edges)) {
-      processedLinks = edges.map(edge => ({
+    if (Array.isArray(graphEdges)) {
+      processedLinks = graphEdges.map(edge => ({
         source: edge.source.toString(),
         target: edge.target.toString(),
         value: edge.value || 1
@@ -199,29 +207,45 @@ const D3MindMap = ({ nodes, edges }) => {
     const g = svg.append("g")
       .attr("class", "everything");
     
+    // Maps laid out by the server are drawn at their positions, without running the forces
+    const hasLayout = data.nodes.every(d => d.layoutX != null && d.layoutY != null);
+    const placeNodes = (centerX, centerY) => {
+      data.nodes.forEach(d => {
+        d.x = d.fx = centerX + d.layoutX;
+        d.y = d.fy = centerY + d.layoutY;
+      });
+    };
+    
     // Create a hierarchical force simulation
     const simulation = d3.forceSimulation(data.nodes)
       .force("link", d3.forceLink(data.links)
         .id(d => d.id)
         .distance(d => 80 + d.source.level * 20) // Longer distances for higher levels
-        .strength(0.7))
-      .force("charge", d3.forceManyBody()
-        .strength(d => d.isRoot ? -1000 : -300) // Stronger repulsion for root
-        .distanceMin(10)
-        .distanceMax(300))
-      .force("center", d3.forceCenter(width / 2, height / 2))
-      .force("collide", d3.forceCollide()
-        .radius(d => d.isRoot ? 50 : 35)
-        .strength(0.7))
-      .force("x", d3.forceX(width / 2).strength(0.05))
-      .force("y", d3.forceY(height / 2).strength(0.05));
-    
-    // Add force to push nodes of similar levels into rings around the root
-    simulation.force("radial", d3.forceRadial(
-      d => d.level * 120, // Distance from center based on level
-      width / 2, 
-      height / 2
-    ).strength(0.3));
+        .strength(0.7));
+    
+    if (hasLayout) {
+      simulation.stop();
+      placeNodes(width / 2, height / 2);
+    } else {
+      simulation
+        .force("charge", d3.forceManyBody()
+          .strength(d => d.isRoot ? -1000 : -300) // Stronger repulsion for root
+          .distanceMin(10)
+          .distanceMax(300))
+        .force("center", d3.forceCenter(width / 2, height / 2))
+        .force("collide", d3.forceCollide()
+          .radius(d => d.isRoot ? 50 : 35)
+          .strength(0.7))
+        .force("x", d3.forceX(width / 2).strength(0.05))
+        .force("y", d3.forceY(height / 2).strength(0.05));
+      
+      // Add force to push nodes of similar levels into rings around the root
+      simulation.force("radial", d3.forceRadial(
+        d => d.level * 120, // Distance from center based on level
+        width / 2, 
+        height / 2
+      ).strength(0.3));
+    }
     
     // Define a color scale for node groups with better contrast
     const colorScheme = d3.schemeCategory10.concat(d3.schemeSet2);
@@ -380,7 +404,7 @@ const D3MindMap = ({ nodes, edges }) => {
     
     // Define drag behavior functions
     function dragstarted(event, d) {
-      if (!event.active) simulation.alphaTarget(0.3).restart();
+      if (!event.active && !hasLayout) simulation.alphaTarget(0.3).restart();
       d.fx = d.x;
       d.fy = d.y;
       setIsDragging(true);
@@ -389,12 +413,17 @@ const D3MindMap = ({ nodes, edges }) => {
     function dragged(event, d) {
       d.fx = event.x;
       d.fy = event.y;
+      if (hasLayout) {
+        d.x = d.fx;
+        d.y = d.fy;
+        ticked();
+      }
     }
     
     function dragended(event, d) {
-      if (!event.active) simulation.alphaTarget(0);
-      // Keep root node fixed after dragging
-      if (!d.isRoot) {
+      if (!event.active && !hasLayout) simulation.alphaTarget(0);
+      // Keep root node (and every node of a precomputed layout) fixed after dragging
+      if (!d.isRoot && !hasLayout) {
         d.fx = null;
         d.fy = null;
       }
@@ -499,7 +528,7 @@ const D3MindMap = ({ nodes, edges }) => {
     }
     
     // Update positions on each tick with curved edges
-    simulation.on("tick", () => {
+    function ticked() {
       // Draw curved links
       link.attr("d", d => {
         const dx = d.target.x - d.source.x;
@@ -522,11 +551,14 @@ const D3MindMap = ({ nodes, edges }) => {
           .attr("x2", d.target.x)
           .attr("y2", d.target.y);
       });
-    });
+    }
+    
+    simulation.on("tick", ticked);
+    if (hasLayout) ticked();
     
     // Optional: Fix root node in center initially
     const rootNode = data.nodes.find(n => n.isRoot);
-    if (rootNode) {
+    if (rootNode && !hasLayout) {
       rootNode.fx = width / 2;
       rootNode.fy = height / 2;
       
@@ -552,6 +584,14 @@ const D3MindMap = ({ nodes, edges }) => {
           .attr("width", newWidth)
           .attr("height", newHeight);
         
+        if (hasLayout) {
+          placeNodes(newWidth / 2, newHeight / 2);
+          ticked();
+          setWidth(newWidth);
+          setHeight(newHeight);
+          return;
+        }
+        
         // Update force center
         simulation.force("center", d3.forceCenter(newWidth / 2, newHeight / 2));
         simulation.force("x", d3.forceX(newWidth / 2).strength(0.05));
@@ -385,15 +385,13 @@ const flashcardsApi = {
             }
           }
           
-          // Handle potential string formatting issues in card content
           if (card && typeof card === 'object') {
             const front = card.front || card.question || card.term || "";
             const back = card.back || card.answer || card.definition || "";
             
-            // Sanitize any potential format specifiers
             return {
-              front: String(front).replace(/%/g, '%%'),
-              back: String(back).replace(/%/g, '%%')
+              front: String(front),
+              back: String(back)
             };
           }
           